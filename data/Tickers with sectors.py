@@ -1,5 +1,6 @@
 import os
 import sys
+import argparse
 import pandas as pd
 import yfinance as yf
 import numpy as np
@@ -11,9 +12,35 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
 
 from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import Checkpoint, NegativeCache, add_scan_args, configure, download, retry_call
+from report_writer import write_report
+from memory_guard import MemoryGuard, categorize
+from security_master import SecurityMaster
+from sharding import Shard
+from comovement import PERIOD, MIN_CLUSTER_CORR, comovement, price_panel
+import snapshot
 
 print("✅ Funzione get_all_tickers importata correttamente.")
 
+parser = argparse.ArgumentParser(description="Tickers with sectors")
+parser.add_argument("--no_comovement", action="store_true",
+                    help="Salta correlazioni, cluster e forza relativa di settore")
+parser.add_argument("--comovement_period", type=str, default=PERIOD,
+                    help="Storico giornaliero per correlazioni e cluster (es. 3y)")
+parser.add_argument("--min_cluster_corr", type=float, default=MIN_CLUSTER_CORR,
+                    help="Correlazione media minima tra due gruppi per unirli nello stesso cluster")
+add_profile_args(parser)
+add_scan_args(parser)
+args = parser.parse_args()
+configure(args)
+neg_cache = NegativeCache.from_args(args)
+
+metrics = RunMetrics("tickers_info")
+start_from_args(args, "tickers_info")
+guard = MemoryGuard.from_args(args, metrics)
+
 # =========================
 # FIX UNIVERSALE YFINANCE (MultiIndex / Series)
 # =========================
@@ -103,24 +130,28 @@ def get_poc_from_df(df, bins=200):
 
 def get_poc_hourly_240(ticker):
     try:
-        df = yf.download(
-            ticker,
-            period="60d",
-            interval="1h",
-            progress=False,
-            auto_adjust=False
-        )
+        with metrics.timed("download"):
+            df = download(
+                ticker,
+                metrics=metrics,
+                period="60d",
+                interval="1h",
+                auto_adjust=False
+            )
 
         df = normalize_yf_df(df)  # ✅ FIX
 
         if df.empty:
+            metrics.fail("poc_no_data")
             return None
 
         df = df.tail(240)
-        return get_poc_from_df(df)
+        with metrics.timed("compute"):
+            return get_poc_from_df(df)
 
     except Exception as e:
         print(f"⚠ POC error {ticker}: {e}")
+        metrics.fail_exc(e)
         return None
 
 
@@ -128,7 +159,8 @@ def get_poc_hourly_240(ticker):
 # Costruzione mappa ticker → indici
 # =========================
 
-ticker_dict = get_all_tickers(flat=False)
+with metrics.stage("universe"):
+    ticker_dict = get_all_tickers(flat=False)
 
 ticker_to_index = {}
 
@@ -139,63 +171,125 @@ for index_name, tickers in ticker_dict.items():
         else:
             ticker_to_index[ticker] = {index_name}
 
-all_tickers = sorted(ticker_to_index.keys())
+# Borsa e valuta dal security master (aggiornato da get_all_tickers)
+security_master = SecurityMaster()
+
+all_tickers = limit_tickers(sorted(ticker_to_index.keys()), args)
+metrics.tickers_total = len(all_tickers)
 print(f"🔍 Trovati {len(all_tickers)} ticker unici")
 
 # =========================
 # Recupero dati
 # =========================
 
-rows = []
-
-for ticker in all_tickers:
+def empty_row(ticker):
+    known = security_master.info(ticker) or {}
+    return {
+        "ticker": ticker,
+        "name": "",
+        "sector": "",
+        "index": ", ".join(sorted(ticker_to_index[ticker])),
+        "exchange": known.get("exchange"),
+        "currency": known.get("currency"),
+        "market_cap_B": None,
+        "price": None,
+        "poc_h_240": None
+    }
+
+
+def analyze_ticker(ticker):
+    t = yf.Ticker(ticker)
+    with metrics.timed("download_info"):
+        info = snapshot.recorded("info", {"ticker": ticker},
+                                 lambda: retry_call(lambda: t.info, label=ticker, metrics=metrics)) or {}
+
+    name = info.get("longName") or info.get("shortName") or ""
+    sector = info.get("sector") or ""
+    known = security_master.info(ticker) or {}
+    currency = info.get("currency") or known.get("currency")
+
+    market_cap = info.get("marketCap")
+    market_cap_b = round(market_cap / 1_000_000_000, 3) if market_cap else None
+
+    # ✅ PREZZO ATTUALE
+    price = info.get("currentPrice")
+    if price is None:
+        with metrics.timed("download"):
+            df_last = download(ticker, metrics=metrics, period="1d")
+        df_last = normalize_yf_df(df_last)  # ✅ FIX
+
+        if not df_last.empty and "Close" in df_last.columns:
+            price = float(df_last["Close"].iloc[-1])
+
+    # ✅ POC ORARIO
+    poc_h_240 = get_poc_hourly_240(ticker)
+
+    # Nessun dato da nessuna fonte: candidato alla negative cache
+    if not info and price is None and poc_h_240 is None:
+        neg_cache.record_failure(ticker, "no_data")
+    else:
+        neg_cache.record_success(ticker)
+
+    index_str = ", ".join(sorted(ticker_to_index[ticker]))
+
+    print(f"✅ {ticker} → price={price}, poc_h_240={poc_h_240}")
+
+    return [{
+        "ticker": ticker,
+        "name": name,
+        "sector": sector,
+        "index": index_str,
+        "exchange": known.get("exchange"),
+        "currency": currency,
+        "market_cap_B": market_cap_b,
+        "price": price,
+        "poc_h_240": poc_h_240
+    }]
+
+
+# Checkpoint giornaliero: un run interrotto riprende dai ticker mancanti
+run_name = f"tickers_info_{snapshot.run_tag()}"
+shard = Shard.from_args(args, run_name, snapshot.run_week(), metrics)
+scan_tickers = shard.select(all_tickers)
+if shard.partial:
+    metrics.tickers_total = len(scan_tickers)
+checkpoint = Checkpoint(shard.scoped(run_name), resume=not args.no_resume)
+metrics.start("scan")
+
+for ticker in scan_tickers:
+    metrics.ticker_done()
+    guard.tick()
+    if ticker in checkpoint:
+        continue
+    if neg_cache.should_skip(ticker):
+        metrics.fail("negative_cache_skip")
+        checkpoint.save(ticker, [empty_row(ticker)])
+        continue
     try:
-        t = yf.Ticker(ticker)
-        info = t.info
-
-        name = info.get("longName") or info.get("shortName") or ""
-        sector = info.get("sector") or ""
-
-        market_cap = info.get("marketCap")
-        market_cap_b = round(market_cap / 1_000_000_000, 3) if market_cap else None
-
-        # ✅ PREZZO ATTUALE
-        price = info.get("currentPrice")
-        if price is None:
-            df_last = yf.download(ticker, period="1d", progress=False)
-            df_last = normalize_yf_df(df_last)  # ✅ FIX
-
-            if not df_last.empty and "Close" in df_last.columns:
-                price = float(df_last["Close"].iloc[-1])
-
-        # ✅ POC ORARIO
-        poc_h_240 = get_poc_hourly_240(ticker)
-
-        index_str = ", ".join(sorted(ticker_to_index[ticker]))
-
-        rows.append({
-            "ticker": ticker,
-            "name": name,
-            "sector": sector,
-            "index": index_str,
-            "market_cap_B": market_cap_b,
-            "price": price,
-            "poc_h_240": poc_h_240
-        })
-
-        print(f"✅ {ticker} → price={price}, poc_h_240={poc_h_240}")
-
+        checkpoint.save(ticker, analyze_ticker(ticker))
     except Exception as e:
         print(f"❌ Errore su {ticker}: {e}")
-        rows.append({
-            "ticker": ticker,
-            "name": "",
-            "sector": "",
-            "index": ", ".join(sorted(ticker_to_index[ticker])),
-            "market_cap_B": None,
-            "price": None,
-            "poc_h_240": None
-        })
+        metrics.fail_exc(e)
+        checkpoint.save(ticker, [empty_row(ticker)])
+
+rows = shard.finish(checkpoint.done, all_tickers)
+metrics.stop("scan")
+guard.check()
+
+if rows is None:
+    # Shard parziale: security master ed Excel li aggiorna il merge, che
+    # legge dalla cache le barre del co-movimento scaricate qui
+    if not args.no_comovement:
+        with metrics.stage("comovement_bars"):
+            price_panel(scan_tickers, args.comovement_period, metrics, guard)
+    checkpoint.clear()
+    metrics.write()
+    sys.exit(0)
+
+# La valuta del provider sostituisce quella dedotta dal suffisso
+for row in rows:
+    security_master.update(row["ticker"], currency=row.get("currency"))
+security_master.save()
 
 # =========================
 # Salvataggio Excel
@@ -203,13 +297,41 @@ for ticker in all_tickers:
 
 df = pd.DataFrame(
     rows,
-    columns=["ticker", "name", "sector", "index", "market_cap_B", "price", "poc_h_240"]
+    columns=["ticker", "name", "sector", "index", "exchange", "currency", "market_cap_B", "price", "poc_h_240"]
 )
 
+# =========================
+# Co-movimento: cluster e forza relativa di settore
+# =========================
+sheets = {}
+formats = {"Tickers": {"market_cap_B": "0.00", "price": "0.00", "poc_h_240": "0.00", "corr_sector": "0.000"}}
+if not args.no_comovement:
+    with metrics.stage("comovement"):
+        per_ticker, df_sector_corr, df_clusters = comovement(
+            list(df["ticker"]), dict(zip(df["ticker"], df["sector"])),
+            args.comovement_period, args.min_cluster_corr, metrics, guard,
+            offline=bool(shard.merge)   # il merge non scarica: barre già in cache dagli shard
+        )
+    if not per_ticker.empty:
+        df = df.merge(per_ticker, on="ticker", how="left")
+        sheets = {"Correlazione Settori": df_sector_corr, "Cluster": df_clusters}
+        formats["Correlazione Settori"] = {c: "0.00" for c in df_sector_corr.columns}
+        print(f"🧩 {df_clusters.shape[0]} cluster su {len(per_ticker)} ticker con storico sufficiente")
+    else:
+        print("⚠ Nessuna barra giornaliera: co-movimento saltato")
+
+df = categorize(df, ("ticker", "sector", "index", "exchange", "currency"))
+
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 output_file = os.path.join(OUTPUT_DIR, "tickers_info.xlsx")
-df.to_excel(output_file, index=False)
+with metrics.stage("excel"):
+    write_report(output_file, {"Tickers": df, **sheets}, formats)
 
 print(f"\n📊 File creato: {output_file}")
+
+checkpoint.clear()
+shard.cleanup()
+
+metrics.write()
@@ -0,0 +1,367 @@
+import hashlib
+import os
+import pickle
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from scan_state import CACHE_DIR, download
+from security_master import canonical_symbol
+import snapshot
+
+# =========================
+# CACHE BARRE OHLCV
+# =========================
+# Una voce per (ticker, interval, auto_adjust) in data/cache/bars, con lo
+# storico più lungo mai scaricato: una richiesta con periodo più corto viene
+# servita tagliando la cache, senza nuovi download. Una voce scaduta si
+# aggiorna scaricando solo la coda (vedi append_tail), non tutto lo storico.
+BARS_DIR = os.path.join(CACHE_DIR, "bars")
+MAX_AGE_HOURS = 12
+
+OHLCV = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+PRICE_DTYPE = "float32"   # 7 cifre significative: più che sufficienti per i prezzi
+
+
+def period_to_offset(period):
+    """
+    Converte un periodo yfinance ("5d", "6mo", "2y", "max") in DateOffset
+    (None per "max").
+    """
+    period = str(period).strip().lower()
+    if period == "max":
+        return None
+    if period.endswith("mo"):
+        return pd.DateOffset(months=int(period[:-2]))
+    if period.endswith("y"):
+        return pd.DateOffset(years=int(period[:-1]))
+    if period.endswith("wk"):
+        return pd.DateOffset(weeks=int(period[:-2]))
+    if period.endswith("d"):
+        return pd.DateOffset(days=int(period[:-1]))
+    raise ValueError(f"Periodo non riconosciuto: {period}")
+
+
+def _covers(cached_period, period):
+    # True se lo storico in cache è lungo almeno quanto il periodo richiesto
+    if cached_period == "max":
+        return True
+    if period == "max":
+        return False
+    ref = pd.Timestamp("2000-01-01")
+    return ref - period_to_offset(cached_period) <= ref - period_to_offset(period)
+
+
+def slice_period(df, period, now=None):
+    offset = period_to_offset(period)
+    if offset is None or df.empty:
+        return df
+    now = pd.Timestamp(now or datetime.now())
+    start = now - offset
+    if df.index.tz is not None:
+        start = start.tz_localize(df.index.tz)
+    return df[df.index >= start]
+
+
+def normalize_columns(df):
+    """
+    Colonne piatte e standard (Open/High/Low/Close/Adj Close/Volume) anche
+    quando yfinance restituisce un MultiIndex (campo, ticker).
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    df = df.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        fields = {c.lower() for c in OHLCV}
+        level = 0 if any(str(v).lower() in fields for v in df.columns.get_level_values(0)) else 1
+        df.columns = df.columns.get_level_values(level)
+
+    canonical = {c.lower(): c for c in OHLCV}
+    df.columns = [canonical.get(str(c).strip().lower(), str(c).strip()) for c in df.columns]
+    df = df.loc[:, ~df.columns.duplicated()]
+    df.index = pd.to_datetime(df.index)
+    return compact_bars(df.sort_index())
+
+
+def compact_bars(df):
+    """
+    OHLC in float32 e volume intero: metà memoria (in RAM e su disco)
+    rispetto ai float64 restituiti da yfinance.
+    """
+    for col in ("Open", "High", "Low", "Close", "Adj Close"):
+        if col in df.columns and df[col].dtype != PRICE_DTYPE:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(PRICE_DTYPE)
+    if "Volume" in df.columns and df["Volume"].dtype != "int64":
+        df["Volume"] = pd.to_numeric(df["Volume"], errors="coerce").fillna(0).astype("int64")
+    return df
+
+
+def _safe_name(ticker):
+    return "".join(ch if ch.isalnum() or ch in "-._" else "_" for ch in ticker)
+
+
+def bars_path(ticker, interval, auto_adjust=False):
+    # Chiave = simbolo canonico: "BRK.B" e "BRK-B" condividono la stessa voce
+    folder = f"{interval}_adj" if auto_adjust else interval
+    return os.path.join(BARS_DIR, folder, f"{_safe_name(canonical_symbol(ticker))}.pkl")
+
+
+def load_entry(ticker, interval, auto_adjust=False):
+    path = bars_path(ticker, interval, auto_adjust)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            entry = pickle.load(f)
+        entry["bars"] = compact_bars(entry["bars"])  # voci salvate prima dei dtype compatti
+        return entry
+    except Exception as e:
+        print(f"⚠️ Cache barre illeggibile per {ticker} ({interval}): {e}")
+        return None
+
+
+def save_entry(ticker, interval, auto_adjust, entry):
+    path = bars_path(ticker, interval, auto_adjust)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def get_bars(ticker, interval="1d", period="1y", auto_adjust=False,
+             max_age_hours=MAX_AGE_HOURS, metrics=None, offline=False):
+    """
+    Barre OHLCV di un ticker dalla cache locale; scarica solo se la cache
+    manca, è più vecchia di max_age_hours o non copre il periodo richiesto.
+    Restituisce un DataFrame vuoto se il download fallisce. offline=True:
+    solo la cache, anche se vecchia, e vuoto se manca (mai un download).
+    Con uno snapshot attivo le barre servite finiscono nel (o vengono dal)
+    bundle.
+    """
+    key = {"ticker": canonical_symbol(ticker), "interval": interval, "period": period, "auto_adjust": auto_adjust}
+    df = snapshot.recorded("bars", key, lambda: _cached_bars(ticker, interval, period, auto_adjust,
+                                                            max_age_hours, metrics, offline))
+    return df if df is not None else pd.DataFrame()
+
+
+def _cached_bars(ticker, interval, period, auto_adjust, max_age_hours, metrics, offline=False):
+    entry = load_entry(ticker, interval, auto_adjust)
+    if entry is not None:
+        fresh = datetime.now() - entry["fetched_at"] < timedelta(hours=max_age_hours)
+        if (fresh or offline) and _covers(entry["period"], period):
+            return slice_period(entry["bars"], period)
+    if offline:
+        return pd.DataFrame()
+
+    # Storico già in cache: basta la coda, salvo azioni societarie non
+    # riconciliabili (allora si riscarica tutto)
+    if entry is not None and _covers(entry["period"], period) and not entry["bars"].empty:
+        updated = update_entry(ticker, interval, auto_adjust, entry, metrics)
+        if updated is not None:
+            save_entry(ticker, interval, auto_adjust, updated)
+            return slice_period(updated["bars"], period)
+
+    fetch_period = period
+    if entry is not None and not _covers(period, entry["period"]):
+        fetch_period = entry["period"]  # mantiene lo storico più lungo già in cache
+
+    df = download(ticker, metrics=metrics, period=fetch_period, interval=interval, auto_adjust=auto_adjust)
+    df = normalize_columns(df)
+    if df.empty:
+        return df
+
+    save_entry(ticker, interval, auto_adjust, {
+        "fetched_at": datetime.now(),
+        "period": fetch_period,
+        "bars": df,
+        "adjustments": entry.get("adjustments", []) if entry is not None else [],
+    })
+    return slice_period(df, period)
+
+
+# =========================
+# AGGIORNAMENTO INCREMENTALE + AZIONI SOCIETARIE
+# =========================
+# Il provider riaggiusta all'indietro le barre passate dopo uno split (OHLC
+# e volume) o un dividendo (Adj Close, e OHLC con auto_adjust=True):
+# appendere le barre nuove a uno storico vecchio mescolerebbe due scale
+# di prezzo e sfalserebbe bin del POC e ATR. La coda viene quindi
+# scaricata a partire da OVERLAP_BARS barre già in cache e la finestra di
+# sovrapposizione confrontata con un checksum:
+#   - checksum uguale → le barre nuove si appendono così come sono;
+#   - prezzi tutti moltiplicati per lo stesso fattore e uno split/dividendo
+#     nella coda → lo storico in cache viene riscalato dello stesso fattore;
+#   - altrimenti (evento dentro la finestra, revisioni sparse) → None e il
+#     ticker viene riscaricato per intero.
+OVERLAP_BARS = 5        # barre già in cache riscaricate per il confronto
+SIG_DIGITS = 5          # cifre significative nel checksum (rumore float32)
+RATIO_TOL = 1e-3        # tolleranza relativa sul fattore di riaggiustamento
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+ACTION_COLUMNS = ["Dividends", "Stock Splits"]
+
+
+def _significant(values, digits=SIG_DIGITS):
+    # Arrotondamento a `digits` cifre significative, elemento per elemento
+    values = np.asarray(values, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = 10.0 ** (digits - 1 - np.floor(np.log10(np.abs(values))))
+        return np.where(np.isfinite(scale), np.round(values * scale) / scale, values)
+
+
+def overlap_checksum(df):
+    """
+    Checksum di una finestra di barre: indice, prezzi (a SIG_DIGITS cifre
+    significative) e volume. Uguale tra cache e nuovo download se il
+    provider non ha riaggiustato lo storico.
+    """
+    h = hashlib.sha1()
+    h.update(df.index.asi8.tobytes() if hasattr(df.index, "asi8") else str(list(df.index)).encode())
+    for col in [c for c in PRICE_COLUMNS + ["Adj Close", "Volume"] if c in df.columns]:
+        h.update(col.encode())
+        h.update(np.ascontiguousarray(_significant(df[col].to_numpy())).tobytes())
+    return h.hexdigest()
+
+
+def _common_factor(new, old):
+    # Fattore new/old se è lo stesso su tutte le celle (entro RATIO_TOL), altrimenti None
+    new = np.asarray(new, dtype="float64").ravel()
+    old = np.asarray(old, dtype="float64").ravel()
+    ok = np.isfinite(new) & np.isfinite(old) & (old != 0)
+    if not ok.any():
+        return None
+    ratio = new[ok] / old[ok]
+    factor = float(np.median(ratio))
+    if factor <= 0 or np.any(np.abs(ratio / factor - 1) > RATIO_TOL):
+        return None
+    return factor
+
+
+def _actions(tail):
+    # Eventi della coda (data, tipo, valore) e coda senza le colonne azioni
+    events = []
+    if "Stock Splits" in tail.columns:
+        for date, ratio in tail["Stock Splits"][tail["Stock Splits"].fillna(0) > 0].items():
+            events.append((date, "split", float(ratio)))
+    if "Dividends" in tail.columns:
+        for date, amount in tail["Dividends"][tail["Dividends"].fillna(0) > 0].items():
+            events.append((date, "dividend", float(amount)))
+    return events, tail.drop(columns=[c for c in ACTION_COLUMNS if c in tail.columns])
+
+
+def append_tail(cached, tail, auto_adjust=False):
+    """
+    Unisce la coda appena scaricata allo storico in cache.
+    Restituisce (barre unite, riaggiustamenti applicati) oppure (None, motivo)
+    se serve un nuovo download completo. L'ultima barra in cache non entra
+    nel confronto: se era una barra intraday non ancora chiusa viene
+    semplicemente sostituita.
+    """
+    events, tail = _actions(tail)
+    tail = compact_bars(tail)
+    window = cached.index[:-1].intersection(tail.index)
+    if len(window) < min(OVERLAP_BARS, len(cached) - 1) or len(window) == 0:
+        return None, "finestra di sovrapposizione insufficiente"
+
+    old, new = cached.loc[window], tail.loc[window]
+    merged_head = cached[cached.index < tail.index[0]]
+    if overlap_checksum(old) == overlap_checksum(new):
+        return compact_bars(pd.concat([merged_head, tail])), []
+
+    # Le colonne riaggiustate devono avere un fattore unico su tutta la finestra
+    prices = [c for c in PRICE_COLUMNS if c in tail.columns and c in cached.columns]
+    price_factor = _common_factor(new[prices], old[prices])
+    if price_factor is None:
+        return None, "revisione delle barre non riconducibile a un fattore unico"
+    adj_factor = 1.0
+    if "Adj Close" in tail.columns and "Adj Close" in cached.columns:
+        adj_factor = _common_factor(new["Adj Close"], old["Adj Close"])
+        if adj_factor is None:
+            return None, "Adj Close riaggiustato in modo non uniforme"
+
+    # Un fattore diverso da 1 deve essere spiegato da un evento nella coda:
+    # split per OHLC (senza auto_adjust), split o dividendo per Adj Close
+    kinds = {kind for _, kind, _ in events}
+    price_changed = abs(price_factor - 1) > RATIO_TOL
+    adj_changed = abs(adj_factor - 1) > RATIO_TOL
+    if price_changed and not (kinds & ({"split", "dividend"} if auto_adjust else {"split"})):
+        return None, f"prezzi scalati di {price_factor:.6g} senza split nella coda"
+    if adj_changed and not kinds:
+        return None, f"Adj Close scalato di {adj_factor:.6g} senza eventi nella coda"
+
+    head = merged_head.copy()
+    for col in prices:
+        head[col] = head[col].astype("float64") * price_factor
+    if "Adj Close" in head.columns:
+        head["Adj Close"] = head["Adj Close"].astype("float64") * adj_factor
+    if "Volume" in head.columns and "split" in kinds:
+        volume_factor = _common_factor(new["Volume"], old["Volume"])
+        if volume_factor is None:
+            return None, "volume riaggiustato in modo non uniforme"
+        head["Volume"] = (head["Volume"] * volume_factor).round()
+
+    adjustments = [{"date": date, "kind": kind, "value": value,
+                    "price_factor": price_factor, "adj_factor": adj_factor}
+                   for date, kind, value in events]
+    return compact_bars(pd.concat([head, tail])), adjustments
+
+
+def update_entry(ticker, interval, auto_adjust, entry, metrics=None):
+    """
+    Scarica la coda di una voce scaduta e la unisce allo storico
+    (append_tail). None se serve un download completo.
+    """
+    cached = entry["bars"]
+    start = cached.index[-min(len(cached), OVERLAP_BARS + 1)]
+    tail = download(ticker, metrics=metrics, start=start.strftime("%Y-%m-%d"), interval=interval,
+                    auto_adjust=auto_adjust, actions=True)
+    tail = normalize_columns(tail)
+    if tail.empty:
+        return None
+    if tail.index.tz is None and cached.index.tz is not None:
+        tail.index = tail.index.tz_localize(cached.index.tz)
+
+    bars, adjustments = append_tail(cached, tail, auto_adjust)
+    if bars is None:
+        print(f"🔁 {ticker} ({interval}): {adjustments}, riscarico lo storico completo")
+        return None
+    for a in adjustments:
+        print(f"✂️ {ticker} ({interval}): {a['kind']} {a['value']:g} del {a['date']:%Y-%m-%d}, "
+              f"storico riscalato (prezzi x{a['price_factor']:.6g}, Adj Close x{a['adj_factor']:.6g})")
+    return {
+        "fetched_at": datetime.now(),
+        "period": entry["period"],
+        "bars": bars,
+        "adjustments": entry.get("adjustments", []) + adjustments,
+    }
+
+
+# =========================
+# RICAMPIONAMENTO TIMEFRAME
+# =========================
+RESAMPLE_RULES = {
+    "1wk": "W-MON",  # settimane etichettate col lunedì, come le barre 1wk di Yahoo
+    "1mo": "MS",     # mesi etichettati col primo giorno
+}
+
+
+def resample_bars(df, interval):
+    """
+    Aggrega barre giornaliere in settimanali ("1wk") o mensili ("1mo").
+    """
+    if interval == "1d" or df.empty:
+        return df
+
+    rule = RESAMPLE_RULES[interval]
+    kwargs = {"label": "left", "closed": "left"} if rule.startswith("W") else {}
+
+    agg = {}
+    for col, how in (("Open", "first"), ("High", "max"), ("Low", "min"),
+                     ("Close", "last"), ("Adj Close", "last"), ("Volume", "sum")):
+        if col in df.columns:
+            agg[col] = how
+
+    out = df.resample(rule, **kwargs).agg(agg)
+    return out.dropna(subset=["Close"]) if "Close" in out.columns else out
@@ -0,0 +1,214 @@
+# =========================
+# ARCHIVIO DELLA CACHE (EXPORT / RESTORE)
+# =========================
+# I runner di GitHub Actions partono sempre da zero: a fine job la cache
+# utile (barre, universo, fondamentali, risultati incrementali, negative
+# cache) viene impacchettata in un solo tar.gz versionato, e all'avvio del
+# job successivo ripristinata dopo aver verificato versione e checksum.
+# Così il run scarica solo le barre mancanti invece di anni di storico.
+#
+#   python data/cache_archive.py export
+#   python data/cache_archive.py restore
+#
+# L'archivio contiene manifest.json (schema, data, sha256 e dimensione di
+# ogni file) e i file sotto cache/. Un archivio con schema diverso, file
+# mancanti o checksum errati non viene ripristinato (nessun file toccato):
+# meglio ripartire da cache vuota che mescolare formati incompatibili.
+# Checkpoint e snapshot restano fuori: sono legati al singolo run.
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from scan_state import CACHE_DIR
+
+# Da incrementare quando cambia il formato di una voce di cache (barre,
+# pannello fondamentali, ResultCache...): gli archivi vecchi vengono ignorati.
+# Tenere allineata la chiave market-cache-vN in .github/workflows/run_master.yml
+SCHEMA_VERSION = 1
+
+ARCHIVE_DIR = os.path.join(BASE_DIR, "cache_archive")
+ARCHIVE_FILE = os.path.join(ARCHIVE_DIR, "cache.tar.gz")
+MANIFEST = "manifest.json"
+COMPRESS_LEVEL = 6     # le pickle float32 guadagnano poco oltre
+
+# Componente → percorso relativo a cache/ (cartella o file singolo)
+COMPONENTS = {
+    "bars": "bars",
+    "universe": "security_master.json",
+    "fundamentals": "fundamentals",
+    "results": "results",
+    "negative_cache": "negative_cache.json",
+}
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def component_files(name, cache_dir=CACHE_DIR):
+    # File della componente, relativi a cache/, in ordine stabile
+    root = os.path.join(cache_dir, COMPONENTS[name])
+    if os.path.isfile(root):
+        return [COMPONENTS[name]]
+    files = []
+    for folder, _, names in os.walk(root):
+        for n in names:
+            if n.endswith(".tmp"):
+                continue   # scritture atomiche interrotte
+            files.append(os.path.relpath(os.path.join(folder, n), cache_dir).replace(os.sep, "/"))
+    return sorted(files)
+
+
+def export_cache(path=ARCHIVE_FILE, components=None, cache_dir=CACHE_DIR):
+    """
+    Scrive l'archivio (prima in .tmp, poi rename) e restituisce il manifest.
+    """
+    components = list(components or COMPONENTS)
+    manifest = {
+        "schema": SCHEMA_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "components": {},
+        "files": {},
+    }
+    for name in components:
+        files = component_files(name, cache_dir)
+        manifest["components"][name] = len(files)
+        for rel in files:
+            full = os.path.join(cache_dir, rel)
+            manifest["files"][rel] = {"size": os.path.getsize(full), "sha256": sha256(full)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with tarfile.open(tmp, "w:gz", compresslevel=COMPRESS_LEVEL) as tar:
+        data = json.dumps(manifest, indent=1, sort_keys=True).encode()
+        info = tarfile.TarInfo(MANIFEST)
+        info.size = len(data)
+        info.mtime = int(datetime.now().timestamp())
+        tar.addfile(info, io.BytesIO(data))
+        for rel in manifest["files"]:
+            tar.add(os.path.join(cache_dir, rel), arcname=f"cache/{rel}", recursive=False)
+    os.replace(tmp, path)
+    return manifest
+
+
+def read_manifest(tar):
+    # Il manifest è la prima voce: si legge senza scorrere tutto l'archivio
+    first = tar.next()
+    if first is None or first.name != MANIFEST:
+        raise ValueError("manifest mancante")
+    try:
+        return json.load(tar.extractfile(first))
+    except ValueError as e:
+        raise ValueError(f"manifest illeggibile: {e}")
+
+
+def restore_cache(path=ARCHIVE_FILE, cache_dir=CACHE_DIR):
+    """
+    Verifica schema e checksum in una cartella di appoggio, poi sostituisce
+    le componenti presenti nell'archivio. Solleva ValueError (senza toccare
+    la cache) se l'archivio non è valido; restituisce il manifest.
+    """
+    staging = os.path.join(cache_dir, ".restore")
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        with tarfile.open(path, "r:gz") as tar:
+            manifest = read_manifest(tar)
+            if manifest.get("schema") != SCHEMA_VERSION:
+                raise ValueError(f"schema {manifest.get('schema')} diverso da {SCHEMA_VERSION}")
+
+            expected = manifest["files"]
+            seen = set()
+            for member in tar:
+                if member.name == MANIFEST:
+                    continue
+                rel = member.name[len("cache/"):] if member.name.startswith("cache/") else None
+                # Solo file regolari elencati nel manifest: niente path esterni o link
+                if rel not in expected or not member.isfile():
+                    raise ValueError(f"voce inattesa nell'archivio: {member.name}")
+                target = os.path.join(staging, rel)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                h = hashlib.sha256()
+                with tar.extractfile(member) as src, open(target, "wb") as dst:
+                    for block in iter(lambda: src.read(1 << 20), b""):
+                        h.update(block)
+                        dst.write(block)
+                if h.hexdigest() != expected[rel]["sha256"]:
+                    raise ValueError(f"checksum errato: {rel}")
+                seen.add(rel)
+
+            missing = set(expected) - seen
+            if missing:
+                raise ValueError(f"{len(missing)} file mancanti (es. {sorted(missing)[0]})")
+
+        # Archivio valido: sostituzione delle componenti non vuote
+        for name, count in manifest["components"].items():
+            rel = COMPONENTS.get(name)
+            if rel is None or not count:
+                continue
+            src, dst = os.path.join(staging, rel), os.path.join(cache_dir, rel)
+            if os.path.isdir(dst):
+                shutil.rmtree(dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
+            if os.path.exists(src):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.replace(src, dst)
+        return manifest
+    except (tarfile.TarError, OSError, EOFError, KeyError) as e:
+        raise ValueError(f"archivio illeggibile: {e}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _summary(manifest):
+    parts = ", ".join(f"{name} {n}" for name, n in manifest["components"].items())
+    size = sum(f["size"] for f in manifest["files"].values()) / 1e6
+    return f"{parts} ({size:.1f} MB non compressi, schema {manifest['schema']})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / restore della cache locale")
+    parser.add_argument("command", choices=["export", "restore"])
+    parser.add_argument("--archive", type=str, default=ARCHIVE_FILE,
+                        help="Percorso dell'archivio tar.gz")
+    parser.add_argument("--components", type=str, default=",".join(COMPONENTS),
+                        help="Componenti da esportare, separate da virgola")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        components = [c.strip() for c in args.components.split(",") if c.strip()]
+        unknown = [c for c in components if c not in COMPONENTS]
+        if unknown:
+            parser.error(f"Componenti sconosciute: {', '.join(unknown)}")
+        manifest = export_cache(args.archive, components)
+        print(f"📦 Cache esportata in {args.archive}: {_summary(manifest)}")
+        return 0
+
+    if not os.path.exists(args.archive):
+        print(f"ℹ️ Nessun archivio in {args.archive}: si parte da cache vuota")
+        return 0
+    try:
+        manifest = restore_cache(args.archive)
+    except ValueError as e:
+        print(f"⚠️ Archivio cache scartato ({e}): si parte da cache vuota")
+        return 1
+    print(f"♻️ Cache ripristinata da {args.archive} ({manifest['created_at']}): {_summary(manifest)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# =========================
+# REPORT FINALE SETTIMANALE (un solo workbook)
+# =========================
+# Raccoglie le tabelle finali della settimana (POC + SuperTrend per ogni
+# config, key reversal, divergenze RSI, sweep, tickers info) in un unico
+# Report_week_N.xlsx, un foglio per config/segnale, scritto in streaming con
+# report_writer. Aggiunge per ogni config il foglio "Segnali" che prima si
+# costruiva a mano nel notebook FINALE POC DIV E KR.
+
+import argparse
+import glob
+import os
+import re
+import sys
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from run_metrics import RunMetrics
+from profiling import add_profile_args, start_from_args
+from report_writer import ReportWriter
+from snapshot import add_snapshot_args, configure, run_week
+from incremental import delta_table
+from screener import SCREENS, Screen, metrics_table
+
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
+metrics = RunMetrics("final_report")
+
+
+def read_table(path, sheet=0):
+    if not os.path.exists(path):
+        print(f"⚠️ File non trovato, foglio saltato: {os.path.basename(path)}")
+        return None
+    with metrics.timed("read"):
+        return pd.read_excel(path, sheet_name=sheet)
+
+
+def poc_st_files(week_number):
+    # Config POC + SuperTrend della settimana, ordinate per periodo decrescente
+    files = []
+    for path in glob.glob(os.path.join(OUTPUT_DIR, f"POC_ST_p*_s*_week_{week_number}.xlsx")):
+        m = re.match(r"POC_ST_p(\d+)y_s([\d.]+)_week_", os.path.basename(path))
+        if m:
+            files.append((int(m.group(1)), m.group(2), path))
+    return sorted(files, key=lambda f: -f[0])
+
+
+# Campi della tabella metriche (screener) → colonne del foglio Segnali
+SIGNALS_COLUMNS = {
+    "ticker": "Ticker", "index": "Indice", "poc_dist": "deltaPOC",
+    "dd_max": "%MaxDRW", "dd_avg": "%AvgDRW", "dd_cur": "%CurDRW",
+    "kr_date": "date KR", "kr_type": "type KR", "div_date": "date DIV", "div_type": "type DIV",
+}
+
+
+def signals_table(df_poc, df_kr, df_div):
+    """
+    Come il notebook FINALE: ultimo key reversal e ultima divergenza per
+    ticker uniti alla tabella POC, solo i ticker con almeno un segnale
+    (screen "segnali" sulla tabella metriche dello screener).
+    """
+    table = Screen("segnali", SCREENS["segnali"]).apply(metrics_table(df_poc, df_kr, df_div))
+    return table[list(SIGNALS_COLUMNS)].rename(columns=SIGNALS_COLUMNS)
+
+
+def build_report(week_number, output_file=None):
+    output_file = output_file or os.path.join(OUTPUT_DIR, f"Report_week_{week_number}.xlsx")
+
+    df_kr = read_table(os.path.join(OUTPUT_DIR, f"key_reversal_signals_week_{week_number}.xlsx"))
+    df_div = read_table(os.path.join(OUTPUT_DIR, f"rsi_divergences_week_{week_number}.xlsx"))
+    configs = [(p, s, read_table(path)) for p, s, path in poc_st_files(week_number)]
+
+    with ReportWriter(output_file) as writer, metrics.stage("excel"):
+        for p, s, df_poc in configs:
+            writer.add_sheet(f"Segnali {p}y {s}%", signals_table(df_poc, df_kr, df_div))
+        for p, s, df_poc in configs:
+            writer.add_sheet(f"POC_ST {p}y {s}%", df_poc, {
+                "POC": "0.00", "VAL": "0.00", "VAH": "0.00", "HVN vicino": "0.00", "LVN vicino": "0.00",
+                "Prezzo Attuale": "0.00", "All Time High": "0.00",
+            })
+        if df_kr is not None:
+            writer.add_sheet("Key reversal", df_kr)
+        if df_div is not None:
+            writer.add_sheet("Divergenze RSI", df_div, {"Price1": "0.00", "Price2": "0.00"})
+
+        sweep_file = os.path.join(OUTPUT_DIR, f"POC_sweep_week_{week_number}.xlsx")
+        if os.path.exists(sweep_file):  # solo se è stato lanciato master.py --sweep
+            df_sweep = read_table(sweep_file, "riepilogo")
+            writer.add_sheet("POC sweep", df_sweep)
+
+        # Ticker entrati/usciti dai risultati rispetto al run precedente
+        df_delta = delta_table(week_number)
+        if not df_delta.empty:
+            writer.add_sheet("Delta", df_delta)
+
+        df_info = read_table(os.path.join(OUTPUT_DIR, "tickers_info.xlsx"))
+        if df_info is not None:
+            writer.add_sheet("Tickers", df_info, {"market_cap_B": "0.00", "price": "0.00", "poc_h_240": "0.00"})
+
+        sheets = list(writer.sheets)
+
+    print(f"✅ Report finale: {output_file}")
+    print(f"📑 Fogli: {', '.join(sheets)}")
+    return output_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report finale settimanale in un unico workbook")
+    parser.add_argument("--week", type=int, default=None,
+                        help="Settimana ISO dei file da raccogliere (default: quella del run)")
+    add_profile_args(parser)
+    add_snapshot_args(parser)
+    args = parser.parse_args()
+    configure(args)
+    args.week = args.week or run_week()
+    start_from_args(args, "final_report", args.week)
+
+    build_report(args.week)
+    metrics.write(args.week)
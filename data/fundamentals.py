@@ -0,0 +1,494 @@
+import io
+import os
+import pickle
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from scan_state import CACHE_DIR, retry_call
+import snapshot
+
+# =========================
+# PANNELLO FONDAMENTALI (TICKER × PERIODO FISCALE)
+# =========================
+# I bilanci di discountingcashflows.com vengono scaricati e parsati una
+# volta sola per ticker: le voci usate da "Analisi Fondamentale.ipynb"
+# (calculate_scores, calculate_ratios, calculate_shareholder_yield,
+# analyze_share_count_trend_income) finiscono in una tabella colonnare
+# con una riga per (ticker, periodo) e una colonna float per voce.
+# Lo screener lavora sull'intero pannello con operazioni di colonna e
+# groupby/shift per ticker: nessun ciclo per ticker, nessuna tabella HTML.
+#
+# Come nel notebook i valori sono nella scala del sito (milioni); la
+# market cap entra in miliardi (market_cap_B di tickers_info.xlsx).
+
+BASE_URL = "https://discountingcashflows.com/company/{ticker}/{statement}/"
+FUNDAMENTALS_DIR = os.path.join(CACHE_DIR, "fundamentals")
+PANEL_FILE = os.path.join(FUNDAMENTALS_DIR, "panel.pkl")
+# Fallimenti dei bilanci separati da quelli dei prezzi: un sito giù non
+# deve far saltare i download di yfinance (e viceversa)
+NEGATIVE_CACHE_FILE = os.path.join(FUNDAMENTALS_DIR, "negative_cache.json")
+MAX_AGE_DAYS = 7        # i bilanci cambiano al massimo una volta a trimestre
+YEARS = 8               # periodi per trend azioni e utili non distribuiti (Altman)
+F_SCORE_MIN_POINTS = 7  # punti Piotroski valutabili minimi, altrimenti F-score NaN
+
+STATEMENTS = ("income-statement", "balance-sheet-statement", "cash-flow-statement")
+
+# Voce → (bilancio, keyword in ordine di priorità), come nelle celle del notebook
+LINE_ITEMS = {
+    "revenue":             ("income-statement", ["Revenue", "Sales", "Total Revenue"]),
+    "gross_profit":        ("income-statement", ["Gross Profit"]),
+    "sga":                 ("income-statement", ["Selling", "General"]),
+    "depreciation":        ("income-statement", ["Depreciation"]),
+    "operating_income":    ("income-statement", ["Operating Income"]),
+    "net_income":          ("income-statement", ["Net Income", "Net loss", "NetLossProfit"]),
+    "shares":              ("income-statement", ["Weighted Average Shares Outstanding", "Weighted Average Shares"]),
+    "diluted_shares":      ("income-statement", ["Diluted Weighted Average Shares Outstanding"]),
+    "receivables":         ("balance-sheet-statement", ["Receivable"]),
+    "total_assets":        ("balance-sheet-statement", ["Total Assets"]),
+    "current_assets":      ("balance-sheet-statement", ["Current Assets"]),
+    "ppe":                 ("balance-sheet-statement", ["Property, Plant", "PPE"]),
+    "total_liabilities":   ("balance-sheet-statement", ["Total Liabilities"]),
+    "current_liabilities": ("balance-sheet-statement", ["Current Liabilities"]),
+    "equity":              ("balance-sheet-statement", ["Total Equity", "Total shareholders' equity", "Total stockholders' equity"]),
+    "total_debt":          ("balance-sheet-statement", ["Total Debt", "Total Long Term Debt"]),
+    "long_term_debt":      ("balance-sheet-statement", ["Long-Term Debt", "Long Term Debt"]),
+    "capital_leases":      ("balance-sheet-statement", ["Capital Lease Obligations", "Capital Lease Liability"]),
+    "cfo":                 ("cash-flow-statement", ["Cash Flow from Operations", "Operating Cash Flow"]),
+    "fcf":                 ("cash-flow-statement", ["Free Cash Flow", "FreeCashFlow"]),
+    "dividends":           ("cash-flow-statement", ["Dividends Paid"]),
+    "buyback":             ("cash-flow-statement", ["Repurchase", "Common Stock Repurchased"]),
+    "issuance":            ("cash-flow-statement", ["Issuance of Stock", "Common Stock Issued"]),
+    "debt_repayment":      ("cash-flow-statement", ["Debt Repayment"]),
+}
+ITEMS = list(LINE_ITEMS)
+BALANCE_ITEMS = [item for item, (statement, _) in LINE_ITEMS.items() if statement == "balance-sheet-statement"]
+KEY_COLUMNS = ["ticker", "fiscal_year", "period", "ttm"]
+
+
+# =========================
+# DOWNLOAD E PARSING BILANCI
+# =========================
+def fetch_statement(ticker, statement, metrics=None):
+    """
+    Prima tabella con almeno due colonne della pagina del bilancio, come
+    get_table_discounting nel notebook (None se la pagina non ne ha).
+    Con uno snapshot attivo la tabella finisce nel (o viene dal) bundle.
+    """
+    import requests
+    from bs4 import BeautifulSoup
+
+    def fetch():
+        r = requests.get(BASE_URL.format(ticker=ticker, statement=statement),
+                         headers={"User-Agent": "Mozilla/5.0"}, timeout=20)
+        r.raise_for_status()
+        for t in BeautifulSoup(r.text, "html.parser").find_all("table"):
+            try:
+                df = pd.read_html(io.StringIO(str(t)))[0]
+            except ValueError:
+                continue
+            if df.shape[1] >= 2:
+                return df
+        return None
+
+    def fetch_retry():
+        try:
+            return retry_call(fetch, label=f"{ticker} {statement}", metrics=metrics)
+        except Exception as e:
+            print(f"❌ {statement} non scaricato per {ticker}: {e}")
+            return None
+
+    return snapshot.recorded("statement", {"ticker": ticker, "statement": statement}, fetch_retry)
+
+
+def clean_values(frame):
+    """
+    Celle del bilancio → float: virgole e spazi via, (x) → -x, suffissi
+    M/B/T rimossi, "-" e testi non numerici → NaN. Tutto il blocco in una
+    volta sola invece che cella per cella.
+    """
+    def clean(column):
+        text = (column.astype(str)
+                      .str.replace(",", "", regex=False)
+                      .str.replace("(", "-", regex=False)
+                      .str.replace(")", "", regex=False)
+                      .str.replace(r"[\sMBTb]", "", regex=True))
+        return pd.to_numeric(text, errors="coerce")
+
+    return frame.apply(clean)
+
+
+def _match_row(labels, keywords):
+    # Prima la riga con etichetta identica, poi la prima che contiene la
+    # keyword: "Weighted Average Shares Outstanding" non deve prendere la
+    # riga "Diluted ..." solo perché viene prima nella tabella
+    lowered = labels.str.strip().str.lower()
+    for kw in keywords:
+        exact = np.flatnonzero(lowered == kw.lower())
+        if len(exact):
+            return exact[0]
+        contains = np.flatnonzero(lowered.str.contains(kw.lower(), regex=False, na=False))
+        if len(contains):
+            return contains[0]
+    return None
+
+
+def fiscal_years(periods):
+    """
+    Anno fiscale di ogni colonna ("FY 2021", "2021-12"...). TTM/LTM conta
+    come anno successivo all'ultimo anno fiscale, come in projections.
+    Restituisce (anni, flag ttm); None per le colonne senza anno.
+    """
+    years, ttm = [], []
+    for period in periods:
+        period = str(period).upper()
+        match = re.search(r"(\d{4})", period)
+        is_ttm = "TTM" in period or "LTM" in period
+        years.append(None if is_ttm or not match else int(match.group(1)))
+        ttm.append(is_ttm)
+    last = max((y for y in years if y is not None), default=None)
+    years = [last + 1 if t and last is not None else y for y, t in zip(years, ttm)]
+    return years, ttm
+
+
+def parse_statements(ticker, tables):
+    """
+    tables: {statement: DataFrame come da fetch_statement (o None)}.
+    Restituisce le righe del pannello di un ticker: una per periodo, con le
+    colonne KEY_COLUMNS + ITEMS (NaN per le voci non trovate).
+    """
+    columns, cleaned = {}, {}
+    for item, (statement, keywords) in LINE_ITEMS.items():
+        df = tables.get(statement)
+        if df is None or df.shape[1] < 2:
+            continue
+        row = _match_row(df.iloc[:, 0].astype(str), keywords)
+        if row is None:
+            continue
+        if statement not in cleaned:
+            cleaned[statement] = clean_values(df.iloc[:, 1:])
+        values = cleaned[statement].iloc[row].to_numpy(dtype="float64")
+        columns[item] = pd.Series(values, index=[str(p) for p in df.columns[1:]])
+
+    if not columns:
+        return pd.DataFrame(columns=KEY_COLUMNS + ITEMS)
+
+    # Le colonne dei tre bilanci si allineano per etichetta di periodo
+    wide = pd.DataFrame(columns).reindex(columns=ITEMS)
+    years, ttm = fiscal_years(wide.index)
+    wide.insert(0, "ttm", ttm)
+    wide.insert(0, "period", wide.index)
+    wide.insert(0, "fiscal_year", years)
+    wide.insert(0, "ticker", ticker)
+    wide = wide.dropna(subset=["fiscal_year"]).drop_duplicates("fiscal_year")
+    return wide.reset_index(drop=True)
+
+
+def fetch_fundamentals(ticker, metrics=None):
+    tables = {}
+    for statement in STATEMENTS:
+        if metrics is not None:
+            with metrics.timed("download"):
+                tables[statement] = fetch_statement(ticker, statement, metrics)
+        else:
+            tables[statement] = fetch_statement(ticker, statement, metrics)
+    return parse_statements(ticker, tables)
+
+
+# =========================
+# STORE COLONNARE
+# =========================
+class FundamentalsPanel:
+    """
+    Pannello salvato in cache/fundamentals/panel.pkl: frame con una riga per
+    (ticker, periodo) ordinato per ticker e anno fiscale, più la data
+    dell'ultimo download di ogni ticker (anche quando il sito non ha dati,
+    così un ticker senza bilanci non viene richiesto a ogni run).
+    """
+
+    def __init__(self, frame=None, fetched_at=None, path=PANEL_FILE):
+        self.frame = frame if frame is not None else pd.DataFrame(columns=KEY_COLUMNS + ITEMS)
+        self.fetched_at = fetched_at or {}
+        self.path = path
+
+    @classmethod
+    def load(cls, path=PANEL_FILE):
+        if not os.path.exists(path):
+            return cls(path=path)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            return cls(entry["frame"], entry["fetched_at"], path)
+        except Exception as e:
+            print(f"⚠️ Pannello fondamentali illeggibile ({e}): riparto da vuoto")
+            return cls(path=path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"frame": self.frame, "fetched_at": self.fetched_at}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def stale(self, tickers, max_age_days=MAX_AGE_DAYS):
+        # Ticker mai scaricati o con bilanci più vecchi di max_age_days
+        limit = snapshot.run_datetime() - timedelta(days=max_age_days)
+        return [t for t in tickers if self.fetched_at.get(t, datetime.min) < limit]
+
+    def update(self, batch):
+        """
+        batch: {ticker: righe di parse_statements}. Sostituisce in blocco le
+        righe dei ticker ricevuti (concat unico, non una concat per ticker).
+        """
+        if not batch:
+            return
+        frames = [self.frame[~self.frame["ticker"].isin(list(batch))]]
+        frames += [rows for rows in batch.values() if not rows.empty]
+        frame = pd.concat([f for f in frames if not f.empty] or [frames[0]], ignore_index=True)
+        frame["ticker"] = frame["ticker"].astype(str)
+        frame["fiscal_year"] = frame["fiscal_year"].astype("int64")
+        frame["ttm"] = frame["ttm"].astype(bool)
+        frame[ITEMS] = frame[ITEMS].astype("float64")
+        self.frame = frame.sort_values(["ticker", "fiscal_year"], kind="stable").reset_index(drop=True)
+
+        now = snapshot.run_datetime()
+        for ticker in batch:
+            self.fetched_at[ticker] = now
+
+    def select(self, tickers=None, ttm=True):
+        frame = self.frame
+        if tickers is not None:
+            frame = frame[frame["ticker"].isin(list(tickers))]
+        if not ttm:
+            frame = frame[~frame["ttm"]]
+        return frame.reset_index(drop=True)
+
+
+# =========================
+# SCREENER VETTORIALE
+# =========================
+def _div(a, b):
+    # safe_ratio del notebook su colonne intere: NaN se b è 0 o manca
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (a / b.where(b != 0)).astype("float64")
+
+
+def ratios(panel):
+    """
+    Rapporti per ogni riga del pannello (calculate_ratios del notebook più
+    quelli usati dall'F-score). Debito: Total Debt, altrimenti Total
+    Liabilities come nella lista di keyword del notebook.
+    """
+    p = panel
+    debt = p["total_debt"].fillna(p["total_liabilities"])
+    return pd.DataFrame({
+        "ProfitMargin": _div(p["net_income"], p["revenue"]) * 100,
+        "ROE": _div(p["net_income"], p["equity"]) * 100,
+        "DebtEquity": _div(debt, p["equity"]),
+        "ROA": _div(p["net_income"], p["total_assets"]),
+        "CurrentRatio": _div(p["current_assets"], p["current_liabilities"]),
+        "GrossMargin": _div(p["gross_profit"], p["revenue"]),
+        "AssetTurnover": _div(p["revenue"], p["total_assets"]),
+    }, index=panel.index)
+
+
+def piotroski(panel, r, prev, prev_r):
+    """
+    9 punti di calculate_scores sull'ultimo periodo contro il precedente
+    (stesso ticker). Un punto vale NA se mancano i suoi dati (per i
+    confronti servono entrambi i periodi); l'F-score è la somma dei punti
+    ed è NaN con meno di F_SCORE_MIN_POINTS punti valutabili. F5 richiede
+    il debito a lungo termine (o i leasing) in entrambi i periodi.
+    """
+    p = panel
+    shares = p["diluted_shares"].fillna(p["shares"])
+    prev_shares = prev["diluted_shares"].fillna(prev["shares"])
+    ltd = p[["long_term_debt", "capital_leases"]]
+    prev_ltd = prev[["long_term_debt", "capital_leases"]]
+    has_ltd = ltd.notna().any(axis=1) & prev_ltd.notna().any(axis=1)
+
+    def both(a, b):
+        return a.notna() & b.notna()
+
+    tests = {
+        "F1_NetIncome": (p["net_income"] > 0, p["net_income"].notna()),
+        "F2_CFO": (p["cfo"] > 0, p["cfo"].notna()),
+        "F3_ROA": (r["ROA"] > prev_r["ROA"], both(r["ROA"], prev_r["ROA"])),
+        "F4_Accruals": (p["cfo"] > p["net_income"], both(p["cfo"], p["net_income"])),
+        "F5_Leverage": (ltd.fillna(0).sum(axis=1) < prev_ltd.fillna(0).sum(axis=1), has_ltd),
+        "F6_CurrentRatio": (r["CurrentRatio"] > prev_r["CurrentRatio"],
+                            both(r["CurrentRatio"], prev_r["CurrentRatio"])),
+        "F7_NoDilution": (shares <= prev_shares, both(shares, prev_shares)),
+        "F8_GrossMargin": (r["GrossMargin"] > prev_r["GrossMargin"],
+                           both(r["GrossMargin"], prev_r["GrossMargin"])),
+        "F9_AssetTurnover": (r["AssetTurnover"] > prev_r["AssetTurnover"],
+                             both(r["AssetTurnover"], prev_r["AssetTurnover"])),
+    }
+    points = pd.DataFrame({
+        name: passed.astype("Int8").where(scorable) for name, (passed, scorable) in tests.items()
+    }, index=panel.index)
+
+    scorable = points.notna().sum(axis=1)
+    score = points.sum(axis=1).astype("float64").where(scorable >= F_SCORE_MIN_POINTS)
+    return score, points
+
+
+def beneish(panel, prev):
+    # M-score a 8 variabili (stessi coefficienti e cutoff -1.78 del notebook)
+    p = panel
+    aq = 1 - _div(p["current_assets"] + p["ppe"], p["total_assets"])
+    prev_aq = 1 - _div(prev["current_assets"] + prev["ppe"], prev["total_assets"])
+    dep_rate = _div(p["depreciation"], p["ppe"] + p["depreciation"])
+    prev_dep_rate = _div(prev["depreciation"], prev["ppe"] + prev["depreciation"])
+
+    components = pd.DataFrame({
+        "DSRI": _div(_div(p["receivables"], p["revenue"]), _div(prev["receivables"], prev["revenue"])),
+        "GMI": _div(_div(prev["gross_profit"], prev["revenue"]), _div(p["gross_profit"], p["revenue"])),
+        "AQI": _div(aq, prev_aq),
+        "SGI": _div(p["revenue"], prev["revenue"]),
+        "DEPI": _div(prev_dep_rate, dep_rate),
+        "SGAI": _div(_div(p["sga"], p["revenue"]), _div(prev["sga"], prev["revenue"])),
+        "TATA": _div(p["net_income"] - p["cfo"], p["total_assets"]),
+        "LVGI": _div(_div(p["total_liabilities"], p["equity"]), _div(prev["total_liabilities"], prev["equity"])),
+    }, index=panel.index)
+    weights = pd.Series({"DSRI": 0.92, "GMI": 0.528, "AQI": 0.404, "SGI": 0.892,
+                         "DEPI": 0.115, "SGAI": -0.172, "TATA": 4.679, "LVGI": -0.327})
+    # Una componente mancante → M-score NaN, come nel notebook
+    return -4.84 + components.mul(weights).sum(axis=1, min_count=len(weights)), components
+
+
+def altman(panel, retained, market_cap_m):
+    """
+    Z-score (1.2, 1.4, 3.3, 0.6, 1.0). Utili non distribuiti approssimati
+    con la somma degli utili degli ultimi YEARS periodi, EBIT = Operating
+    Income (altrimenti utile + ammortamenti), X4 = market cap / passività.
+    """
+    p = panel
+    ebit = p["operating_income"].fillna(p["net_income"] + p["depreciation"])
+    x = pd.DataFrame({
+        "X1_WC_TA": _div(p["current_assets"] - p["current_liabilities"], p["total_assets"]),
+        "X2_RE_TA": _div(retained, p["total_assets"]),
+        "X3_EBIT_TA": _div(ebit, p["total_assets"]),
+        "X4_MVE_TL": _div(market_cap_m, p["total_liabilities"]),
+        "X5_S_TA": _div(p["revenue"], p["total_assets"]),
+    }, index=panel.index)
+    weights = pd.Series([1.2, 1.4, 3.3, 0.6, 1.0], index=x.columns)
+    return x.mul(weights).sum(axis=1, min_count=len(weights)), x
+
+
+def share_trend(panel, years=YEARS, diluted=False):
+    """
+    Variazione % delle azioni medie ponderate tra il primo e l'ultimo degli
+    ultimi `years` periodi disponibili di ogni ticker (< -3% buyback,
+    > +3% diluizione), come analyze_share_count_trend_income.
+    """
+    column = "diluted_shares" if diluted else "shares"
+    shares = panel[["ticker", column]].dropna()
+    window = shares.groupby("ticker", sort=False).tail(years).groupby("ticker", sort=False)[column]
+    first, last, count = window.first(), window.last(), window.count()
+    variation = (_div(last - first, first) * 100).where(count >= 2)
+    trend = np.select([variation < -3, variation > 3, variation.notna()],
+                      ["🟢 Buyback", "🔴 Diluizione", "🟡 Stabile"], default="🔴 Dati insufficienti")
+    return pd.DataFrame({"Shares Variation%": variation, "Shares trend": trend})
+
+
+def fill_ttm_balance(panel):
+    """
+    Il bilancio patrimoniale di solito non ha la colonna TTM/LTM: nella riga
+    TTM senza nessuna voce patrimoniale quelle voci vengono dall'ultimo
+    periodo chiuso e il loro "precedente" da quello prima ancora. Come
+    calculate_scores, che prende gli ultimi valori disponibili di ogni voce.
+    panel ordinato per ticker e anno fiscale; restituisce (pannello, voci
+    del periodo precedente).
+    """
+    by_ticker = panel.groupby("ticker", sort=False)
+    prev = by_ticker[ITEMS].shift(1)
+    fill = panel["ttm"].astype(bool) & panel[BALANCE_ITEMS].isna().all(axis=1)
+    if not fill.any():
+        return panel, prev
+
+    panel = panel.copy()
+    balance = by_ticker[BALANCE_ITEMS]
+    panel.loc[fill, BALANCE_ITEMS] = prev.loc[fill, BALANCE_ITEMS]
+    prev.loc[fill, BALANCE_ITEMS] = balance.shift(2).loc[fill]
+    return panel, prev
+
+
+def _label(values, bins, labels, missing="🔴 Dati insufficienti"):
+    # Interpretazione a soglie (bins crescenti, labels = len(bins) + 1)
+    out = np.asarray(labels, dtype=object)[np.searchsorted(bins, values.to_numpy(), side="right")]
+    return np.where(values.isna(), missing, out)
+
+
+def screen(panel, market_cap_b=None, years=YEARS, diluted=False, ttm=True):
+    """
+    Screener su tutto il pannello in un colpo solo. panel: frame di
+    FundamentalsPanel (righe ordinate per ticker, anno fiscale);
+    market_cap_b: Series ticker → market cap in miliardi (opzionale: senza
+    restano NaN Z-score e shareholder yield). Restituisce una riga per
+    ticker con l'ultimo periodo: rapporti, F/M/Z-score, trend azioni e
+    shareholder yield.
+    """
+    if not ttm:
+        panel = panel[~panel["ttm"]]
+    panel = panel.sort_values(["ticker", "fiscal_year"], kind="stable").reset_index(drop=True)
+    if panel.empty:
+        return pd.DataFrame()
+
+    panel, prev = fill_ttm_balance(panel)
+    by_ticker = panel.groupby("ticker", sort=False)
+    r = ratios(panel)
+    prev_r = ratios(prev)
+
+    f_score, f_points = piotroski(panel, r, prev, prev_r)
+    m_score, _ = beneish(panel, prev)
+
+    retained = (by_ticker["net_income"].rolling(years, min_periods=1).sum()
+                .reset_index(level=0, drop=True).sort_index())
+    if market_cap_b is not None:
+        market_cap_m = panel["ticker"].map(market_cap_b).astype("float64") * 1000
+    else:
+        market_cap_m = pd.Series(np.nan, index=panel.index)
+    z_score, z_parts = altman(panel, retained, market_cap_m)
+
+    # Flussi verso gli azionisti: ultimo valore disponibile di ogni voce
+    # (extract_value nel notebook), dividendi/buyback/emissioni in valore assoluto
+    flows = by_ticker[["dividends", "buyback", "issuance", "debt_repayment"]].ffill()
+    flows[["dividends", "buyback", "issuance"]] = flows[["dividends", "buyback", "issuance"]].abs()
+    returned = (flows["dividends"].fillna(0) + flows["buyback"].fillna(0)
+                - flows["issuance"].fillna(0) - flows["debt_repayment"].fillna(0))
+
+    table = pd.concat([
+        panel[["ticker", "period", "fiscal_year"]],
+        r,
+        f_points,
+        pd.DataFrame({
+            "F-Score": f_score,
+            "M-Score": m_score,
+            "Z-Score": z_score,
+            "Shareholder Yield%": _div(returned, market_cap_m) * 100,
+            "Dividend Yield%": _div(flows["dividends"], market_cap_m) * 100,
+            "Buyback Yield%": _div(flows["buyback"], market_cap_m) * 100,
+        }),
+        z_parts,
+    ], axis=1)
+
+    latest = table.groupby("ticker", sort=False).tail(1).set_index("ticker")
+    latest = latest.join(share_trend(panel, years, diluted))
+    # Ticker senza nessun dato sulle azioni: fuori da share_trend
+    latest["Shares trend"] = latest["Shares trend"].fillna("🔴 Dati insufficienti")
+
+    latest.insert(latest.columns.get_loc("F-Score") + 1, "F-Score interp",
+                  _label(latest["F-Score"], [5, 8], ["🔴 Debole (rischi elevati)", "🟡 Solida ma migliorabile",
+                                                     "💚 Molto solida (ottima efficienza)"]))
+    latest.insert(latest.columns.get_loc("M-Score") + 1, "M-Score interp",
+                  _label(latest["M-Score"], [-1.78], ["💚 Bassa probabilità di manipolazione",
+                                                      "🔴 Possibile manipolazione contabile"]))
+    latest.insert(latest.columns.get_loc("Z-Score") + 1, "Z-Score interp",
+                  _label(latest["Z-Score"], [1.81, np.nextafter(2.99, np.inf)], ["🔴 Rischio elevato di insolvenza",
+                                                           "🟡 Zona grigia (moderato rischio)",
+                                                           "💚 Solida (basso rischio di fallimento)"]))
+    return latest.reset_index().rename(columns={"ticker": "Ticker", "period": "Period", "fiscal_year": "Fiscal year"})
@@ -0,0 +1,124 @@
+# =========================
+# SCREENER FONDAMENTALI SU TUTTO L'UNIVERSO
+# =========================
+# Aggiorna il pannello dei fondamentali (cache/fundamentals/panel.pkl) solo
+# per i ticker con bilanci più vecchi di --max_age_days, poi calcola in
+# blocco rapporti, Piotroski F-score, Beneish M-score, Altman Z-score,
+# trend delle azioni e shareholder yield (fundamentals.screen) e scrive
+# output/fundamentals_screener.xlsx. La market cap viene da
+# output/tickers_info.xlsx quando esiste.
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import NegativeCache, add_scan_args, configure
+from report_writer import write_excel
+from memory_guard import MemoryGuard
+from fundamentals import (MAX_AGE_DAYS, NEGATIVE_CACHE_FILE, YEARS, FundamentalsPanel,
+                          fetch_fundamentals, screen)
+
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+TICKERS_INFO_FILE = os.path.join(OUTPUT_DIR, "tickers_info.xlsx")
+SAVE_EVERY = 25   # ticker scaricati tra due salvataggi del pannello
+
+parser = argparse.ArgumentParser(description="Screener fondamentali")
+add_profile_args(parser)
+add_scan_args(parser)
+parser.add_argument("--max_age_days", type=float, default=MAX_AGE_DAYS,
+                    help="Giorni dopo cui i bilanci di un ticker vengono riscaricati")
+parser.add_argument("--years", type=int, default=YEARS,
+                    help="Periodi per trend azioni e utili non distribuiti")
+parser.add_argument("--diluted", action="store_true",
+                    help="Trend sulle azioni diluite invece che sulle azioni base")
+parser.add_argument("--no_ttm", action="store_true",
+                    help="Confronta solo anni fiscali chiusi (esclude la colonna TTM/LTM)")
+args = parser.parse_args()
+if args.shard or args.merge_shards:
+    parser.error("--shard/--merge_shards non sono supportati: il pannello è un file unico")
+configure(args)
+neg_cache = NegativeCache.from_args(args, NEGATIVE_CACHE_FILE)   # separata da quella dei prezzi
+
+metrics = RunMetrics("fundamentals_screener")
+start_from_args(args, "fundamentals_screener")
+guard = MemoryGuard.from_args(args, metrics)
+
+
+def market_caps():
+    # market_cap_B per ticker dall'ultimo Tickers with sectors (se c'è)
+    if not os.path.exists(TICKERS_INFO_FILE):
+        print("⚠️ tickers_info.xlsx non trovato: Z-score e shareholder yield restano vuoti")
+        return None
+    info = pd.read_excel(TICKERS_INFO_FILE, usecols=["ticker", "market_cap_B"])
+    return info.dropna().drop_duplicates("ticker").set_index("ticker")["market_cap_B"]
+
+
+with metrics.stage("universe"):
+    all_tickers = limit_tickers(get_all_tickers(), args)
+metrics.tickers_total = len(all_tickers)
+
+panel = FundamentalsPanel.load()
+stale = [t for t in panel.stale(all_tickers, args.max_age_days) if not neg_cache.should_skip(t)]
+print(f"🔍 {len(all_tickers)} ticker, bilanci da aggiornare: {len(stale)}")
+
+# =========================
+# Aggiornamento pannello
+# =========================
+metrics.start("scan")
+batch = {}
+for ticker in stale:
+    metrics.ticker_done()
+    guard.tick()
+    try:
+        rows = fetch_fundamentals(ticker, metrics)
+    except Exception as e:
+        print(f"❌ Errore su {ticker}: {e}")
+        metrics.fail_exc(e)
+        continue
+
+    if rows.empty:
+        metrics.fail("no_data")
+        neg_cache.record_failure(ticker, "no_data")
+    else:
+        neg_cache.record_success(ticker)
+    batch[ticker] = rows
+
+    # Salvataggi periodici: un run interrotto riparte dai ticker mancanti
+    if len(batch) >= SAVE_EVERY:
+        panel.update(batch)
+        panel.save()
+        batch = {}
+
+panel.update(batch)
+panel.save()
+metrics.stop("scan")
+guard.check()
+
+# =========================
+# Screener
+# =========================
+with metrics.stage("compute"):
+    df = screen(panel.select(all_tickers), market_caps(), years=args.years,
+                diluted=args.diluted, ttm=not args.no_ttm)
+print(f"📊 Screener calcolato su {len(df)} ticker")
+
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+output_file = os.path.join(OUTPUT_DIR, "fundamentals_screener.xlsx")
+with metrics.stage("excel"):
+    write_excel(output_file, df, "Fundamentals", formats={
+        "F-Score": "0", "M-Score": "0.00", "Z-Score": "0.00",
+        "Shareholder Yield%": "0.00", "Dividend Yield%": "0.00", "Buyback Yield%": "0.00",
+        "DebtEquity": "0.00", "ROA": "0.000", "CurrentRatio": "0.00",
+        "GrossMargin": "0.000", "AssetTurnover": "0.00",
+    })
+
+print(f"\n📊 File creato: {output_file}")
+metrics.write()
@@ -10,9 +10,13 @@ HTML_FILE = OUTPUT_DIR / "latest_artifact.html"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # --------------------------
-# Trova l'ultimo file XLSX
+# Trova l'ultimo file XLSX (preferisce il report finale unico)
 # --------------------------
 xlsx_files = sorted(
+    OUTPUT_DIR.glob("Report_week_*.xlsx"),
+    key=lambda f: f.stat().st_mtime,
+    reverse=True
+) or sorted(
     OUTPUT_DIR.glob("*.xlsx"),
     key=lambda f: f.stat().st_mtime,
     reverse=True
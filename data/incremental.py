@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+
+import pandas as pd
+
+import snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: niente lock, gli shard paralleli girano su Linux
+    fcntl = None
+
+# =========================
+# RUN INCREMENTALI + DELTA REPORT
+# =========================
+# ResultCache ricorda per ogni ticker l'impronta delle barre di input e le
+# righe calcolate: se al run successivo le barre sono identiche (festività,
+# weekend per le crypto, ETF fermi) le righe vengono riusate senza
+# ricalcolare POC, SuperTrend, RSI o drawdown. Il nome della cache contiene
+# la configurazione dello script, quindi parametri diversi non si mescolano.
+#
+# write_delta confronta l'insieme dei ticker di un risultato con quello del
+# run precedente e scrive in output/ chi è entrato e chi è uscito.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, "cache", "results")
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+FINGERPRINT_TAIL = 5   # ultime barre che entrano nell'impronta
+
+
+def fingerprint(*frames, tail=FINGERPRINT_TAIL):
+    """
+    Impronta delle ultime `tail` barre (indice + valori, anche Adj Close) di
+    uno o più DataFrame: cambia con una barra nuova o con una revisione
+    recente. Non conta invece l'inizio della finestra, che con i periodi
+    relativi ("5y") scorre ogni giorno anche senza barre nuove.
+    """
+    h = hashlib.sha1()
+    for df in frames:
+        if df is None or df.empty:
+            h.update(b"empty")
+            continue
+        h.update(",".join(map(str, df.columns)).encode())
+        h.update(pd.util.hash_pandas_object(df.tail(tail), index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    ticker → (impronta input, righe). get() restituisce le righe solo se
+    l'impronta coincide; save() a fine run. Più shard possono salvare la
+    stessa cache: ognuno riscrive solo i ticker che ha aggiornato.
+    """
+
+    def __init__(self, name, enabled=True):
+        self.path = os.path.join(RESULTS_DIR, f"{snapshot.scoped(name)}.pkl")
+        self.enabled = enabled
+        self.entries = {}
+        self.updated = set()
+        self.hits = 0
+        self._lock = threading.Lock()   # get/put anche dai worker di SupertrendPipeline
+
+        if enabled and os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    self.entries = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                print(f"⚠️ Cache risultati illeggibile, la ricreo: {self.path}")
+
+    @classmethod
+    def from_args(cls, name, args):
+        return cls(name, enabled=not args.no_incremental)
+
+    def get(self, ticker, fp):
+        with self._lock:
+            entry = self.entries.get(ticker)
+            if not self.enabled or entry is None or entry["fp"] != fp:
+                return None
+            self.hits += 1
+            return list(entry["rows"])
+
+    def put(self, ticker, fp, rows):
+        rows = list(rows)
+        if self.enabled:
+            with self._lock:
+                self.entries[ticker] = {"fp": fp, "rows": rows}
+                self.updated.add(ticker)
+        return rows
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return {}
+
+    def save(self, tickers=None):
+        # Tiene solo i ticker ancora nell'universo
+        if not self.enabled:
+            return
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Riparte dal file su disco: un altro shard può averlo aggiornato nel frattempo
+            entries = self._load()
+            entries.update({t: self.entries[t] for t in self.updated})
+            if tickers is not None:
+                keep = set(tickers)
+                entries = {t: e for t, e in entries.items() if t in keep}
+            self.entries = entries
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+        print(f"♻️ Cache risultati {os.path.basename(self.path)}: {self.hits} ticker riusati senza ricalcolo")
+
+
+def write_delta(name, tickers, week_number):
+    """
+    Ticker entrati/usciti dal risultato `name` rispetto al run precedente.
+    Scrive output/delta_<name>_week_N.json e aggiorna lo stato.
+    """
+    state_path = os.path.join(RESULTS_DIR, f"{snapshot.scoped(name)}_tickers.json")
+    current = sorted({str(t) for t in tickers})
+
+    previous, previous_run = None, None
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        previous, previous_run = state["tickers"], state["run_at"]
+
+    delta = {
+        "name": name,
+        "run_at": snapshot.run_datetime().isoformat(timespec="seconds"),
+        "previous_run": previous_run,
+        "count": len(current),
+        "entered": sorted(set(current) - set(previous)) if previous is not None else [],
+        "left": sorted(set(previous) - set(current)) if previous is not None else [],
+    }
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, f"delta_{name}_week_{week_number}.json"), "w", encoding="utf-8") as f:
+        json.dump(delta, f, indent=1)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump({"run_at": delta["run_at"], "tickers": current}, f, indent=1)
+
+    if previous is None:
+        print(f"🆕 Delta {name}: primo run, {len(current)} ticker")
+    else:
+        print(f"🔀 Delta {name}: +{len(delta['entered'])} entrati, -{len(delta['left'])} usciti")
+    return delta
+
+
+def delta_table(week_number):
+    # Tutti i delta della settimana in una tabella (nome, ticker, variazione)
+    rows = []
+    prefix = "delta_"
+    suffix = f"_week_{week_number}.json"
+    if not os.path.isdir(OUTPUT_DIR):
+        return pd.DataFrame(columns=["Risultato", "Ticker", "Variazione"])
+    for fname in sorted(os.listdir(OUTPUT_DIR)):
+        if not (fname.startswith(prefix) and fname.endswith(suffix)):
+            continue
+        with open(os.path.join(OUTPUT_DIR, fname), encoding="utf-8") as f:
+            delta = json.load(f)
+        rows += [{"Risultato": delta["name"], "Ticker": t, "Variazione": "entrato"} for t in delta["entered"]]
+        rows += [{"Risultato": delta["name"], "Ticker": t, "Variazione": "uscito"} for t in delta["left"]]
+    return pd.DataFrame(rows, columns=["Risultato", "Ticker", "Variazione"])
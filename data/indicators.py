@@ -0,0 +1,308 @@
+import numpy as np
+import pandas as pd
+
+# =========================
+# LIBRERIA INDICATORI (NumPy)
+# =========================
+# Tutte le funzioni accettano una serie 1-D (Series / array) oppure un
+# pannello 2-D (DataFrame / array) con il tempo sulle righe e i ticker sulle
+# colonne, e restituiscono lo stesso tipo ricevuto (stesso indice/colonne).
+# I risultati coincidono con le implementazioni storiche degli script:
+# pandas ewm(adjust=False), ta.momentum.RSIIndicator e l'ATR/SuperTrend
+# allineati a TradingView di merge_poc_supertrend.py.
+
+
+def _to_2d(x):
+    arr = np.asarray(x, dtype=float)
+    if arr.ndim == 1:
+        return arr[:, None]
+    return arr
+
+
+def _wrap(out, like):
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(out, index=like.index, columns=like.columns)
+    if isinstance(like, pd.Series):
+        return pd.Series(out[:, 0], index=like.index, name=like.name)
+    if np.ndim(like) == 1:
+        return out[:, 0]
+    return out
+
+
+def _ewm_adjust_false(arr, alpha, min_periods=0):
+    """
+    Stessa ricorsione di pandas ewm(alpha=..., adjust=False).mean() con
+    ignore_na=False: i NaN iniziali vengono saltati, quelli intermedi
+    ripetono l'ultimo valore e riducono il peso della media precedente.
+    """
+    n, m = arr.shape
+    out = np.full((n, m), np.nan)
+    if n == 0:
+        return out
+
+    minp = max(min_periods, 1)
+    old_wt_factor = 1.0 - alpha
+    weighted = arr[0].copy()
+    old_wt = np.ones(m)
+    nobs = (~np.isnan(arr[0])).astype(int)
+    out[0] = np.where(nobs >= minp, weighted, np.nan)
+
+    for i in range(1, n):
+        cur = arr[i]
+        is_obs = ~np.isnan(cur)
+        nobs += is_obs
+        started = ~np.isnan(weighted)
+
+        # Serie già avviate: il peso decade anche sui NaN
+        old_wt = np.where(started, old_wt * old_wt_factor, old_wt)
+        upd = started & is_obs & (weighted != cur)
+        blended = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(upd, blended, weighted)
+        old_wt = np.where(started & is_obs, 1.0, old_wt)
+
+        # Prima osservazione valida: la serie parte da qui
+        weighted = np.where(~started & is_obs, cur, weighted)
+
+        out[i] = np.where(nobs >= minp, weighted, np.nan)
+
+    return out
+
+
+def shift(x, periods=1):
+    arr = _to_2d(x)
+    out = np.full(arr.shape, np.nan)
+    if periods >= 0:
+        out[periods:] = arr[:len(arr) - periods]
+    else:
+        out[:periods] = arr[-periods:]
+    return _wrap(out, x)
+
+
+def ema(x, span=None, alpha=None, min_periods=0):
+    """
+    Media esponenziale (adjust=False), come pandas ewm(...).mean().
+    """
+    if alpha is None:
+        alpha = 2.0 / (span + 1.0)
+    return _wrap(_ewm_adjust_false(_to_2d(x), alpha, min_periods), x)
+
+
+def rma(x, period, min_periods=0):
+    # Media di Wilder / RMA di TradingView
+    return ema(x, alpha=1.0 / period, min_periods=min_periods)
+
+
+def sma(x, window):
+    """
+    Media mobile semplice: NaN finché la finestra non è piena o se contiene NaN
+    (come pandas rolling(window).mean()).
+    """
+    arr = _to_2d(x)
+    n = len(arr)
+    out = np.full(arr.shape, np.nan)
+    if n >= window:
+        valid = ~np.isnan(arr)
+        csum = np.cumsum(np.where(valid, arr, 0.0), axis=0)
+        ccount = np.cumsum(valid, axis=0)
+        csum = np.vstack([np.zeros((1, arr.shape[1])), csum])
+        ccount = np.vstack([np.zeros((1, arr.shape[1])), ccount])
+        sums = csum[window:] - csum[:-window]
+        counts = ccount[window:] - ccount[:-window]
+        out[window - 1:] = np.where(counts == window, sums / window, np.nan)
+    return _wrap(out, x)
+
+
+def _rolling(x, window, reducer):
+    arr = _to_2d(x)
+    out = np.full(arr.shape, np.nan)
+    if len(arr) >= window:
+        view = np.lib.stride_tricks.sliding_window_view(arr, window, axis=0)
+        # reducer propaga i NaN: finestra con NaN → NaN, come pandas
+        out[window - 1:] = reducer(view, axis=-1)
+    return _wrap(out, x)
+
+
+def rolling_min(x, window):
+    return _rolling(x, window, np.min)
+
+
+def rolling_max(x, window):
+    return _rolling(x, window, np.max)
+
+
+def wilder_rsi(close, period=14, seed="rma"):
+    """
+    RSI di Wilder.
+
+    seed="rma": come compute_rsi_rma di rsi_divergence.py (TradingView),
+                la media parte dalla prima differenza valida.
+    seed="ta":  come ta.momentum.RSIIndicator (prima differenza = 0,
+                min_periods=period, RSI=100 quando la media delle perdite è 0).
+                Nei pannelli le righe prima del primo close valido di ogni
+                colonna restano NaN, così ogni ticker parte dalla sua storia.
+    """
+    arr = _to_2d(close)
+    delta = np.full(arr.shape, np.nan)
+    delta[1:] = arr[1:] - arr[:-1]
+    before_start = np.cumsum(~np.isnan(arr), axis=0) == 0
+
+    alpha = 1.0 / period
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if seed == "ta":
+            gain = np.where(before_start, np.nan, np.where(delta > 0, delta, 0.0))
+            loss = np.where(before_start, np.nan, np.where(delta < 0, -delta, 0.0))
+            avg_gain = _ewm_adjust_false(gain, alpha, min_periods=period)
+            avg_loss = _ewm_adjust_false(loss, alpha, min_periods=period)
+            rsi = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+        elif seed == "rma":
+            gain = np.where(np.isnan(delta), np.nan, np.maximum(delta, 0.0))
+            loss = np.where(np.isnan(delta), np.nan, -np.minimum(delta, 0.0))
+            avg_gain = _ewm_adjust_false(gain, alpha)
+            avg_loss = _ewm_adjust_false(loss, alpha)
+            rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+        else:
+            raise ValueError(f"seed RSI non valido: {seed}")
+
+    return _wrap(rsi, close)
+
+
+def true_range(high, low, close):
+    # TR dalla seconda barra in poi (riga 0 = NaN)
+    high, low, close = _to_2d(high), _to_2d(low), _to_2d(close)
+    tr = np.full(close.shape, np.nan)
+    prev_close = close[:-1]
+    tr[1:] = np.maximum(
+        high[1:] - low[1:],
+        np.maximum(np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close))
+    )
+    return tr
+
+
+def _atr_2d(high, low, close, period):
+    tr = true_range(high, low, close)
+    n, m = tr.shape
+    atr = np.full((n, m), np.nan)
+
+    # Seed: media dei primi `period` TR validi di ogni colonna, posta sulla
+    # barra dell'ultimo TR usato
+    valid = ~np.isnan(tr)
+    first_tr = np.where(valid.any(axis=0), valid.argmax(axis=0), n)
+    seed_rows = first_tr + period - 1
+    for j in range(m):
+        if seed_rows[j] < n:
+            atr[seed_rows[j], j] = tr[first_tr[j]:seed_rows[j] + 1, j].mean()
+
+    for i in range(1, n):
+        running = i > seed_rows
+        if running.any():
+            atr[i] = np.where(running, (atr[i - 1] * (period - 1) + tr[i]) / period, atr[i])
+
+    return atr
+
+
+def atr(high, low, close, period=14):
+    """
+    ATR di Wilder allineato a TradingView (seed = media dei primi `period` TR).
+    """
+    return _wrap(_atr_2d(high, low, close, period), close)
+
+
+def _supertrend_2d(high, low, close, atr_2d, multiplier):
+    # multiplier: scalare oppure un valore per colonna (shape (m,))
+    n, m = close.shape
+    multiplier = np.asarray(multiplier, dtype=float)
+    hl2 = (high + low) / 2
+    upper_basic = hl2 + multiplier * atr_2d
+    lower_basic = hl2 - multiplier * atr_2d
+
+    upper_final = upper_basic.copy()
+    lower_final = lower_basic.copy()
+    st = np.full((n, m), np.nan)
+    direction = np.ones((n, m))
+
+    has_atr = ~np.isnan(atr_2d)
+    first = np.where(has_atr.any(axis=0), has_atr.argmax(axis=0), n)
+    cols = np.arange(m)
+    ok = first < n
+    st[first[ok], cols[ok]] = lower_final[first[ok], cols[ok]]
+
+    for i in range(1, n):
+        active = i > first
+        if not active.any():
+            continue
+
+        uf = np.where(
+            close[i - 1] <= upper_final[i - 1],
+            np.minimum(upper_basic[i], upper_final[i - 1]),
+            upper_basic[i]
+        )
+        lf = np.where(
+            close[i - 1] >= lower_final[i - 1],
+            np.maximum(lower_basic[i], lower_final[i - 1]),
+            lower_basic[i]
+        )
+        upper_final[i] = np.where(active, uf, upper_final[i])
+        lower_final[i] = np.where(active, lf, lower_final[i])
+
+        d = np.where(
+            close[i] > upper_final[i - 1], 1,
+            np.where(close[i] < lower_final[i - 1], -1, direction[i - 1])
+        )
+        direction[i] = np.where(active, d, direction[i])
+        st[i] = np.where(active, np.where(direction[i] == 1, lower_final[i], upper_final[i]), st[i])
+
+    # Prima del primo valore utile la linea resta piatta (come la versione TV)
+    for j in cols[ok]:
+        st[:first[j], j] = st[first[j], j]
+
+    return st, direction
+
+
+def supertrend(high, low, close, period=10, multiplier=3.0, return_direction=False):
+    """
+    SuperTrend allineato a TradingView. Con return_direction=True restituisce
+    anche la direzione (+1 rialzista, -1 ribassista).
+    """
+    h, l, c = _to_2d(high), _to_2d(low), _to_2d(close)
+    st, direction = _supertrend_2d(h, l, c, _atr_2d(h, l, c, period), multiplier)
+    if return_direction:
+        return _wrap(st, close), _wrap(direction, close)
+    return _wrap(st, close)
+
+
+def supertrend_grid(high, low, close, period=10, multipliers=(3.0,), atr_2d=None):
+    """
+    SuperTrend per più moltiplicatori con un solo ATR e una sola ricorsione:
+    ogni (colonna, moltiplicatore) diventa una colonna del pannello interno.
+    Restituisce (st, direction) come array (n, m, k), oppure (n, k) se
+    l'input è 1-D; k = len(multipliers). atr_2d permette di riusare un ATR
+    già calcolato per lo stesso periodo.
+    """
+    h, l, c = _to_2d(high), _to_2d(low), _to_2d(close)
+    if atr_2d is None:
+        atr_2d = _atr_2d(h, l, c, period)
+    mults = np.asarray(multipliers, dtype=float)
+    n, m = c.shape
+    k = len(mults)
+
+    def grid(a):
+        return np.repeat(a, k, axis=1)
+
+    st, direction = _supertrend_2d(grid(h), grid(l), grid(c), grid(_to_2d(atr_2d)), np.tile(mults, m))
+    st, direction = st.reshape(n, m, k), direction.reshape(n, m, k)
+    if np.ndim(close) == 1:
+        return st[:, 0, :], direction[:, 0, :]
+    return st, direction
+
+
+def last_flip(direction):
+    """
+    Indice dell'ultima barra in cui la direzione cambia, per colonna
+    (-1 se non cambia mai). Accetta direction 1-D o n × ...
+    """
+    d = np.asarray(direction)
+    flipped = d[1:] != d[:-1]
+    if len(flipped) == 0:
+        return np.full(d.shape[1:], -1)
+    idx = len(flipped) - np.argmax(flipped[::-1], axis=0)
+    return np.where(flipped.any(axis=0), idx, -1)
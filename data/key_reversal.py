@@ -2,102 +2,295 @@
 # KEY REVERSAL WEEKLY / GITHUB ACTIONS
 # --------------------------
 
-import yfinance as yf
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
-import ta
+from datetime import timedelta
 import sys
 import os
-
-# ✅ DEFINIZIONE WEEK NUMBER (UNICA AGGIUNTA)
-week_number = datetime.utcnow().isocalendar().week
+import argparse
+import numpy as np
 
 # === Importa funzione get_all_tickers da my_tickers.py ===
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
 
 from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from indicators import wilder_rsi, shift, rolling_min, rolling_max
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import Checkpoint, NegativeCache, add_scan_args, configure, download
+from snapshot import run_datetime, run_tag, run_week
+from incremental import ResultCache, fingerprint, write_delta
+from sharding import Shard
+from report_writer import write_excel
+from memory_guard import MemoryGuard, categorize
+
+metrics = RunMetrics("key_reversal")
 
 # =========================
-# Recupera tutti i ticker con indice
+# Key reversal su un singolo ticker
 # =========================
-ticker_dict = get_all_tickers(flat=False)
-ticker_to_index = {}
-for idx_name, tickers in ticker_dict.items():
-    for t in tickers:
-        if t in ticker_to_index:
-            ticker_to_index[t] += f", {idx_name}"
-        else:
-            ticker_to_index[t] = idx_name
+def key_reversal_ticker(ticker, lookback=2, rsi_period=9, cutoff_date=None, neg_cache=None, cache=None):
+    if cutoff_date is None:
+        cutoff_date = run_datetime() - timedelta(days=30)
+
+    with metrics.timed("download"):
+        df = download(
+            ticker,
+            metrics=metrics,
+            period="2y",
+            interval="1wk",
+            group_by='ticker',
+            auto_adjust=False
+        )
+    if df.empty:
+        metrics.fail("no_data")
+        if neg_cache is not None:
+            neg_cache.record_failure(ticker, "no_data")
+        return []
+    if neg_cache is not None:
+        neg_cache.record_success(ticker)
+
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(1)
+    elif any(ticker in col for col in df.columns):
+        df.columns = [col.split('.')[-1] for col in df.columns]
+
+    df.index = pd.to_datetime(df.index)
+
+    # Barre settimanali invariate: stessi segnali, va solo riapplicato il cutoff
+    if cache is not None:
+        fp = fingerprint(df)
+        rows = cache.get(ticker, fp)
+        if rows is not None:
+            return [r for r in rows if pd.Timestamp(r["Date"]) - timedelta(days=4) >= cutoff_date]
+
+    with metrics.timed("compute"):
+        # Stessa inizializzazione di ta.momentum.RSIIndicator
+        df["RSI"] = wilder_rsi(df["Close"], rsi_period, seed="ta")
 
-all_tickers = list(ticker_to_index.keys())
-print(f"Trovati {len(all_tickers)} ticker tra tutti gli indici")
+        df["Close_1"] = df["Close"].shift(1)
+        df["Low_1n"] = df["Low"].shift(1).rolling(lookback).min()
+        df["High_1n"] = df["High"].shift(1).rolling(lookback).max()
+
+        df["KR_Up"] = (
+            (df["Low"] < df["Low_1n"]) &
+            (df["Close"] > df["Close_1"]) &
+            (df["RSI"] < 30)
+        )
+
+        df["KR_Down"] = (
+            (df["High"] > df["High_1n"]) &
+            (df["Close"] < df["Close_1"]) &
+            (df["RSI"] > 70)
+        )
+
+    signals = df[(df["KR_Up"]) | (df["KR_Down"])].copy()
+    signals = signals[signals.index >= cutoff_date]
+
+    rows = []
+    for date, row in signals.iterrows():
+        rows.append({
+            "Ticker": ticker,
+            "Date": (pd.to_datetime(date) + timedelta(days=4)).strftime("%Y-%m-%d"),
+            "Signal": "Rialzista" if row["KR_Up"] else "Ribassista"
+        })
+    if cache is not None:
+        cache.put(ticker, fp, rows)
+    return rows
 
 # =========================
 # Funzione analyze_key_reversal
 # =========================
-def analyze_key_reversal(tickers):
+def analyze_key_reversal(tickers, checkpoint=None, neg_cache=None, guard=None, cache=None, shard=None):
+    # Con shard (richiede checkpoint): None per uno shard parziale
     lookback = 2
     rsi_period = 9
-    cutoff_date = datetime.today() - timedelta(days=30)
+    cutoff_date = run_datetime() - timedelta(days=30)
     results = []
+    scan_tickers = shard.select(tickers) if shard is not None else tickers
+    metrics.tickers_total = len(scan_tickers) if shard is not None and shard.partial else len(tickers)
+    metrics.start("scan")
 
-    for ticker in tickers:
+    for ticker in scan_tickers:
+        metrics.ticker_done()
+        if guard is not None:
+            guard.tick()
+        if checkpoint is not None and ticker in checkpoint:
+            continue
+        if neg_cache is not None and neg_cache.should_skip(ticker):
+            metrics.fail("negative_cache_skip")
+            continue
+
+        rows = []
         try:
-            df = yf.download(
-                ticker,
-                period="2y",
+            rows = key_reversal_ticker(ticker, lookback, rsi_period, cutoff_date, neg_cache, cache)
+        except Exception as e:
+            print(f"Errore su {ticker}: {e}")
+            metrics.fail_exc(e)
+
+        if checkpoint is not None:
+            checkpoint.save(ticker, rows)
+        else:
+            results.extend(rows)
+
+    metrics.stop("scan")
+
+    if guard is not None:
+        guard.check()
+    if cache is not None:
+        cache.save(tickers)
+        metrics.tickers_reused = cache.hits
+    if shard is not None:
+        results = shard.finish(checkpoint.done, tickers)
+        if results is None:
+            return None
+    elif checkpoint is not None:
+        results = checkpoint.rows()
+
+    df_out = categorize(pd.DataFrame(results), ("Ticker", "Signal"))
+    if not df_out.empty:
+        print(df_out[["Ticker", "Date", "Signal"]])
+    else:
+        print("No signals found within the specified date range.")
+
+    return df_out
+
+# =========================
+# Modalità pannello: tutti i ticker in un'unica passata
+# =========================
+PANEL_BATCH = 200  # ticker per singola chiamata yf.download
+
+
+def download_weekly_panel(tickers, period="2y", batch_size=PANEL_BATCH, guard=None):
+    """
+    Scarica le barre settimanali a blocchi e restituisce le matrici
+    High/Low/Close allineate (righe = settimane, colonne = ticker), in float32.
+    """
+    fields = {"High": [], "Low": [], "Close": []}
+
+    for start in range(0, len(tickers), batch_size):
+        batch = list(tickers[start:start + batch_size])
+        with metrics.timed("download_batch"):
+            df = download(
+                batch,
+                metrics=metrics,
+                period=period,
                 interval="1wk",
-                progress=False,
                 group_by='ticker',
-                auto_adjust=False
-            )
-            if df.empty:
-                continue
-
-            if isinstance(df.columns, pd.MultiIndex):
-                df.columns = df.columns.get_level_values(1)
-            elif any(ticker in col for col in df.columns):
-                df.columns = [col.split('.')[-1] for col in df.columns]
-
-            df.index = pd.to_datetime(df.index)
-            df["RSI"] = ta.momentum.RSIIndicator(
-                close=df["Close"],
-                window=rsi_period
-            ).rsi()
-
-            df["Close_1"] = df["Close"].shift(1)
-            df["Low_1n"] = df["Low"].shift(1).rolling(lookback).min()
-            df["High_1n"] = df["High"].shift(1).rolling(lookback).max()
-
-            df["KR_Up"] = (
-                (df["Low"] < df["Low_1n"]) &
-                (df["Close"] > df["Close_1"]) &
-                (df["RSI"] < 30)
+                auto_adjust=False,
+                threads=True
             )
+        if df.empty:
+            continue
 
-            df["KR_Down"] = (
-                (df["High"] > df["High_1n"]) &
-                (df["Close"] < df["Close_1"]) &
-                (df["RSI"] > 70)
-            )
+        if not isinstance(df.columns, pd.MultiIndex):
+            df.columns = pd.MultiIndex.from_product([[batch[0]], df.columns])
 
-            signals = df[(df["KR_Up"]) | (df["KR_Down"])].copy()
-            signals = signals[signals.index >= cutoff_date]
+        for field, frames in fields.items():
+            frames.append(df.xs(field, axis=1, level=1).astype("float32"))
+        del df
+        if guard is not None:
+            guard.check()
 
-            for date, row in signals.iterrows():
-                results.append({
-                    "Ticker": ticker,
-                    "Date": (pd.to_datetime(date) + timedelta(days=4)).strftime("%Y-%m-%d"),
-                    "Signal": "Rialzista" if row["KR_Up"] else "Ribassista"
-                })
+    if not fields["Close"]:
+        empty = pd.DataFrame()
+        return empty, empty, empty
 
-        except Exception as e:
-            print(f"Errore su {ticker}: {e}")
+    panels = []
+    for field in ("High", "Low", "Close"):
+        panel = pd.concat(fields[field], axis=1).sort_index()
+        panel.index = pd.to_datetime(panel.index)
+        panels.append(panel)
+
+    # Solo ticker con almeno un close, nell'ordine richiesto
+    close = panels[2]
+    present = [t for t in tickers if t in close.columns and close[t].notna().any()]
+    return tuple(p.reindex(columns=present) for p in panels)
+
+
+def key_reversal_panel(high, low, close, lookback=2, rsi_period=9, cutoff_date=None):
+    """
+    KR_Up / KR_Down su matrici settimanali allineate, senza cicli per ticker.
+
+    Stesse regole di key_reversal_ticker: RSI(9) con seed di ta, estremi degli
+    ultimi `lookback` bar precedenti, segnali dal cutoff_date in poi e data
+    riportata a +4 giorni (venerdì della settimana). Le settimane mancanti per
+    un ticker (buchi dell'indice comune) non generano segnali e non entrano
+    in shift, estremi e RSI: ogni colonna viene compattata sulle proprie
+    barre, come la serie scaricata per il singolo ticker.
+    """
+    if cutoff_date is None:
+        cutoff_date = run_datetime() - timedelta(days=30)
+
+    h = high.to_numpy(dtype=float)
+    l = low.to_numpy(dtype=float)
+    c = close.to_numpy(dtype=float)
+
+    # Righe valide di ogni colonna in cima (ordine stabile), buchi in fondo
+    valid = ~(np.isnan(h) | np.isnan(l) | np.isnan(c))
+    order = np.argsort(~valid, axis=0, kind="stable")
+    h, l, c = (np.where(np.take_along_axis(valid, order, axis=0), np.take_along_axis(a, order, axis=0), np.nan)
+               for a in (h, l, c))
+
+    rsi = wilder_rsi(c, rsi_period, seed="ta")
+    close_1 = shift(c, 1)
+    low_1n = rolling_min(shift(l, 1), lookback)
+    high_1n = rolling_max(shift(h, 1), lookback)
+
+    with np.errstate(invalid="ignore"):
+        up = (l < low_1n) & (c > close_1) & (rsi < 30)
+        down = (h > high_1n) & (c < close_1) & (rsi > 70)
+
+    # Ritorno alle date dell'indice comune
+    kr_up = np.zeros_like(up)
+    kr_down = np.zeros_like(down)
+    np.put_along_axis(kr_up, order, up, axis=0)
+    np.put_along_axis(kr_down, order, down, axis=0)
+
+    recent = (close.index >= cutoff_date)[:, None]
+    hits = (kr_up | kr_down) & recent
+
+    # Ordine ticker → data, come il ciclo per ticker
+    t_idx, d_idx = np.nonzero(hits.T)
+    dates = (close.index[d_idx] + timedelta(days=4)).strftime("%Y-%m-%d")
+
+    return pd.DataFrame({
+        "Ticker": close.columns[t_idx],
+        "Date": dates,
+        "Signal": np.where(kr_up.T[t_idx, d_idx], "Rialzista", "Ribassista"),
+    })
+
+
+def analyze_key_reversal_panel(tickers, neg_cache=None, guard=None):
+    metrics.tickers_total = len(tickers)
+    if neg_cache is not None:
+        skipped = {t for t in tickers if neg_cache.should_skip(t)}
+        for _ in skipped:
+            metrics.fail("negative_cache_skip")
+        tickers = [t for t in tickers if t not in skipped]
+
+    metrics.start("scan")
+    high, low, close = download_weekly_panel(tickers, guard=guard)
+
+    present = set(close.columns)
+    for ticker in tickers:
+        metrics.ticker_done()
+        if ticker not in present:
+            metrics.fail("no_data")
+        if neg_cache is not None:
+            if ticker in present:
+                neg_cache.record_success(ticker)
+            else:
+                neg_cache.record_failure(ticker, "no_data")
+
+    with metrics.timed("compute"):
+        df_out = key_reversal_panel(high, low, close) if len(present) else pd.DataFrame(
+            columns=["Ticker", "Date", "Signal"]
+        )
+    metrics.stop("scan")
 
-    df_out = pd.DataFrame(results)
     if not df_out.empty:
         print(df_out[["Ticker", "Date", "Signal"]])
     else:
@@ -109,8 +302,43 @@ def analyze_key_reversal(tickers):
 # Esecuzione principale
 # =========================
 if __name__ == "__main__":
-    all_tickers = get_all_tickers()
-    df_results = analyze_key_reversal(all_tickers)
+    parser = argparse.ArgumentParser(description="Key reversal weekly")
+    parser.add_argument("--panel", action="store_true",
+                        help="Analizza tutto l'universo su un pannello settimanale in un'unica passata")
+    add_profile_args(parser)
+    add_scan_args(parser)
+    args = parser.parse_args()
+    configure(args)
+    if args.panel and (args.shard or args.merge_shards):
+        parser.error("--shard/--merge_shards non sono supportati con --panel")
+    week_number = run_week()
+    start_from_args(args, "key_reversal", week_number)
+
+    # Universo letto una sola volta qui (prima veniva scaricato anche all'import)
+    with metrics.stage("universe"):
+        all_tickers = limit_tickers(get_all_tickers(), args)
+
+    neg_cache = NegativeCache.from_args(args)
+    guard = MemoryGuard.from_args(args, metrics)
+    checkpoint = None
+    shard = None
+    if args.panel:
+        df_results = analyze_key_reversal_panel(all_tickers, neg_cache, guard)
+    else:
+        # Checkpoint + negative cache: un run interrotto riprende, i ticker morti si saltano
+        shard = Shard.from_args(args, f"key_reversal_{run_tag()}", week_number, metrics)
+        checkpoint = Checkpoint(shard.scoped(f"key_reversal_{run_tag()}"), resume=not args.no_resume)
+        cache = ResultCache.from_args("key_reversal", args)
+        df_results = analyze_key_reversal(all_tickers, checkpoint, neg_cache, guard, cache, shard)
+
+    if df_results is None:
+        # Shard parziale: delta ed Excel li scrive il merge
+        checkpoint.clear()
+        metrics.write(week_number)
+        sys.exit(0)
+
+    # Ticker con segnale entrati/usciti rispetto al run precedente
+    write_delta("key_reversal", df_results["Ticker"] if not df_results.empty else [], week_number)
 
     OUTPUT_DIR = os.path.join(BASE_DIR, "output")
     os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -121,5 +349,13 @@ if __name__ == "__main__":
         f"key_reversal_signals_week_{week_number}.xlsx"
     )
 
-    df_results.to_excel(output_file, index=False)
+    with metrics.stage("excel"):
+        write_excel(output_file, df_results, "Key reversal")
     print(f"✅ File salvato: {output_file}")
+
+    if checkpoint is not None:
+        checkpoint.clear()
+    if shard is not None:
+        shard.cleanup()
+
+    metrics.write(week_number)
@@ -0,0 +1,114 @@
+import ctypes
+import ctypes.util
+import gc
+import sys
+
+import pandas as pd
+
+from run_metrics import peak_rss_mb
+
+# =========================
+# LIMITE DI MEMORIA PER I RUN SU TUTTO L'UNIVERSO
+# =========================
+# I ticker vengono elaborati a blocchi di chunk_size: a fine blocco si
+# liberano i frame rimasti (gc + restituzione dell'heap al sistema) e si
+# misura l'RSS. max_rss_mb è un tetto: se anche dopo la pulizia l'RSS lo
+# supera, il run si ferma con un errore esplicito (il checkpoint è già
+# scritto ticker per ticker, il rilancio riprende da lì) invece di farsi
+# uccidere dall'OOM killer del runner senza report.
+
+CHUNK_SIZE = 100
+MAX_RSS_MB = 3072   # runner GitHub: 7 GB condivisi con i sottoprocessi
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c")) if sys.platform.startswith("linux") else None
+except OSError:
+    _libc = None
+
+
+def current_rss_mb():
+    """
+    RSS attuale del processo in MB (Linux); altrove il picco, che è un
+    limite superiore.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def release_memory():
+    # Raccoglie i cicli e restituisce al sistema le pagine libere dell'heap
+    gc.collect()
+    if _libc is not None and hasattr(_libc, "malloc_trim"):
+        _libc.malloc_trim(0)
+
+
+def categorize(df, columns=("Ticker", "Indice")):
+    """
+    Colonne di etichette ripetute (ticker, indice, settore...) come category.
+    """
+    for col in columns:
+        if col not in df.columns:
+            continue
+        # pandas >= 3 usa il dtype str per le stringhe, prima object
+        s = df[col]
+        if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            df[col] = s.astype("category")
+    return df
+
+
+class MemoryLimitExceeded(SystemExit):
+    """
+    RSS oltre --max_rss_mb. Deriva da SystemExit perché non venga
+    intercettata dagli `except Exception` dei cicli per ticker.
+    """
+
+
+class MemoryGuard:
+    """
+    Da chiamare con tick() dopo ogni ticker: ogni chunk_size ticker libera
+    la memoria e campiona l'RSS nelle metriche. check() solleva
+    MemoryLimitExceeded se l'RSS supera max_rss_mb (0 = nessun limite).
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, max_rss_mb=MAX_RSS_MB, metrics=None):
+        self.chunk_size = max(1, chunk_size)
+        self.max_rss_mb = max_rss_mb
+        self.metrics = metrics
+        self.count = 0
+        self._since_check = 0
+        if metrics is not None:
+            metrics.rss_limit_mb = max_rss_mb or None
+
+    @classmethod
+    def from_args(cls, args, metrics=None):
+        return cls(chunk_size=args.chunk_size, max_rss_mb=args.max_rss_mb, metrics=metrics)
+
+    def tick(self):
+        self.count += 1
+        self._since_check += 1
+        if self._since_check >= self.chunk_size:
+            self.check()
+
+    def check(self):
+        self._since_check = 0
+        release_memory()
+        rss = current_rss_mb()
+        if self.metrics is not None:
+            self.metrics.sample_rss(rss)
+
+        if self.max_rss_mb and rss is not None and rss > self.max_rss_mb:
+            if self.metrics is not None:
+                self.metrics.fail("rss_over_limit")
+                self.metrics.write()
+            raise MemoryLimitExceeded(
+                f"❌ RSS {rss:.0f} MB oltre --max_rss_mb {self.max_rss_mb:g} dopo {self.count} ticker: "
+                f"run interrotto. Il checkpoint è salvato, rilanciare con --chunk_size più "
+                f"piccolo o --max_rss_mb più alto"
+            )
+        return rss
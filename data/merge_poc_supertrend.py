@@ -1,9 +1,15 @@
 import os
+import sys
 import argparse
-from datetime import datetime
 import pandas as pd
-import yfinance as yf
-import numpy as np
+
+from run_metrics import RunMetrics
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import Checkpoint, add_scan_args, configure
+from snapshot import run_tag, run_week
+from sharding import Shard
+from memory_guard import MemoryGuard
+from supertrend_scan import result_cache, supertrend_rows, write_poc_st
 
 # =========================
 # PATH LOCALI
@@ -18,11 +24,18 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 parser = argparse.ArgumentParser()
 parser.add_argument("--poc_period", required=True)
 parser.add_argument("--soglia_poc", required=True)
+add_profile_args(parser)
+add_scan_args(parser)
 args = parser.parse_args()
+configure(args)
 
 poc_period = args.poc_period
 soglia_poc = args.soglia_poc
-week_number = datetime.now().isocalendar()[1]
+week_number = run_week()
+
+metrics = RunMetrics(f"poc_st_p{poc_period}_s{soglia_poc}", poc_period=poc_period, soglia_poc=soglia_poc)
+start_from_args(args, f"poc_st_p{poc_period}_s{soglia_poc}", week_number)
+guard = MemoryGuard.from_args(args, metrics)
 
 # =========================
 # FILE INPUT POC
@@ -37,7 +50,8 @@ print("📂 Carico:", poc_file_path)
 if not os.path.exists(poc_file_path):
     raise FileNotFoundError(f"❌ File POC non trovato: {poc_file_path}")
 
-df_poc = pd.read_excel(poc_file_path)
+with metrics.stage("load_poc"):
+    df_poc = pd.read_excel(poc_file_path)
 print("📊 Colonne POC:", list(df_poc.columns))
 
 # =========================
@@ -52,160 +66,57 @@ if ticker_col is None:
 print(f"✅ Colonna ticker usata: {ticker_col}")
 
 # =========================
-# PARAMETRI SUPERTREND (TV)
+# CALCOLO ST MULTI-TIMEFRAME (TV) in supertrend_scan
 # =========================
-ATR_PERIOD = 10
-MULTIPLIER = 3.0
+def analyze_ticker(ticker):
+    return supertrend_rows(ticker, metrics, results, ticker_col)
 
-# =========================
-# FUNZIONI SUPERTREND TV-ALIGNED
-# =========================
-def clean_df(df):
-    if df.empty:
-        return df
-
-    # ✅ FIX MINIMO per yfinance MultiIndex (causa errore Series)
-    if isinstance(df.columns, pd.MultiIndex):
-        df = df.droplevel(1, axis=1)
-
-    # sicurezza extra (non cambia logica)
-    df = df.rename(columns=lambda x: x.strip())
-
-    for col in ["High", "Low", "Close"]:
-        if col not in df.columns:
-            return pd.DataFrame()
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    return df.dropna(subset=["High", "Low", "Close"])
-
-def calculate_atr(high, low, close, period):
-    high, low, close = map(np.asarray, (high, low, close))
-
-    tr = np.maximum(
-        high[1:] - low[1:],
-        np.maximum(
-            np.abs(high[1:] - close[:-1]),
-            np.abs(low[1:] - close[:-1])
-        )
-    )
-
-    atr = np.full(len(close), np.nan)
-    atr[period] = tr[:period].mean()
-
-    for i in range(period + 1, len(close)):
-        atr[i] = (atr[i - 1] * (period - 1) + tr[i - 1]) / period
-
-    return atr
-
-def supertrend_tv(high, low, close, period, multiplier):
-    atr = calculate_atr(high, low, close, period)
-    if np.all(np.isnan(atr)):
-        return np.full(len(close), np.nan)
-
-    hl2 = (high + low) / 2
-    upper_basic = hl2 + multiplier * atr
-    lower_basic = hl2 - multiplier * atr
-
-    upper_final = np.copy(upper_basic)
-    lower_final = np.copy(lower_basic)
-    st = np.full(len(close), np.nan)
-    direction = np.ones(len(close))
-
-    first = np.where(~np.isnan(atr))[0][0]
-    st[first] = lower_final[first]
-
-    for i in range(first + 1, len(close)):
-        upper_final[i] = (
-            min(upper_basic[i], upper_final[i - 1])
-            if close[i - 1] <= upper_final[i - 1]
-            else upper_basic[i]
-        )
-        lower_final[i] = (
-            max(lower_basic[i], lower_final[i - 1])
-            if close[i - 1] >= lower_final[i - 1]
-            else lower_basic[i]
-        )
-
-        if close[i] > upper_final[i - 1]:
-            direction[i] = 1
-        elif close[i] < lower_final[i - 1]:
-            direction[i] = -1
-        else:
-            direction[i] = direction[i - 1]
-
-        st[i] = lower_final[i] if direction[i] == 1 else upper_final[i]
-
-    st[:first] = st[first]
-    return st
-
-def compute_st_and_delta(df):
-    df = clean_df(df)
-    if len(df) < ATR_PERIOD * 3:
-        return np.nan, np.nan, np.nan
-
-    st = supertrend_tv(
-        df["High"].values,
-        df["Low"].values,
-        df["Close"].values,
-        ATR_PERIOD,
-        MULTIPLIER
-    )
-
-    # ✅ FIX MINIMO: evita Series invece di float
-    st_last = float(st[-1]) if np.ndim(st) == 1 else float(st.iloc[-1])
-    close_last = float(df["Close"].iloc[-1])
-
-    if st_last <= 0 or np.isnan(st_last):
-        return np.nan, close_last, np.nan
-
-    delta = (close_last - st_last) / st_last * 100
-    return st_last, close_last, delta
 
-# =========================
-# CALCOLO ST MULTI-TIMEFRAME (TV)
-# =========================
-rows = []
+tickers = limit_tickers(list(df_poc[ticker_col].dropna().astype(str).unique()), args)
+metrics.tickers_total = len(tickers)
 
-tickers = df_poc[ticker_col].dropna().astype(str).unique()
+# --shard i/N / --merge_shards N sui ticker del file POC (già unito)
+shard = Shard.from_args(args, f"poc_st_p{poc_period}_s{soglia_poc}_{run_tag()}", week_number, metrics)
+scan_tickers = shard.select(tickers)
+if shard.partial:
+    metrics.tickers_total = len(scan_tickers)
 
-for ticker in tickers:
-    try:
-        df_4h = yf.download(ticker, period="120d", interval="4h", auto_adjust=False, progress=False)
-        df_d  = yf.download(ticker, period="1y",   interval="1d", auto_adjust=False, progress=False)
-        df_w  = yf.download(ticker, period="5y",   interval="1wk", auto_adjust=False, progress=False)
-        df_m  = yf.download(ticker, period="10y",  interval="1mo", auto_adjust=False, progress=False)
-
-        _, _, delta_4h = compute_st_and_delta(df_4h)
-        _, _, delta_d  = compute_st_and_delta(df_d)
-        _, _, delta_w  = compute_st_and_delta(df_w)
-        _, _, delta_m  = compute_st_and_delta(df_m)
-
-        rows.append({
-            ticker_col: ticker,
-            "ST_4H_Delta%": round(delta_4h, 2),
-            "ST_Daily_Delta%": round(delta_d, 2),
-            "ST_Weekly_Delta%": round(delta_w, 2),
-            "ST_Monthly_Delta%": round(delta_m, 2),
-        })
+# Checkpoint: un run interrotto riprende dai ticker mancanti
+checkpoint = Checkpoint(shard.scoped(f"poc_st_p{poc_period}_s{soglia_poc}_{run_tag()}"), resume=not args.no_resume)
+# SuperTrend non dipende dalla config POC: cache condivisa tra le config
+results = result_cache(args)
+metrics.start("scan")
 
+for ticker in scan_tickers:
+    metrics.ticker_done()
+    guard.tick()
+    if ticker in checkpoint:
+        continue
+    try:
+        checkpoint.save(ticker, analyze_ticker(ticker))
     except Exception as e:
         print(f"⚠️ Errore su {ticker}: {e}")
+        metrics.fail_exc(e)
+        checkpoint.save(ticker)
 
-df_st = pd.DataFrame(rows)
+metrics.stop("scan")
+guard.check()
+results.save()
+metrics.tickers_reused = results.hits
 
-# =========================
-# MERGE
-# =========================
-df_final = df_poc.merge(df_st, on=ticker_col, how="left")
+st_rows = shard.finish(checkpoint.done, tickers)
+if st_rows is None:
+    # Shard parziale: merge ed Excel al --merge_shards
+    checkpoint.clear()
+    metrics.write(week_number)
+    sys.exit(0)
 
 # =========================
-# EXPORT
+# MERGE + EXPORT
 # =========================
-output_file_path = os.path.join(
-    OUTPUT_DIR,
-    f"POC_ST_p{poc_period}_s{soglia_poc}_week_{week_number}.xlsx"
-)
+write_poc_st(df_poc, pd.DataFrame(st_rows), ticker_col, poc_period, soglia_poc, week_number, metrics)
 
-df_final.to_excel(output_file_path, index=False)
+checkpoint.clear()
+shard.cleanup()
 
-print(f"\n✅ File POC + SuperTrend creato con successo:\n{output_file_path}")
+metrics.write(week_number)
@@ -2,8 +2,11 @@ import requests
 import pandas as pd
 from io import StringIO
 
+from security_master import SecurityMaster
+import snapshot
 
-def get_tickers_from_wiki(url, column_name, suffix="", manual_list=None):
+
+def get_tickers_from_wiki(url, column_name, manual_list=None):
     try:
         headers = {"User-Agent": "Mozilla/5.0"}
         response = requests.get(url, headers=headers, timeout=10)
@@ -12,26 +15,11 @@ def get_tickers_from_wiki(url, column_name, suffix="", manual_list=None):
         html = response.text
         tables = pd.read_html(StringIO(html))  # ✅ FIX CRITICO
 
-        exceptions_no_suffix = ["MT.AS"]
-
         for table in tables:
             if column_name in table.columns:
-                tickers = []
-                for t in table[column_name].dropna().unique():
-                    ticker = str(t).strip()
-
-                    if ticker in ["BRK.B", "BF.B"]:
-                        tickers.append(ticker.replace(".", "-"))
-                        continue
-
-                    ticker = ticker.replace("-", ".")
-
-                    if ticker not in exceptions_no_suffix:
-                        known_suffixes = [".DE", ".PA", ".MI"]
-                        if suffix and not any(ticker.endswith(s) for s in known_suffixes):
-                            ticker += suffix
-
-                    tickers.append(ticker)
+                # Grafie della fonte così come sono: la normalizzazione
+                # (BRK.B → BRK-B, suffisso di borsa...) la fa il security master
+                tickers = [str(t).strip() for t in table[column_name].dropna().unique()]
 
                 if tickers:
                     return tickers
@@ -70,35 +58,44 @@ def get_all_tickers(flat=True):
         "HO.PA","TTE.PA","URW.PA","VIE.PA","DG.PA","VIV.PA"
     ]
 
-    all_tickers = {}
-
-    all_tickers["sp500"] = get_tickers_from_wiki(
-        "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies", "Symbol"
-    )
-
-    all_tickers["nasdaq100"] = get_tickers_from_wiki(
-        "https://en.wikipedia.org/wiki/NASDAQ-100", "Ticker"
-    )
+    # indice → (url, colonna, suffisso di borsa di default, fallback manuale)
+    sources = {
+        "sp500": ("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies", "Symbol", "", None),
+        "nasdaq100": ("https://en.wikipedia.org/wiki/NASDAQ-100", "Ticker", "", None),
+        "dax": ("https://en.wikipedia.org/wiki/DAX", "Ticker", ".DE", None),
+        "ftse_mib": ("https://en.wikipedia.org/wiki/FTSE_MIB", "Ticker", ".MI", ftse_mib_manual),
+        "cac40": ("https://en.wikipedia.org/wiki/CAC_40", "Ticker", ".PA", cac40_manual),
+    }
 
-    all_tickers["dax"] = get_tickers_from_wiki(
-        "https://en.wikipedia.org/wiki/DAX", "Ticker", suffix=".DE"
-    )
-
-    all_tickers["ftse_mib"] = get_tickers_from_wiki(
-        "https://en.wikipedia.org/wiki/FTSE_MIB", "Ticker", suffix=".MI", manual_list=ftse_mib_manual
-    )
-
-    all_tickers["cac40"] = get_tickers_from_wiki(
-        "https://en.wikipedia.org/wiki/CAC_40", "Ticker", suffix=".PA", manual_list=cac40_manual
-    )
-
-    all_tickers["extra"] = [
+    extra = [
         "^GSPC","^NDX","^GDAXI","GC=F","SI=F","CL=F","^VIX",
         "EURUSD=X","BTC-USD","ETH-USD",
         "CRCL","QUBT","SMR","NOVO-B.CO","P911.DE","PUM.DE",
         "ENPH","UPS","BABA","NIO","OKLO"
     ]
 
+    # Universo da Wikipedia (o dal bundle dello snapshot in replay)
+    raw_tickers = snapshot.recorded("universe", sorted(sources), lambda: {
+        name: get_tickers_from_wiki(url, col, manual_list=manual)
+        for name, (url, col, _, manual) in sources.items()
+    })
+    if raw_tickers is None:
+        raise FileNotFoundError("❌ Universo non presente nel bundle snapshot")
+    raw_tickers["extra"] = extra
+
+    # Tutte le grafie → simbolo canonico; le appartenenze agli indici
+    # ricaricati vengono riscritte, gli alias restano
+    master = SecurityMaster()
+    master.reset_memberships([name for name, tickers in raw_tickers.items() if tickers])
+
+    all_tickers = {}
+    for name, tickers in raw_tickers.items():
+        suffix = sources[name][2] if name in sources else ""
+        canonical = (master.register(t, name, suffix) for t in tickers)
+        all_tickers[name] = list(dict.fromkeys(canonical))
+
+    master.save()
+
     if flat:
         flat_list = sorted(set(t for sub in all_tickers.values() for t in sub))
         print("🔎 Totale ticker raccolti:", len(flat_list))
@@ -1,12 +1,21 @@
 # === Importa funzione get_all_tickers da my_tickers.py ===
 from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import Checkpoint, NegativeCache, add_scan_args, configure, download
+from snapshot import run_tag, run_week
+from incremental import ResultCache, fingerprint, write_delta
+from sharding import Shard
+from volume_profile import profile_stats, nearest_node
+from report_writer import write_excel
+from memory_guard import MemoryGuard, categorize
+from supertrend_scan import PIPELINE_WORKERS, SupertrendPipeline, result_cache, write_poc_st
  
 import pandas as pd
-import yfinance as yf
 import numpy as np
 import warnings
-from datetime import datetime
 import os
+import sys
 import argparse
  
 warnings.simplefilter('ignore', category=FutureWarning)
@@ -16,7 +25,17 @@ parser = argparse.ArgumentParser(description="POC all tickers")
 parser.add_argument("--poc_period", type=int, required=True, help="Periodo POC in anni (es. 5 = 5y)")
 parser.add_argument("--soglia_poc", type=int, required=True, help="Soglia distanza POC in percentuale")
 parser.add_argument("--debug_ticker", type=str, default=None, help="Ticker da usare per debug (es. P911.DE)")
+parser.add_argument("--log_bins", action="store_true", help="Bin del volume profile in scala logaritmica")
+parser.add_argument("--pipeline", action="store_true",
+                    help="Calcola subito il SuperTrend dei ticker che passano il filtro e scrive anche il file POC_ST")
+parser.add_argument("--st_workers", type=int, default=PIPELINE_WORKERS,
+                    help="Worker SuperTrend in modalità --pipeline")
+add_profile_args(parser)
+add_scan_args(parser)
 args = parser.parse_args()
+if args.pipeline and (args.shard or args.merge_shards):
+    parser.error("--pipeline non si usa con --shard/--merge_shards")
+configure(args)
 
 # Variabile debug
 debug_ticker = args.debug_ticker
@@ -25,11 +44,21 @@ debug_ticker = args.debug_ticker
 poc_period = f"{args.poc_period}y"   # ← conversione automatica in formato yfinance
 soglia_poc = args.soglia_poc
 filter_start_date = pd.to_datetime("2000-01-01")
+week_number = run_week()   # settimana della data --as_of in replay
+
+# === Ticker che falliscono run dopo run (delisted) ===
+neg_cache = NegativeCache.from_args(args)
+
+# === Metriche run (report JSON in data/output) ===
+metrics = RunMetrics(f"poc_p{poc_period}_s{soglia_poc}", poc_period=poc_period, soglia_poc=soglia_poc)
+start_from_args(args, f"poc_p{poc_period}_s{soglia_poc}")
+guard = MemoryGuard.from_args(args, metrics)
 
 # === Funzioni storiche ===
 def get_hist(ticker, period):
     try:
-        df = yf.download(ticker, period=period, progress=False)
+        with metrics.timed("download"):
+            df = download(ticker, metrics=metrics, period=period)
 
         # ✅ FIX MINIMO: gestione MultiIndex e colonne duplicate (LOW, BRK.B, ecc.)
         if isinstance(df.columns, pd.MultiIndex):
@@ -41,6 +70,7 @@ def get_hist(ticker, period):
         return df
     except Exception as e:
         print(f"Errore storico {ticker}: {e}")
+        metrics.fail("download_hist")
         return pd.DataFrame()
  
 def calculate_drawdowns(prices):
@@ -50,15 +80,28 @@ def calculate_drawdowns(prices):
     drawdown = (cummax - prices) / cummax * 100
     return drawdown.max(), drawdown.mean(), drawdown.iloc[-1]
  
-def get_poc_daily(ticker, period="5y", bins=200):
+def get_poc_bars(ticker, period="5y"):
     try:
-        df = yf.download(ticker, period=period, interval="1d", progress=False, auto_adjust=False)
+        with metrics.timed("download"):
+            df = download(ticker, metrics=metrics, period=period, interval="1d", auto_adjust=False)
         if df.empty:
+            metrics.fail("poc_no_data")
+            neg_cache.record_failure(ticker, "poc_no_data")
             return None
+        neg_cache.record_success(ticker)
     except Exception as e:
         print(f"Errore download POC data for {ticker}: {e}")
+        metrics.fail("download_poc")
         return None
- 
+    return df
+
+
+def get_poc_daily(ticker, df, bins=200):
+    with metrics.timed("compute"):
+        return _poc_from_df(df, ticker, bins)
+
+
+def _poc_from_df(df, ticker, bins):
     # ✅ FIX ROBUSTO COLONNE (LOW, MultiIndex, ticker strani)
     if isinstance(df.columns, pd.MultiIndex):
         df.columns = df.columns.get_level_values(0)
@@ -80,43 +123,25 @@ def get_poc_daily(ticker, period="5y", bins=200):
     # Check for required columns
     if 'High' not in df.columns or 'Low' not in df.columns or 'Volume' not in df.columns:
         print(f"Missing required columns (High, Low, Volume) for POC calculation on {ticker}")
+        metrics.fail("poc_missing_columns")
         return None
  
     price_min = df["Low"].min()
     price_max = df["High"].max()
     if price_min == price_max:
+        metrics.fail("poc_flat_range")
         return None
  
-    price_bins = np.linspace(price_min, price_max, bins)
-    volume_profile = np.zeros(len(price_bins) - 1)
- 
-    for _, row in df.iterrows():
-        if row["High"] > row["Low"] and row["Volume"] > 0:
-            low_bin_idx = np.searchsorted(price_bins, row["Low"], side='right') - 1
-            high_bin_idx = np.searchsorted(price_bins, row["High"], side='left')
- 
-            low_bin_idx = max(0, min(low_bin_idx, len(price_bins) - 2))
-            high_bin_idx = max(0, min(high_bin_idx, len(price_bins) - 1))
- 
-            if high_bin_idx > low_bin_idx:
-                bins_covered = np.arange(low_bin_idx, high_bin_idx)
-                vol_share = row["Volume"] / len(bins_covered)
-                volume_profile[bins_covered] += vol_share
-            elif high_bin_idx == low_bin_idx and low_bin_idx < len(price_bins) - 1:
-                volume_profile[low_bin_idx] += row["Volume"]
- 
-    if volume_profile.sum() == 0:
-        return None
- 
-    poc_index = np.argmax(volume_profile)
-    if poc_index >= len(price_bins) - 1:
-        poc_index = len(price_bins) - 2
- 
-    poc_price = (price_bins[poc_index] + price_bins[poc_index + 1]) / 2
-    return poc_price
+    # Profilo costruito in modo vettoriale (stesse regole del vecchio ciclo iterrows):
+    # POC, value area e nodi dallo stesso binning
+    stats = profile_stats(df["High"].values, df["Low"].values, df["Volume"].values, bins, args.log_bins)
+    if stats is None:
+        metrics.fail("poc_no_volume")
+    return stats
  
 # === Recupera tutti i ticker con indice ===
-ticker_dict = get_all_tickers(flat=False)
+with metrics.stage("universe"):
+    ticker_dict = get_all_tickers(flat=False)
 ticker_to_index = {}
 for idx_name, tickers in ticker_dict.items():
     for t in tickers:
@@ -125,84 +150,158 @@ for idx_name, tickers in ticker_dict.items():
         else:
             ticker_to_index[t] = idx_name
  
-all_tickers = list(ticker_to_index.keys())
+all_tickers = limit_tickers(list(ticker_to_index.keys()), args)
+metrics.tickers_total = len(all_tickers)
 print(f"Trovati {len(all_tickers)} ticker tra tutti gli indici")
  
-# === Ciclo principale sui ticker ===
-risultati = []
+# === Analisi singolo ticker ===
+def analyze_ticker(ticker):
+    df_poc = get_poc_bars(ticker, period=poc_period)
+    if df_poc is None:
+        return []
+
+    # Barre del periodo POC identiche al run precedente: stesse righe (anche
+    # prezzo attuale e drawdown dipendono dall'ultima barra giornaliera)
+    fp = fingerprint(df_poc)
+    rows = results.get(ticker, fp)
+    if rows is not None:
+        for row in rows:
+            row["Indice"] = ticker_to_index[ticker]
+        return rows
+    return results.put(ticker, fp, compute_ticker(ticker, df_poc))
+
+
+def compute_ticker(ticker, df_poc):
+    stats = get_poc_daily(ticker, df_poc)
+    if stats is None:
+        return []
+    poc_price = stats["poc"]
+
+    df_hist = get_hist(ticker, period="1d")
+    if df_hist.empty or "Close" not in df_hist.columns:
+        metrics.fail("hist_1d_empty")
+        return []
+
+    # ✅ FIX MINIMO: Close sempre Series
+    close_col = df_hist["Close"]
+    if isinstance(close_col, pd.DataFrame):
+        close_col = close_col.iloc[:, 0]
+    current_price = float(close_col.iloc[-1])
+
+    distanza_poc = (current_price - poc_price) / poc_price * 100
+
+    # === DEBUG OPZIONALE ===
+    if debug_ticker is not None and ticker == debug_ticker:
+        print(f"\n📊 DEBUG {ticker}")
+        print(f"Periodo POC      : {poc_period}")
+        print(f"POC              : {poc_price:.6f}")
+        print(f"Value area       : {stats['val']:.6f} - {stats['vah']:.6f}")
+        print(f"Prezzo attuale   : {current_price:.6f}")
+        print(f"Distanza POC %   : {distanza_poc:.6f}")
+        print(f"Soglia applicata : {soglia_poc}")
+        print("PASSA FILTRO     :", abs(distanza_poc) <= soglia_poc)
+        print("-" * 60)
+
+    if abs(distanza_poc) > soglia_poc:
+        return []
+
+    df_all = get_hist(ticker, period="max")
+    if df_all.empty or "Close" not in df_all.columns:
+        metrics.fail("hist_max_empty")
+        return []
+    df_filtered = df_all[df_all.index >= filter_start_date].copy()
+    if df_filtered.empty:
+        metrics.fail("hist_max_empty")
+        return []
+
+    close_prices = df_filtered["Close"]
+    if isinstance(close_prices, pd.DataFrame):
+        close_prices = close_prices.iloc[:, 0]
+    close_prices = close_prices.astype("float32")
+    del df_all, df_filtered  # lo storico completo serve solo per i Close
+
+    with metrics.timed("compute_drawdown"):
+        all_time_high = close_prices.max()
+        max_dd, avg_dd, current_dd = calculate_drawdowns(close_prices)
+
+    return [{
+        "Ticker": ticker,
+        "Indice": ticker_to_index[ticker],
+        "POC": poc_price,
+        "VAL": stats["val"],
+        "VAH": stats["vah"],
+        "HVN vicino": nearest_node(stats["hvn"], current_price),
+        "LVN vicino": nearest_node(stats["lvn"], current_price),
+        "Prezzo Attuale": current_price,
+        "Distanza POC %": distanza_poc,
+        "All Time High": float(all_time_high),
+        "Max Drawdown %": float(max_dd),
+        "Avg Drawdown %": float(avg_dd),
+        "Current Drawdown %": float(current_dd)
+    }]
  
-for ticker in all_tickers:
-    try:
-        poc_price = get_poc_daily(ticker, period=poc_period)
-        if poc_price is None:
-            continue
- 
-        df_hist = get_hist(ticker, period="1d")
-        if df_hist.empty or "Close" not in df_hist.columns:
-            continue
-
-        # ✅ FIX MINIMO: Close sempre Series
-        close_col = df_hist["Close"]
-        if isinstance(close_col, pd.DataFrame):
-            close_col = close_col.iloc[:, 0]
-        current_price = float(close_col.iloc[-1])
- 
-        distanza_poc = (current_price - poc_price) / poc_price * 100
-
-        # === DEBUG OPZIONALE ===
-        if debug_ticker is not None and ticker == debug_ticker:
-            print(f"\n📊 DEBUG {ticker}")
-            print(f"Periodo POC      : {poc_period}")
-            print(f"POC              : {poc_price:.6f}")
-            print(f"Prezzo attuale   : {current_price:.6f}")
-            print(f"Distanza POC %   : {distanza_poc:.6f}")
-            print(f"Soglia applicata : {soglia_poc}")
-            print("PASSA FILTRO     :", abs(distanza_poc) <= soglia_poc)
-            print("-" * 60)
- 
-        if abs(distanza_poc) <= soglia_poc:
-            df_all = get_hist(ticker, period="max")
-            if df_all.empty or "Close" not in df_all.columns:
-                continue
-            df_filtered = df_all[df_all.index >= filter_start_date].copy()
-            if df_filtered.empty:
-                continue
- 
-            close_prices = df_filtered["Close"]
-            if isinstance(close_prices, pd.DataFrame):
-                close_prices = close_prices.iloc[:, 0]
-
-            all_time_high = close_prices.max()
-            max_dd, avg_dd, current_dd = calculate_drawdowns(close_prices)
- 
-            risultati.append({
-                "Ticker": ticker,
-                "Indice": ticker_to_index[ticker],
-                "POC": poc_price,
-                "Prezzo Attuale": current_price,
-                "Distanza POC %": distanza_poc,
-                "All Time High": float(all_time_high),
-                "Max Drawdown %": float(max_dd),
-                "Avg Drawdown %": float(avg_dd),
-                "Current Drawdown %": float(current_dd)
-            })
+# === Ciclo principale sui ticker (checkpoint: un run interrotto riprende da qui) ===
+config_name = f"poc_p{poc_period}_s{soglia_poc}{'_log' if args.log_bins else ''}"
+# --shard i/N: solo una parte dell'universo; --merge_shards N: unisce le parti
+shard = Shard.from_args(args, f"{config_name}_{run_tag()}", week_number, metrics)
+scan_tickers = shard.select(all_tickers)
+if shard.partial:
+    metrics.tickers_total = len(scan_tickers)
+checkpoint = Checkpoint(shard.scoped(f"{config_name}_{run_tag()}"), resume=not args.no_resume)
+# Righe dei ticker con barre invariate dal run precedente
+results = ResultCache.from_args(config_name, args)
+# --pipeline: i ticker che passano il filtro vanno subito ai worker SuperTrend
+st_results = result_cache(args) if args.pipeline else None
+pipeline = SupertrendPipeline(metrics, st_results, args.st_workers) if args.pipeline else None
+metrics.start("scan")
  
+for ticker in scan_tickers:
+    metrics.ticker_done()
+    guard.tick()
+    if ticker in checkpoint:
+        if pipeline is not None and checkpoint.done[ticker]:
+            pipeline.submit(ticker)
+        continue
+    if neg_cache.should_skip(ticker):
+        metrics.fail("negative_cache_skip")
+        continue
+    try:
+        checkpoint.save(ticker, analyze_ticker(ticker))
     except Exception as e:
         print(f"Errore con {ticker}: {e}")
+        metrics.fail_exc(e)
+        checkpoint.save(ticker)
         continue
+    if pipeline is not None and checkpoint.done[ticker]:
+        pipeline.submit(ticker)
+
+# Attende i worker SuperTrend ancora al lavoro sulla coda
+st_by_ticker = pipeline.close() if pipeline is not None else None
+risultati = shard.finish(checkpoint.done, all_tickers)
+metrics.stop("scan")
+guard.check()
+results.save(ticker_to_index)
+metrics.tickers_reused = results.hits
+
+if risultati is None:
+    # Shard parziale: delta ed Excel li scrive il merge
+    checkpoint.clear()
+    metrics.write(week_number)
+    sys.exit(0)
  
 # === Risultati ===
-df_risultati = pd.DataFrame(risultati)
+df_risultati = categorize(pd.DataFrame(risultati))
  
 if df_risultati.empty:
     print("⚠ Nessun titolo ha passato i filtri sulla distanza dal POC o non ha dati storici sufficienti.")
 else:
     df_risultati = df_risultati.sort_values(by="Current Drawdown %", ascending=False)
     print(df_risultati.to_string())
+
+# === Ticker entrati/usciti dal filtro rispetto al run precedente ===
+write_delta(config_name, df_risultati["Ticker"] if not df_risultati.empty else [], week_number)
  
 # === Salvataggio file Excel ===
-week_number = datetime.now().isocalendar()[1]
-
 BASE = os.path.dirname(os.path.abspath(__file__))  # = data/
 OUTPUT_DIR = os.path.join(BASE, "output")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -210,6 +309,22 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 file_name = f"POC_p{poc_period}_s{soglia_poc}_week_{week_number}.xlsx"
 file_path = os.path.join(OUTPUT_DIR, file_name)
 
-df_risultati.to_excel(file_path, index=False)
+with metrics.stage("excel"):
+    write_excel(file_path, df_risultati, f"POC {poc_period} {soglia_poc}%")
 
 print(f"\n✅ File salvato (sovrascritto se esiste): {file_path}")
+
+# === Modalità pipeline: merge con il SuperTrend già calcolato ===
+if pipeline is not None:
+    st_results.save()
+if pipeline is not None and df_risultati.empty:
+    print("⚠ Pipeline: nessun ticker per il file POC + SuperTrend")
+elif pipeline is not None:
+    st_rows = [r for t in df_risultati["Ticker"] for r in st_by_ticker.get(t, ())]
+    write_poc_st(df_risultati, pd.DataFrame(st_rows), "Ticker", poc_period, soglia_poc, week_number, metrics)
+
+# Run completato: il checkpoint (e le parti degli shard) non servono più
+checkpoint.clear()
+shard.cleanup()
+
+metrics.write(week_number)
@@ -0,0 +1,218 @@
+# =========================
+# SWEEP POC (periodo × soglia)
+# =========================
+# Per ogni ticker scarica una sola volta le barre giornaliere del periodo più
+# lungo, calcola il POC di ogni periodo tagliando la stessa serie e confronta
+# in blocco le distanze con tutte le soglie. Risultato: una tabella lunga
+# ticker × periodo × soglia con esito del filtro e distanza dal POC.
+#
+#   python data/poc_sweep.py --periods 1,2,3,5,10,20 --soglie 3,5,10,15,20
+
+import argparse
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+warnings.simplefilter('ignore', category=FutureWarning)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from volume_profile import poc_price
+from bar_store import get_bars, slice_period
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import Checkpoint, NegativeCache, add_scan_args, configure
+from snapshot import run_tag, run_week
+from report_writer import write_report
+from sharding import Shard
+from memory_guard import MemoryGuard, categorize
+
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+POC_BINS = 200
+
+metrics = RunMetrics("poc_sweep")
+
+
+def parse_list(text, cast=int):
+    return sorted({cast(v) for v in text.split(",") if v.strip()})
+
+
+# =========================
+# POC di tutti i periodi su un ticker
+# =========================
+def poc_by_period(ticker, bars, periods):
+    """
+    Una riga per periodo: POC, prezzo attuale e distanza %. I periodi senza
+    POC valido (range piatto, volume nullo) vengono saltati.
+    """
+    current_price = float(bars["Close"].iloc[-1])
+    rows = []
+    for p in periods:
+        window = slice_period(bars, f"{p}y")
+        if window.empty:
+            continue
+        poc = poc_price(window["High"].values, window["Low"].values, window["Volume"].values, POC_BINS)
+        if poc is None:
+            metrics.fail("poc_no_volume")
+            continue
+        rows.append({
+            "Ticker": ticker,
+            "Periodo": p,
+            "POC": poc,
+            "Prezzo Attuale": current_price,
+            "Distanza POC %": (current_price - poc) / poc * 100,
+        })
+    return rows
+
+
+def analyze_ticker(ticker, periods, neg_cache=None):
+    try:
+        with metrics.timed("download"):
+            bars = get_bars(ticker, "1d", f"{max(periods)}y", auto_adjust=False, metrics=metrics)
+    except Exception as e:
+        print(f"Errore download {ticker}: {e}")
+        metrics.fail_exc(e)
+        return []
+
+    if bars.empty or not {"High", "Low", "Close", "Volume"} <= set(bars.columns):
+        metrics.fail("poc_no_data")
+        if neg_cache is not None:
+            neg_cache.record_failure(ticker, "poc_no_data")
+        return []
+    if neg_cache is not None:
+        neg_cache.record_success(ticker)
+
+    with metrics.timed("compute"):
+        return poc_by_period(ticker, bars, periods)
+
+
+# =========================
+# Confronto in blocco con tutte le soglie
+# =========================
+def apply_soglie(df_poc, soglie):
+    """
+    (ticker, periodo) × soglie → tabella lunga con colonna "Passa Filtro".
+    Stessa regola di poc_all_tickers.py: |distanza| <= soglia.
+    """
+    columns = list(df_poc.columns) + ["Soglia", "Passa Filtro"]
+    if df_poc.empty:
+        return pd.DataFrame(columns=columns)
+
+    soglie = np.asarray(soglie, dtype=float)
+    dist = df_poc["Distanza POC %"].to_numpy(dtype=float)
+    passa = np.abs(dist)[:, None] <= soglie[None, :]
+
+    df_long = df_poc.loc[df_poc.index.repeat(len(soglie))].reset_index(drop=True)
+    df_long["Soglia"] = np.tile(soglie, len(df_poc))
+    df_long["Passa Filtro"] = passa.ravel()
+    return df_long
+
+
+def summary_table(df_long):
+    # Quanti ticker passano per ogni combinazione periodo × soglia
+    if df_long.empty:
+        return pd.DataFrame()
+    return df_long.pivot_table(
+        index="Periodo", columns="Soglia", values="Passa Filtro", aggfunc="sum"
+    ).astype(int)
+
+
+# =========================
+# ESECUZIONE PRINCIPALE
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Sweep POC periodo × soglia")
+    parser.add_argument("--periods", type=str, default="1,2,3,5,10,20",
+                        help="Periodi POC in anni separati da virgola")
+    parser.add_argument("--soglie", type=str, default="3,5,10,15,20",
+                        help="Soglie distanza POC in percentuale separate da virgola")
+    add_profile_args(parser)
+    add_scan_args(parser)
+    args = parser.parse_args()
+    configure(args)
+    week_number = run_week()
+    start_from_args(args, "poc_sweep", week_number)
+
+    periods = parse_list(args.periods)
+    soglie = parse_list(args.soglie, float)
+    metrics.params = {"periods": periods, "soglie": soglie}
+    neg_cache = NegativeCache.from_args(args)
+
+    with metrics.stage("universe"):
+        ticker_dict = get_all_tickers(flat=False)
+    ticker_to_index = {}
+    for idx_name, tickers in ticker_dict.items():
+        for t in tickers:
+            if t in ticker_to_index:
+                ticker_to_index[t] += f", {idx_name}"
+            else:
+                ticker_to_index[t] = idx_name
+
+    all_tickers = limit_tickers(list(ticker_to_index.keys()), args)
+    metrics.tickers_total = len(all_tickers)
+    print(f"Trovati {len(all_tickers)} ticker tra tutti gli indici")
+    print(f"🔍 Sweep periodi {periods} × soglie {soglie}")
+
+    # Il checkpoint dipende solo dai periodi: le soglie si applicano alla fine
+    name = f"poc_sweep_p{'-'.join(map(str, periods))}_{run_tag()}"
+    shard = Shard.from_args(args, name, week_number, metrics)
+    scan_tickers = shard.select(all_tickers)
+    if shard.partial:
+        metrics.tickers_total = len(scan_tickers)
+    checkpoint = Checkpoint(shard.scoped(name), resume=not args.no_resume)
+    guard = MemoryGuard.from_args(args, metrics)
+    metrics.start("scan")
+
+    for ticker in scan_tickers:
+        metrics.ticker_done()
+        guard.tick()
+        if ticker in checkpoint:
+            continue
+        if neg_cache.should_skip(ticker):
+            metrics.fail("negative_cache_skip")
+            continue
+        checkpoint.save(ticker, analyze_ticker(ticker, periods, neg_cache))
+
+    metrics.stop("scan")
+    guard.check()
+
+    rows = shard.finish(checkpoint.done, all_tickers)
+    if rows is None:
+        # Shard parziale: soglie ed Excel li calcola il merge
+        checkpoint.clear()
+        metrics.write(week_number)
+        sys.exit(0)
+
+    with metrics.stage("soglie"):
+        df_poc = pd.DataFrame(rows)
+        if not df_poc.empty:
+            df_poc.insert(1, "Indice", df_poc["Ticker"].map(ticker_to_index))
+            # La tabella lunga ripete ogni etichetta per tutte le soglie
+            df_poc = categorize(df_poc)
+        df_long = apply_soglie(df_poc, soglie)
+        df_summary = summary_table(df_long)
+
+    print("\n📊 Ticker che passano il filtro (righe = periodo, colonne = soglia):")
+    print(df_summary.to_string() if not df_summary.empty else "⚠ Nessun POC calcolato.")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    file_path = os.path.join(OUTPUT_DIR, f"POC_sweep_week_{week_number}.xlsx")
+    with metrics.stage("excel"):
+        write_report(file_path, {"sweep": df_long, "riepilogo": df_summary},
+                     formats={"sweep": {"POC": "0.00", "Prezzo Attuale": "0.00"}})
+
+    print(f"\n✅ File salvato: {file_path}")
+
+    checkpoint.clear()
+    shard.cleanup()
+
+    metrics.write(week_number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# =========================
+# POC WALK-FORWARD + BACKTEST
+# =========================
+# Serie storica del POC "point in time": per ogni data di selezione il POC
+# delle sole barre giornaliere degli ultimi `poc_period` anni fino a quella
+# data, con lo stesso binning di poc_all_tickers.py (200 bin lineari sul
+# range della finestra, log con --log_bins), senza guardare avanti. Finché
+# minimo e massimo della finestra non cambiano la griglia resta la stessa e
+# il profilo si aggiorna solo con le barre che entrano ed escono; la griglia
+# si ricostruisce quando il range cambia. Risultato identico a
+# volume_profile.poc_price sulla finestra di ogni data.
+# La distanza dal POC usa il Close non aggiustato (la stessa scala delle
+# barre del POC, come in produzione); i rendimenti futuri usano l'Adj Close,
+# così split e dividendi non diventano rendimenti fittizi. Permette di
+# misurare la regola di selezione di poc_all_tickers.py
+# (|distanza POC| <= soglia) su tutto l'universo. Date di selezione e
+# orizzonti si contano sulle sedute di ogni ticker: crypto (7 giorni su 7)
+# e borse con festività diverse non si sporcano a vicenda.
+#
+#   python data/poc_walkforward.py --poc_period 2 --soglia_poc 3 --horizons 5,20,60
+
+import argparse
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+warnings.simplefilter('ignore', category=FutureWarning)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from bar_store import get_bars
+from volume_profile import bar_bins, poc_price, price_grid
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import NegativeCache, add_scan_args, configure
+from snapshot import run_week
+from report_writer import write_report
+from memory_guard import MemoryGuard
+
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+POC_BINS = 200    # come get_poc_daily di poc_all_tickers.py
+TIE_TOL = 1e-9    # bin entro questa tolleranza relativa dal massimo: POC ricalcolato da zero
+
+metrics = RunMetrics("poc_walkforward")
+
+
+# =========================
+# POC POINT-IN-TIME
+# =========================
+def window_extremes(low, high, start, end):
+    """
+    min(low[s:e]) e max(high[s:e]) per ogni finestra [start, end) non
+    vuota, con una sparse table: O(n log n) invece di O(n) per finestra.
+    """
+    mins, maxs = [low], [high]
+    width = 1
+    while 2 * width <= len(low):
+        mins.append(np.minimum(mins[-1][:-width], mins[-1][width:]))
+        maxs.append(np.maximum(maxs[-1][:-width], maxs[-1][width:]))
+        width *= 2
+
+    level = np.floor(np.log2(np.maximum(end - start, 1))).astype(int)
+    out_min = np.full(len(start), np.nan)
+    out_max = np.full(len(start), np.nan)
+    for j in np.unique(level):
+        k = np.flatnonzero((level == j) & (end > start))
+        right = end[k] - 2 ** j
+        out_min[k] = np.minimum(mins[j][start[k]], mins[j][right])
+        out_max[k] = np.maximum(maxs[j][start[k]], maxs[j][right])
+    return out_min, out_max
+
+
+def window_pocs(high, low, volume, price_bins, start, end, log_scale=False):
+    """
+    POC di finestre [start, end) consecutive (start ed end non decrescenti)
+    sulla stessa griglia, in un colpo solo: i contributi delle barre
+    (bar_bins) si calcolano una volta e ogni barra entra nel profilo alla
+    prima finestra che la contiene ed esce alla prima che la esclude, quindi
+    il profilo di un giorno è quello del giorno prima più le barre entrate
+    meno quelle uscite. Le posizioni senza estremi di barre nella finestra
+    tornano a zero esatto, così i bin alla pari restano alla pari; un
+    massimo ambiguo entro TIE_TOL (residui di arrotondamento) si ricalcola
+    con poc_price.
+    """
+    b0, b1 = start[0], end[-1]
+    m, n = len(start), len(price_bins)
+    rows, lo, stop, share = bar_bins(price_bins, high[b0:b1], low[b0:b1], volume[b0:b1])
+    bars = rows + b0
+    enter = np.searchsorted(end, bars, side="right")     # prima finestra con la barra
+    leave = np.searchsorted(start, bars, side="right")   # prima finestra senza
+    keep = enter < leave
+    enter, leave, lo, stop, share = enter[keep], leave[keep], lo[keep], stop[keep], share[keep]
+
+    # Eventi per giorno (riga m = dopo l'ultima finestra), poi somma cumulata sui giorni
+    diff = np.zeros((m + 1, n))
+    covered = np.zeros((m + 1, n), dtype=np.int32)
+    edges = np.zeros((m + 1, n), dtype=np.int32)
+    for row, sign in ((enter, 1), (leave, -1)):
+        np.add.at(diff, (row, lo), sign * share)
+        np.add.at(diff, (row, stop), -sign * share)
+        np.add.at(covered, (row, lo), sign)
+        np.add.at(covered, (row, stop), -sign)
+        np.add.at(edges, (row, lo), sign)
+        np.add.at(edges, (row, stop), sign)
+    for a in (diff, covered, edges):
+        np.cumsum(a, axis=0, out=a)
+
+    diff, covered, edges = diff[:m], covered[:m], edges[:m]
+    diff[edges == 0] = 0.0
+    profile = np.cumsum(diff[:, :-1], axis=1)
+    profile[np.cumsum(covered[:, :-1], axis=1) == 0] = 0.0
+
+    top = profile.max(axis=1)
+    idx = np.minimum(profile.argmax(axis=1), n - 2)
+    out = (price_bins[idx] + price_bins[idx + 1]) / 2
+    out[top <= 0] = np.nan
+    ties = (top > 0) & (np.count_nonzero(profile >= (top * (1 - TIE_TOL))[:, None], axis=1) > 1)
+    for k in np.flatnonzero(ties):
+        sl = slice(start[k], end[k])
+        poc = poc_price(high[sl], low[sl], volume[sl], n, log_scale)
+        out[k] = np.nan if poc is None else poc
+    return out
+
+
+def rolling_poc(df, poc_period=2, dates=None, bins=POC_BINS, log_scale=False):
+    """
+    POC point-in-time alle date richieste (default: tutte le date di df).
+    Per ogni data usa solo le barre degli ultimi poc_period anni fino a
+    quella data inclusa, con il binning della finestra come in produzione
+    (stesso risultato di volume_profile.poc_price sulla finestra). NaN
+    finché la storia non copre un intero periodo o se la finestra non ha
+    volume.
+    """
+    df = df.dropna(subset=["High", "Low", "Volume"])
+    if df.empty:
+        return pd.Series(dtype=float)
+
+    high = df["High"].to_numpy(dtype=float)
+    low = df["Low"].to_numpy(dtype=float)
+    volume = df["Volume"].to_numpy(dtype=float)
+    index = df.index
+    dates = index if dates is None else pd.DatetimeIndex(dates).sort_values()
+
+    # Finestra [start, end) di ogni data: come slice_period(bars, "Ny") a quella data
+    offset = pd.DateOffset(years=poc_period)
+    end = np.searchsorted(index, dates, side="right")
+    start = np.searchsorted(index, dates - offset, side="left")
+    ready = ((dates - offset) >= index[0]) & (end > start)
+    range_min, range_max = window_extremes(low, high, start, end)
+
+    # Date consecutive con lo stesso range della finestra: stessa griglia,
+    # un solo calcolo vettoriale (window_pocs)
+    out = np.full(len(dates), np.nan)
+    ks = np.flatnonzero(ready & (range_min < range_max))
+    if len(ks):
+        new = np.r_[True, (range_min[ks[1:]] != range_min[ks[:-1]]) | (range_max[ks[1:]] != range_max[ks[:-1]])]
+        for run in np.split(ks, np.flatnonzero(new)[1:]):
+            k = run[0]
+            if len(run) == 1:
+                poc = poc_price(high[start[k]:end[k]], low[start[k]:end[k]], volume[start[k]:end[k]], bins, log_scale)
+                out[k] = np.nan if poc is None else poc
+                continue
+            price_bins = price_grid(range_min[k], range_max[k], bins, log_scale)
+            out[run] = window_pocs(high, low, volume, price_bins, start[run], end[run], log_scale)
+
+    return pd.Series(out, index=dates, name="POC")
+
+
+# =========================
+# BACKTEST REGOLA DI SELEZIONE
+# =========================
+def forward_returns(close, horizon):
+    # Rendimento % da t a t+horizon barre (NaN in coda)
+    return (close.shift(-horizon) / close - 1) * 100
+
+
+def selection_dates(close, step):
+    # Una data ogni `step` sedute del ticker (le righe con un Close)
+    return close.dropna().index[::step]
+
+
+def backtest(close, poc, soglia, horizons=(5, 20, 60), step=5, adj_close=None):
+    """
+    close, poc: pannelli (date × ticker) non aggiustati; adj_close (stesso
+    indice) per i rendimenti futuri, default close. Ogni ticker lavora
+    sulle proprie sedute: ogni `step` sedute seleziona il ticker se
+    |distanza POC| <= soglia e misura il rendimento futuro a `h` sedute sue
+    (le righe dell'unione dove il ticker non quota non contano). Confronta
+    i selezionati con la media dell'universo disponibile alle stesse date.
+    Restituisce (riepilogo per orizzonte, dettaglio per anno).
+    """
+    if adj_close is None:
+        adj_close = close
+    dist, fwd_by_h = {}, {h: {} for h in horizons}
+    for ticker in close.columns:
+        own = close[ticker].dropna()
+        rows = selection_dates(own, step)
+        p = poc[ticker].reindex(rows)
+        dist[ticker] = (own.loc[rows] - p) / p * 100
+        adj = adj_close[ticker].reindex(own.index)
+        for h in horizons:
+            fwd_by_h[h][ticker] = forward_returns(adj, h).loc[rows]
+
+    # Allineamento solo dopo: unione delle date di selezione dei ticker
+    dist = pd.DataFrame(dist, columns=close.columns).sort_index()
+    rows = dist.index
+    selected = (dist.abs() <= soglia).to_numpy()
+    available = dist.notna().to_numpy()
+
+    summary, yearly = [], []
+    for h in horizons:
+        fwd = pd.DataFrame(fwd_by_h[h], columns=close.columns).reindex(rows).to_numpy(dtype=float)
+        has_fwd = ~np.isnan(fwd)
+        sel = selected & has_fwd
+        uni = available & has_fwd
+
+        sel_ret = np.where(sel, fwd, np.nan)
+        uni_ret = np.where(uni, fwd, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            summary.append({
+                "Orizzonte (sedute)": h,
+                "Segnali": int(sel.sum()),
+                "Date con segnali": int(sel.any(axis=1).sum()),
+                "Rend. medio selezionati %": np.nanmean(sel_ret),
+                "Rend. medio universo %": np.nanmean(uni_ret),
+                "Extra rend. %": np.nanmean(sel_ret) - np.nanmean(uni_ret),
+                "Hit rate selezionati %": np.nanmean(np.where(sel, fwd > 0, np.nan)) * 100,
+                "Hit rate universo %": np.nanmean(np.where(uni, fwd > 0, np.nan)) * 100,
+            })
+
+            years = rows.year
+            for y in np.unique(years):
+                in_year = years == y
+                yearly.append({
+                    "Orizzonte (sedute)": h,
+                    "Anno": int(y),
+                    "Segnali": int(sel[in_year].sum()),
+                    "Rend. medio selezionati %": np.nanmean(sel_ret[in_year]) if sel[in_year].any() else np.nan,
+                    "Rend. medio universo %": np.nanmean(uni_ret[in_year]) if uni[in_year].any() else np.nan,
+                })
+
+    df_yearly = pd.DataFrame(yearly)
+    if not df_yearly.empty:
+        df_yearly["Extra rend. %"] = df_yearly["Rend. medio selezionati %"] - df_yearly["Rend. medio universo %"]
+    return pd.DataFrame(summary), df_yearly
+
+
+# =========================
+# ESECUZIONE PRINCIPALE
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="POC walk-forward e backtest della regola POC")
+    parser.add_argument("--poc_period", type=int, default=2, help="Periodo POC in anni")
+    parser.add_argument("--soglia_poc", type=float, default=3, help="Soglia distanza POC in percentuale")
+    parser.add_argument("--horizons", type=str, default="5,20,60",
+                        help="Orizzonti dei rendimenti futuri in sedute del ticker, separati da virgola")
+    parser.add_argument("--step", type=int, default=5, help="Sedute del ticker tra due date di selezione")
+    parser.add_argument("--start", type=str, default="2005-01-01", help="Prima data del backtest")
+    parser.add_argument("--log_bins", action="store_true",
+                        help="Bin del volume profile in scala logaritmica (come --log_bins di poc_all_tickers.py)")
+    add_profile_args(parser)
+    add_scan_args(parser)
+    args = parser.parse_args()
+    configure(args)
+    week_number = run_week()
+    name = f"poc_walkforward_p{args.poc_period}y_s{args.soglia_poc:g}{'_log' if args.log_bins else ''}"
+    start_from_args(args, name, week_number)
+    metrics.name = name
+    metrics.params = vars(args).copy()
+
+    horizons = [int(h) for h in args.horizons.split(",") if h.strip()]
+    neg_cache = NegativeCache.from_args(args)
+
+    with metrics.stage("universe"):
+        all_tickers = limit_tickers(get_all_tickers(), args)
+    metrics.tickers_total = len(all_tickers)
+    print(f"Trovati {len(all_tickers)} ticker")
+
+    # Tutto l'universo resta in memoria fino al backtest: solo serie float32
+    # di Close e Adj Close, le barre complete restano nel bar store
+    closes, adj_closes = {}, {}
+    guard = MemoryGuard.from_args(args, metrics)
+    metrics.start("scan")
+    for ticker in all_tickers:
+        metrics.ticker_done()
+        guard.tick()
+        if neg_cache.should_skip(ticker):
+            metrics.fail("negative_cache_skip")
+            continue
+        try:
+            with metrics.timed("download"):
+                bars = get_bars(ticker, "1d", "max", auto_adjust=False, metrics=metrics)
+            if bars.empty or not {"High", "Low", "Close", "Volume"} <= set(bars.columns):
+                metrics.fail("no_data")
+                neg_cache.record_failure(ticker, "no_data")
+                continue
+            neg_cache.record_success(ticker)
+            closes[ticker] = bars["Close"].astype("float32")
+            adj = bars["Adj Close"] if "Adj Close" in bars.columns else bars["Close"]
+            adj_closes[ticker] = adj.astype("float32")
+            del bars
+        except Exception as e:
+            print(f"Errore con {ticker}: {e}")
+            metrics.fail_exc(e)
+
+    if not closes:
+        metrics.stop("scan")
+        print("⚠ Nessun ticker con dati sufficienti.")
+        metrics.write(week_number)
+        return
+
+    # Date di selezione sulle sedute di ogni ticker: il POC si calcola solo lì
+    close = pd.DataFrame(closes).sort_index()
+    close = close[close.index >= pd.Timestamp(args.start)]
+    del closes
+
+    pocs = {}
+    for ticker in close.columns:
+        guard.tick()
+        try:
+            # Seconda lettura dal bar store (già aggiornato: nessun download)
+            bars = get_bars(ticker, "1d", "max", auto_adjust=False, metrics=metrics)
+            with metrics.timed("compute"):
+                pocs[ticker] = rolling_poc(bars, args.poc_period, selection_dates(close[ticker], args.step),
+                                           log_scale=args.log_bins).astype("float32")
+            del bars
+        except Exception as e:
+            print(f"Errore POC {ticker}: {e}")
+            metrics.fail_exc(e)
+    metrics.stop("scan")
+    guard.check()
+
+    with metrics.stage("backtest"):
+        poc = pd.DataFrame(pocs).reindex(index=close.index, columns=close.columns)
+        adj_close = pd.DataFrame(adj_closes).reindex(index=close.index, columns=close.columns)
+        df_summary, df_yearly = backtest(close, poc, args.soglia_poc, horizons, args.step, adj_close)
+        del adj_closes, pocs, close, poc, adj_close
+    guard.check()
+
+    print(f"\n📊 Backtest |distanza POC {args.poc_period}y| <= {args.soglia_poc:g}%:")
+    print(df_summary.round(3).to_string(index=False))
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    file_path = os.path.join(
+        OUTPUT_DIR,
+        f"POC_walkforward_p{args.poc_period}y_s{args.soglia_poc:g}{'_log' if args.log_bins else ''}_week_{week_number}.xlsx"
+    )
+    with metrics.stage("excel"):
+        write_report(file_path, {"riepilogo": df_summary, "per_anno": df_yearly})
+
+    print(f"\n✅ File salvato: {file_path}")
+    metrics.write(week_number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from snapshot import run_week
+
+# =========================
+# PATH OUTPUT
+# =========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
+
+def add_profile_args(parser):
+    """
+    Aggiunge le opzioni --profile / --profile_tickers a un parser argparse.
+    """
+    parser.add_argument("--profile", action="store_true",
+                        help="Esegue lo script sotto profiler a campionamento")
+    parser.add_argument("--profile_tickers", type=str, default=None,
+                        help="Limita il run a questi ticker, separati da virgola (es. AAPL,MSFT)")
+    parser.add_argument("--profile_interval", type=float, default=0.005,
+                        help="Intervallo di campionamento in secondi")
+    parser.add_argument("--profile_top", type=int, default=30,
+                        help="Numero di funzioni nel riepilogo top-N")
+    return parser
+
+
+def profile_cli_args(args):
+    # Argomenti da inoltrare ai sottoprocessi (master.py)
+    cli = []
+    if args.profile:
+        cli += ["--profile", "--profile_interval", str(args.profile_interval),
+                "--profile_top", str(args.profile_top)]
+    if args.profile_tickers:
+        cli += ["--profile_tickers", args.profile_tickers]
+    return cli
+
+
+def limit_tickers(tickers, args):
+    """
+    Restringe l'universo ai ticker di --profile_tickers (come --debug_ticker).
+    """
+    if not getattr(args, "profile_tickers", None):
+        return tickers
+    wanted = [t.strip() for t in args.profile_tickers.split(",") if t.strip()]
+    subset = [t for t in tickers if t in wanted]
+    print(f"🎯 Run limitato a {len(subset)} ticker: {', '.join(subset)}")
+    return subset
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    # ';' separa i frame nel formato collapsed: non deve comparire nelle etichette
+    name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ",")
+
+
+class SamplingProfiler:
+    """
+    Profiler a campionamento sul thread principale: ogni campione è pesato
+    con i millisecondi trascorsi, così i conteggi restano tempi reali anche
+    quando il GIL ritarda il thread di campionamento.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                weight_ms = max(1, int(round((now - last) * 1000)))
+                self.stacks[";".join(reversed(stack))] += weight_ms
+            last = now
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {ms}" for stack, ms in sorted(self.stacks.items())) + "\n"
+
+    def top(self, n=30):
+        self_ms = Counter()
+        total_ms = Counter()
+        for stack, ms in self.stacks.items():
+            frames = stack.split(";")
+            self_ms[frames[-1]] += ms
+            for f in set(frames):
+                total_ms[f] += ms
+
+        grand = sum(self.stacks.values()) or 1
+        lines = [f"{'self ms':>10} {'self %':>7} {'total ms':>10} {'total %':>8}  funzione"]
+        for name, ms in self_ms.most_common(n):
+            lines.append(
+                f"{ms:>10} {ms / grand * 100:>6.1f}% {total_ms[name]:>10} "
+                f"{total_ms[name] / grand * 100:>7.1f}%  {name}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+def start_from_args(args, name, week_number=None):
+    """
+    Se --profile è attivo avvia il profiler e registra il salvataggio
+    (collapsed stack per flamegraph + riepilogo top-N) all'uscita dello script.
+    """
+    if not getattr(args, "profile", False):
+        return None
+
+    if week_number is None:
+        week_number = run_week()
+
+    profiler = SamplingProfiler(interval=args.profile_interval).start()
+    print(f"🔬 Profiler attivo (campionamento ogni {args.profile_interval * 1000:.1f} ms)")
+
+    def _save():
+        profiler.stop()
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        base = os.path.join(OUTPUT_DIR, f"profile_{name}_week_{week_number}")
+
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(profiler.collapsed())
+        with open(base + "_top.txt", "w", encoding="utf-8") as f:
+            f.write(profiler.top(args.profile_top))
+
+        print(f"🔬 Profilo salvato: {base}.collapsed")
+        print(f"🔬 Top {args.profile_top} funzioni: {base}_top.txt")
+
+    atexit.register(_save)
+    return profiler
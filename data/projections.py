@@ -0,0 +1,148 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# PROIEZIONI FAIR VALUE (REGRESSIONE IN FORMA CHIUSA)
+# =========================
+# Le serie storiche (ricavi, EPS, FCF...) stanno in una matrice anni
+# fiscali × ticker, con NaN dove manca un anno. Ogni modello è una retta
+# y' = a + b·x' dopo una trasformazione, quindi a e b si ricavano con i
+# minimi quadrati in forma chiusa, da somme mascherate sulle colonne:
+# nessun curve_fit, nessuna stima iniziale, nessun ciclo per serie.
+#
+#   linear       y = a + b·t
+#   loglinear    log(y) = a + b·t               (crescita composta, y > 0)
+#   logarithmic  y = a + b·log(t - t0 + 1)      (t0 = primo anno valido, y > 0)
+
+REGRESSION_YEARS = 15   # ultimi anni fiscali usati per ogni serie
+MIN_POINTS = 2          # punti validi minimi per stimare una serie
+MODELS = ("linear", "loglinear", "logarithmic")
+
+
+def fiscal_series(values, periods):
+    """
+    Serie anno → valore dalle colonne di un bilancio ("FY 2021", "TTM"...).
+    Il TTM conta come anno successivo all'ultimo anno fiscale.
+    """
+    years, ttm = {}, None
+    for value, period in zip(values, periods):
+        period = str(period)
+        if "TTM" in period.upper():
+            ttm = value
+            continue
+        match = re.search(r"(\d{4})", period)
+        if match:
+            years[int(match.group(1))] = value
+
+    series = pd.Series(years, dtype=float).sort_index()
+    if ttm is not None and not series.empty:
+        series.loc[series.index.max() + 1] = ttm
+    return series
+
+
+def year_matrix(series_by_ticker, max_years=REGRESSION_YEARS):
+    """
+    Matrice anni × ticker (anni interi, NaN dove manca il dato) con solo
+    gli ultimi max_years valori validi di ogni serie.
+    """
+    matrix = pd.DataFrame(series_by_ticker, dtype=float).sort_index()
+    if matrix.empty:
+        return matrix
+    matrix = matrix.reindex(np.arange(matrix.index.min(), matrix.index.max() + 1))
+    # Conteggio dei valori validi dal fondo: oltre max_years si scarta
+    from_end = matrix.notna()[::-1].cumsum()[::-1]
+    return matrix.where(from_end <= max_years)
+
+
+def _design(years, valid, model):
+    # x trasformata per ogni cella (anni × serie)
+    t = np.broadcast_to(years[:, None], valid.shape).astype(float)
+    if model != "logarithmic":
+        return t
+    first = np.where(valid.any(axis=0), np.where(valid, t, np.inf).min(axis=0, initial=np.inf), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log(t - first + 1)
+
+
+def _transform(y, model):
+    if model == "loglinear":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.log(y)
+    return y
+
+
+def _inverse(y, model):
+    return np.exp(y) if model == "loglinear" else y
+
+
+def fit_batch(matrix, model="linear"):
+    """
+    Stima a, b del modello per ogni colonna di `matrix` (anni × ticker).
+    Restituisce un DataFrame per ticker con a, b, n, r2 e rmse (R² e RMSE
+    sulla scala originale dei valori). Serie con meno di MIN_POINTS punti
+    validi: a, b = NaN.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Modello sconosciuto '{model}': usare {', '.join(MODELS)}")
+
+    years = matrix.index.to_numpy(dtype=float)
+    y = matrix.to_numpy(dtype=float)
+    valid = np.isfinite(y)
+    if model != "linear":
+        valid &= y > 0
+
+    x = _design(years, valid, model)
+    yt = _transform(np.where(valid, y, 1.0), model)
+    w = valid.astype(float)
+    x0 = np.where(valid, x, 0.0)
+    y0 = np.where(valid, yt, 0.0)
+
+    # Minimi quadrati in forma chiusa, colonna per colonna in un colpo solo
+    n = w.sum(axis=0)
+    sx, sy = x0.sum(axis=0), y0.sum(axis=0)
+    sxx, sxy = (x0 * x0).sum(axis=0), (x0 * y0).sum(axis=0)
+    den = n * sxx - sx * sx
+    enough = (n >= MIN_POINTS) & (den > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = np.where(enough, (n * sxy - sx * sy) / den, np.nan)
+        a = np.where(enough, (sy - b * sx) / n, np.nan)
+
+        fitted = _inverse(a + b * x0, model)
+        resid = np.where(valid, np.where(valid, y, 0.0) - fitted, 0.0)
+        mean = np.where(valid, y, 0.0).sum(axis=0) / n
+        ss_res = (resid ** 2).sum(axis=0)
+        ss_tot = (np.where(valid, y - mean, 0.0) ** 2).sum(axis=0)
+        r2 = np.where(enough & (ss_tot > 0), 1 - ss_res / ss_tot, np.nan)
+        rmse = np.where(enough, np.sqrt(ss_res / n), np.nan)
+
+    first = np.where(valid.any(axis=0), np.where(valid, years[:, None], np.inf).min(axis=0, initial=np.inf), np.nan)
+    last = np.where(valid.any(axis=0), np.where(valid, years[:, None], -np.inf).max(axis=0, initial=-np.inf), np.nan)
+    return pd.DataFrame({
+        "model": model, "a": a, "b": b, "n": n.astype(int), "r2": r2, "rmse": rmse,
+        "first_year": first, "last_year": last,
+    }, index=matrix.columns)
+
+
+def project_batch(matrix, horizon, model="linear"):
+    """
+    Proiezioni dei `horizon` anni successivi all'ultimo anno valido di ogni
+    serie. Restituisce (proiezioni anni × ticker, qualità del fit per
+    ticker come in fit_batch).
+    """
+    fit = fit_batch(matrix, model)
+    if matrix.empty or fit["last_year"].isna().all():
+        return pd.DataFrame(columns=matrix.columns, dtype=float), fit
+
+    last = fit["last_year"].to_numpy()
+    years = np.arange(np.nanmin(last) + 1, np.nanmax(last) + horizon + 1)
+    t = years[:, None]
+    x = t if model != "logarithmic" else np.log(np.maximum(t - fit["first_year"].to_numpy() + 1, 1))
+    in_horizon = (t > last) & (t <= last + horizon)
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        pred = _inverse(fit["a"].to_numpy() + fit["b"].to_numpy() * x, model)
+    projections = pd.DataFrame(np.where(in_horizon, pred, np.nan),
+                               index=years.astype(int), columns=matrix.columns)
+    return projections, fit
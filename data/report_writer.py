@@ -0,0 +1,180 @@
+import os
+import re
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from snapshot import run_datetime
+
+# =========================
+# REPORT EXCEL IN STREAMING
+# =========================
+# Scrive uno o più DataFrame in un unico .xlsx con xlsxwriter in modalità
+# constant_memory: ogni riga viene scritta su disco appena completata,
+# quindi la memoria resta costante anche con tabelle grandi quanto
+# l'universo. Formati come nei notebook FINALE / Merge: numeri a 1 decimale,
+# date yyyy-mm-dd, celle vuote al posto dei NaN.
+
+FLOAT_FORMAT = "0.0"
+INT_FORMAT = "0"
+DATE_FORMAT = "yyyy-mm-dd"
+MAX_COL_WIDTH = 40
+WIDTH_SAMPLE = 500   # righe usate per stimare la larghezza delle colonne
+
+
+def sheet_name(name, used=()):
+    """
+    Nome foglio valido per Excel: max 31 caratteri, senza []:*?/\\ e unico.
+    """
+    base = re.sub(r"[\[\]:*?/\\]", "_", str(name)).strip("'") or "Sheet"
+    base = base[:31]
+    candidate, i = base, 2
+    while candidate.lower() in {u.lower() for u in used}:
+        suffix = f"_{i}"
+        candidate = base[:31 - len(suffix)] + suffix
+        i += 1
+    return candidate
+
+
+class ReportWriter:
+    """
+    Workbook in streaming: add_sheet() scrive un DataFrame per foglio, nello
+    stesso ordine delle chiamate. formats permette di forzare il formato
+    numerico di singole colonne (es. {"POC": "0.00"}).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        # Data di creazione fissata al giorno del run: stesse tabelle → stesso
+        # file byte per byte (run normale e merge degli shard)
+        self.workbook.set_properties({"created": datetime.combine(run_datetime().date(), datetime.min.time())})
+        self.header_fmt = self.workbook.add_format({"bold": True, "bottom": 1})
+        self._formats = {}
+        self.sheets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _fmt(self, num_format):
+        if num_format not in self._formats:
+            self._formats[num_format] = self.workbook.add_format({"num_format": num_format})
+        return self._formats[num_format]
+
+    def _column_kind(self, s):
+        if pd.api.types.is_bool_dtype(s):
+            return "bool"
+        if pd.api.types.is_datetime64_any_dtype(s):
+            return "date"
+        if pd.api.types.is_integer_dtype(s):
+            return "int"
+        if pd.api.types.is_numeric_dtype(s):
+            return "float"
+        sample = s.dropna().head(WIDTH_SAMPLE)
+        if len(sample) and all(isinstance(v, (date, datetime)) for v in sample):
+            return "date"
+        return "object"
+
+    def _write_mixed(self, ws):
+        float_fmt = self._fmt(FLOAT_FORMAT)
+
+        def write(r, j, v, fmt):
+            if isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_)):
+                ws.write_number(r, j, float(v), fmt or float_fmt)
+            else:
+                ws.write_string(r, j, str(v), fmt)
+        return write
+
+    def add_sheet(self, name, df, formats=None):
+        formats = formats or {}
+        name = sheet_name(name, self.sheets)
+        self.sheets.append(name)
+        ws = self.workbook.add_worksheet(name)
+
+        if isinstance(df.index, pd.MultiIndex) or df.index.name is not None:
+            df = df.reset_index()
+        df = df.loc[:, ~df.columns.duplicated()]
+        columns = [str(c) for c in df.columns]
+
+        # Per colonna: metodo di scrittura, valori Python e celle da saltare
+        # calcolati in blocco, così il ciclo sulle righe non fa dispatch per cella
+        plan = []
+        for j, (col, label) in enumerate(zip(df.columns, columns)):
+            s = df[col]
+            kind = self._column_kind(s)
+            skip = s.isna().to_numpy()
+
+            if kind == "date":
+                s = pd.to_datetime(s, errors="coerce")
+                if s.dt.tz is not None:
+                    s = s.dt.tz_localize(None)
+                skip = s.isna().to_numpy()
+                vals = s.dt.to_pydatetime().tolist()
+                write, num_format, width = ws.write_datetime, formats.get(label, DATE_FORMAT), 10
+            elif kind == "bool":
+                vals = s.tolist()
+                write, num_format, width = ws.write_boolean, formats.get(label), 5
+            elif kind in ("int", "float"):
+                arr = s.to_numpy(dtype=float, na_value=np.nan)
+                skip = ~np.isfinite(arr)
+                vals = arr.tolist()
+                default = INT_FORMAT if kind == "int" else FLOAT_FORMAT
+                write, num_format = ws.write_number, formats.get(label, default)
+                width = 12 if kind == "float" else max((len(str(v)) for v in vals[:WIDTH_SAMPLE]), default=0)
+            else:
+                vals = s.tolist()
+                # Colonne miste: i numeri restano numeri, il resto diventa testo
+                if all(isinstance(v, str) for v, k in zip(vals, skip) if not k):
+                    write = ws.write_string
+                else:
+                    write = self._write_mixed(ws)
+                num_format = formats.get(label)
+                width = max((len(str(v)) for v, k in zip(vals[:WIDTH_SAMPLE], skip) if not k), default=0)
+
+            fmt = self._fmt(num_format) if num_format else None
+            # Larghezze, riquadro bloccato e filtro vanno impostati prima delle righe
+            ws.set_column(j, j, min(MAX_COL_WIDTH, max(len(label), width) + 2), fmt)
+            plan.append((j, write, vals, skip.tolist(), fmt))
+
+        ws.freeze_panes(1, 0)
+        if columns:
+            ws.autofilter(0, 0, max(len(df), 1), len(columns) - 1)
+
+        ws.write_row(0, 0, columns, self.header_fmt)
+
+        for i in range(len(df)):
+            r = i + 1
+            for j, write, vals, skip, fmt in plan:
+                if not skip[i]:
+                    write(r, j, vals[i], fmt)
+        return name
+
+    def close(self):
+        if not self.sheets:
+            self.workbook.add_worksheet("Vuoto")
+        self.workbook.close()
+
+
+def write_excel(path, df, sheet="Sheet1", formats=None):
+    """
+    Sostituto di df.to_excel(path, index=False) per i report finali.
+    """
+    with ReportWriter(path) as writer:
+        writer.add_sheet(sheet, df, formats)
+    return path
+
+
+def write_report(path, sheets, formats=None):
+    """
+    Più tabelle in un solo workbook: sheets = {nome foglio: DataFrame}.
+    """
+    with ReportWriter(path) as writer:
+        for name, df in sheets.items():
+            writer.add_sheet(name, df, (formats or {}).get(name))
+    return path
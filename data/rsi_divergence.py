@@ -3,87 +3,108 @@
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-import yfinance as yf
 import pandas as pd
 from bs4 import BeautifulSoup
 import requests
 import numpy as np
-from datetime import datetime, timedelta
 import os
 import sys
-
-# ✅ DEFINIZIONE WEEK NUMBER (UNICA MODIFICA)
-week_number = datetime.utcnow().isocalendar().week
+import argparse
 
 # ✅ Helper per scalari da array
 def scalar(x):
     return float(np.asarray(x).item())
 
-# ✅ Calcolo RSI in stile TradingView (RMA)
-def compute_rsi_rma(series, period=14):
-    delta = series.diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-    avg_gain = gain.ewm(alpha=1/period, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=1/period, adjust=False).mean()
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
 # ✅ Importa funzione get_all_tickers dal repo (cartella data)
-sys.path.append('./data')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from my_tickers import get_all_tickers
-print("✅ Funzione get_all_tickers importata correttamente.")
-
-# === Recupera tutti i ticker con indice ===
-ticker_dict = get_all_tickers(flat=False)
-ticker_to_index = {}
-for idx_name, tickers in ticker_dict.items():
-    for t in tickers:
-        if t in ticker_to_index:
-            ticker_to_index[t] += f", {idx_name}"
-        else:
-            ticker_to_index[t] = idx_name
-
-all_tickers = list(ticker_to_index.keys())
-print(f"Trovati {len(all_tickers)} ticker tra tutti gli indici")
-
-# ✅ Scarica dati settimanali e calcola RSI
-def fetch_weekly_data(ticker):
+from run_metrics import RunMetrics
+from indicators import wilder_rsi  # ✅ RSI in stile TradingView (RMA)
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import Checkpoint, NegativeCache, add_scan_args, configure
+from snapshot import run_datetime, run_tag, run_week
+from incremental import ResultCache, fingerprint, write_delta
+from sharding import Shard
+from bar_store import get_bars, resample_bars, slice_period, period_to_offset
+from report_writer import write_excel
+from memory_guard import MemoryGuard, categorize
+
+metrics = RunMetrics("rsi_divergence")
+neg_cache = None  # impostata da main()
+
+# ✅ Timeframe supportati: tutti ricavati dalle barre giornaliere in cache,
+# così una nuova combinazione costa solo calcolo e nessun download
+TIMEFRAMES = {
+    "daily":   {"interval": "1d",  "lookback": "1y", "max_days": 42,  "max_days_from_now": 30},
+    "weekly":  {"interval": "1wk", "lookback": "1y", "max_days": 42,  "max_days_from_now": 30},
+    "monthly": {"interval": "1mo", "lookback": "5y", "max_days": 186, "max_days_from_now": 93},
+}
+
+def daily_lookback(timeframes):
+    # Storico giornaliero sufficiente per il timeframe più lungo richiesto
+    ref = pd.Timestamp("2000-01-01")
+    return max((TIMEFRAMES[tf]["lookback"] for tf in timeframes),
+               key=lambda p: ref - period_to_offset(p))
+
+# ✅ Scarica (o legge dalla cache) le barre giornaliere
+def fetch_daily_bars(ticker, lookback="1y"):
     if not ticker or not isinstance(ticker, str):
         print(f"❌ Errore: Ticker vuoto o non valido ('{ticker}').")
+        metrics.fail("invalid_ticker")
         return None
     try:
-        df = yf.download(
-            ticker,
-            period="1y",
-            interval="1wk",
-            auto_adjust=False,
-            progress=False
-        )
+        with metrics.timed("download"):
+            df = get_bars(ticker, interval="1d", period=lookback, metrics=metrics)
         if df.empty or "Close" not in df.columns:
+            metrics.fail("no_data")
+            if neg_cache is not None:
+                neg_cache.record_failure(ticker, "no_data")
             return None
-        df["RSI"] = compute_rsi_rma(df["Close"])
-        df = df[["Close", "RSI"]].dropna()
-        df.name = ticker
+        if neg_cache is not None:
+            neg_cache.record_success(ticker)
         return df
     except Exception as e:
         print(f"❌ Errore su {ticker}: {e}")
+        metrics.fail_exc(e)
         return None
 
-# ✅ Trova swing points
+# ✅ Close + RSI su un timeframe (una sola volta per timeframe)
+def prepare_timeframe(daily, timeframe):
+    cfg = TIMEFRAMES[timeframe]
+    df = resample_bars(daily, cfg["interval"])
+    df = slice_period(df, cfg["lookback"])
+    df = df[["Close"]].copy()
+    df["RSI"] = wilder_rsi(df["Close"])
+    return df.dropna()
+
+# ✅ Swing points vettoriali: massimi/minimi stretti su `window` barre per lato
+def pivot_masks(values, window=2):
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    is_max = np.zeros(n, dtype=bool)
+    is_min = np.zeros(n, dtype=bool)
+    if n < 2 * window + 1:
+        return is_max, is_min
+
+    view = np.lib.stride_tricks.sliding_window_view(values, window)
+    center = values[window:n - window]
+    left = view[:n - 2 * window]
+    right = view[window + 1:]
+
+    with np.errstate(invalid="ignore"):
+        is_max[window:n - window] = (center > left.max(axis=1)) & (center > right.max(axis=1))
+        is_min[window:n - window] = (center < left.min(axis=1)) & (center < right.min(axis=1))
+    is_min &= ~is_max
+    return is_max, is_min
+
+# ✅ Trova swing points (stesso output della versione a ciclo)
 def find_pivots(series, window=2):
-    pivots = []
+    is_max, is_min = pivot_masks(series.values, window)
     values = series.values
     index = series.index
-    for i in range(window, len(series) - window):
-        left = values[i - window:i]
-        right = values[i + 1:i + 1 + window]
-        center = values[i]
-        if all(center > val for val in left) and all(center > val for val in right):
-            pivots.append((index[i], center, 'max'))
-        elif all(center < val for val in left) and all(center < val for val in right):
-            pivots.append((index[i], center, 'min'))
+    pivots = []
+    for i in np.flatnonzero(is_max | is_min):
+        pivots.append((index[i], values[i], 'max' if is_max[i] else 'min'))
     return pivots
 
 # ✅ Divergenze RSI
@@ -92,33 +113,32 @@ def detect_divergence_with_values(
     mode="bullish",
     window=2,
     max_days=42,
-    max_days_from_now=30
+    max_days_from_now=30,
+    pivots=None
 ):
     if df is None or len(df) < (2 * window + 1):
         return None
 
-    df = df.copy()
-    pivots_price = find_pivots(df['Close'], window=window)
-    pivots_rsi   = find_pivots(df['RSI'], window=window)
+    # pivots = (price_max, price_min, rsi_max, rsi_min) già calcolati per questa finestra
+    if pivots is None:
+        pivots = pivot_masks(df['Close'].values, window) + pivot_masks(df['RSI'].values, window)
+    price_max, price_min, rsi_max, rsi_min = pivots
 
-    tipo = 'min' if mode == 'bullish' else 'max'
-    price_pivots = [(d, v) for (d, v, k) in pivots_price if k == tipo]
-    rsi_pivots   = [(d, v) for (d, v, k) in pivots_rsi if k == tipo]
-
-    price_dict = dict(price_pivots)
-    rsi_dict = dict(rsi_pivots)
-
-    common_dates = sorted(set(price_dict.keys()) & set(rsi_dict.keys()))
-    if len(common_dates) < 2:
+    if mode == 'bullish':
+        common = np.flatnonzero(price_min & rsi_min)
+    else:
+        common = np.flatnonzero(price_max & rsi_max)
+    if len(common) < 2:
         return None
 
-    d1, d2 = common_dates[-2], common_dates[-1]
-    p1, p2 = price_dict[d1], price_dict[d2]
-    r1, r2 = rsi_dict[d1], rsi_dict[d2]
+    i1, i2 = common[-2], common[-1]
+    d1, d2 = df.index[i1], df.index[i2]
+    p1, p2 = df['Close'].values[i1], df['Close'].values[i2]
+    r1, r2 = df['RSI'].values[i1], df['RSI'].values[i2]
 
     if (d2 - d1).days > max_days:
         return None
-    if (datetime.now() - d2).days > max_days_from_now:
+    if (run_datetime() - d2).days > max_days_from_now:
         return None
 
     if mode == 'bullish' and (p2 < p1) and (r2 > r1) and (min(r1, r2) < 35):
@@ -137,55 +157,155 @@ def detect_divergence_with_values(
 
     return None
 
-# ✅ Analisi generale
-results = []
-print(f"🔍 Analisi di {len(all_tickers)} ticker...\n")
-
-for ticker in all_tickers:
-    df = fetch_weekly_data(ticker)
-    if df is None:
-        continue
-
-    bull = detect_divergence_with_values(df, "bullish")
-    bear = detect_divergence_with_values(df, "bearish")
-
-    if bull:
-        results.append({
-            "Ticker": ticker,
-            "Mode": "bullish",
-            "Date1": bull["date1"].date(),
-            "Price1": round(scalar(bull["price1"]), 2),
-            "RSI1": round(bull["rsi1"], 2),
-            "Date2": bull["date2"].date(),
-            "Price2": round(scalar(bull["price2"]), 2),
-            "RSI2": round(bull["rsi2"], 2),
-        })
-        print(f"✅ Divergenza rialzista su: {ticker}")
-
-    if bear:
-        results.append({
-            "Ticker": ticker,
-            "Mode": "bearish",
-            "Date1": bear["date1"].date(),
-            "Price1": round(scalar(bear["price1"]), 2),
-            "RSI1": round(bear["rsi1"], 2),
-            "Date2": bear["date2"].date(),
-            "Price2": round(scalar(bear["price2"]), 2),
-            "RSI2": round(bear["rsi2"], 2),
-        })
-        print(f"✅ Divergenza ribassista su: {ticker}")
-
-# ✅ Output tabella finale
-print("\n📊 Riepilogo divergenze recenti:")
-if results:
-    df_res = pd.DataFrame(results)
-    print(df_res.to_string(index=False))
-    os.makedirs("data/output", exist_ok=True)
-    output_file = os.path.join(
-        "data/output",
-        f"rsi_divergences_week_{week_number}.xlsx"
-    )
-    df_res.to_excel(output_file, index=False)
-    print(f"\n✅ File salvato: {output_file}")
-else:
-    print("🚫 Nessuna divergenza recente trovata.")
+def divergence_row(ticker, timeframe, window, mode, hit):
+    return {
+        "Ticker": ticker,
+        "Timeframe": timeframe,
+        "Window": window,
+        "Mode": mode,
+        "Date1": hit["date1"].date(),
+        "Price1": round(scalar(hit["price1"]), 2),
+        "RSI1": round(float(hit["rsi1"]), 2),
+        "Date2": hit["date2"].date(),
+        "Price2": round(scalar(hit["price2"]), 2),
+        "RSI2": round(float(hit["rsi2"]), 2),
+    }
+
+# ✅ Tutte le combinazioni (timeframe, window, mode) su barre già caricate
+def scan_divergences(ticker, daily, timeframes=("weekly",), windows=(2,)):
+    rows = []
+    for tf in timeframes:
+        cfg = TIMEFRAMES[tf]
+        df = prepare_timeframe(daily, tf)
+        for window in windows:
+            pivots = pivot_masks(df['Close'].values, window) + pivot_masks(df['RSI'].values, window)
+            for mode in ("bullish", "bearish"):
+                hit = detect_divergence_with_values(
+                    df, mode, window, cfg["max_days"], cfg["max_days_from_now"], pivots
+                )
+                if hit:
+                    rows.append(divergence_row(ticker, tf, window, mode, hit))
+                    verso = "rialzista" if mode == "bullish" else "ribassista"
+                    print(f"✅ Divergenza {verso} su: {ticker} ({tf}, window={window})")
+    return rows
+
+# ✅ Analisi singolo ticker
+def analyze_ticker(ticker, timeframes=("weekly",), windows=(2,), results=None):
+    daily = fetch_daily_bars(ticker, daily_lookback(timeframes))
+    if daily is None:
+        return []
+
+    # Barre giornaliere invariate: stesse divergenze, va solo riapplicato il
+    # limite di giorni da oggi di ogni timeframe
+    if results is not None:
+        fp = fingerprint(daily)
+        rows = results.get(ticker, fp)
+        if rows is not None:
+            now = run_datetime()
+            return [r for r in rows
+                    if (now - pd.Timestamp(r["Date2"])).days <= TIMEFRAMES[r["Timeframe"]]["max_days_from_now"]]
+
+    with metrics.timed("compute"):
+        rows = scan_divergences(ticker, daily, timeframes, windows)
+    if results is not None:
+        results.put(ticker, fp, rows)
+    return rows
+
+
+def main():
+    global neg_cache
+
+    # ✅ Argomenti CLI
+    parser = argparse.ArgumentParser(description="RSI divergence multi-timeframe")
+    parser.add_argument("--timeframes", type=str, default="weekly",
+                        help=f"Timeframe separati da virgola ({', '.join(TIMEFRAMES)})")
+    parser.add_argument("--windows", type=str, default="2",
+                        help="Finestre pivot separate da virgola (es. 2,3,5)")
+    add_profile_args(parser)
+    add_scan_args(parser)
+    args = parser.parse_args()
+    configure(args)
+    week_number = run_week()
+    neg_cache = NegativeCache.from_args(args)
+    start_from_args(args, "rsi_divergence", week_number)
+
+    timeframes = [tf.strip() for tf in args.timeframes.split(",") if tf.strip()]
+    windows = [int(w) for w in args.windows.split(",") if w.strip()]
+    unknown = [tf for tf in timeframes if tf not in TIMEFRAMES]
+    if unknown:
+        parser.error(f"Timeframe non supportati: {', '.join(unknown)}")
+    metrics.params = {"timeframes": timeframes, "windows": windows}
+
+    # === Recupera tutti i ticker con indice ===
+    with metrics.stage("universe"):
+        ticker_dict = get_all_tickers(flat=False)
+    ticker_to_index = {}
+    for idx_name, tickers in ticker_dict.items():
+        for t in tickers:
+            if t in ticker_to_index:
+                ticker_to_index[t] += f", {idx_name}"
+            else:
+                ticker_to_index[t] = idx_name
+
+    all_tickers = limit_tickers(list(ticker_to_index.keys()), args)
+    metrics.tickers_total = len(all_tickers)
+    print(f"Trovati {len(all_tickers)} ticker tra tutti gli indici")
+
+    # ✅ Analisi generale (checkpoint: un run interrotto riprende dai ticker mancanti)
+    print(f"🔍 Analisi di {len(all_tickers)} ticker su {timeframes} / window {windows}...\n")
+    combo = f"{'-'.join(timeframes)}_w{'-'.join(map(str, windows))}"
+    shard = Shard.from_args(args, f"rsi_divergence_{combo}_{run_tag()}", week_number, metrics)
+    scan_tickers = shard.select(all_tickers)
+    if shard.partial:
+        metrics.tickers_total = len(scan_tickers)
+    checkpoint = Checkpoint(shard.scoped(f"rsi_divergence_{combo}_{run_tag()}"), resume=not args.no_resume)
+    cache = ResultCache.from_args(f"rsi_divergence_{combo}", args)
+    guard = MemoryGuard.from_args(args, metrics)
+    metrics.start("scan")
+
+    for ticker in scan_tickers:
+        metrics.ticker_done()
+        guard.tick()
+        if ticker in checkpoint:
+            continue
+        if neg_cache.should_skip(ticker):
+            metrics.fail("negative_cache_skip")
+            continue
+        checkpoint.save(ticker, analyze_ticker(ticker, timeframes, windows, cache))
+
+    metrics.stop("scan")
+    guard.check()
+    cache.save(ticker_to_index)
+    metrics.tickers_reused = cache.hits
+    results = shard.finish(checkpoint.done, all_tickers)
+    if results is None:
+        # Shard parziale: delta ed Excel li scrive il merge
+        checkpoint.clear()
+        metrics.write(week_number)
+        sys.exit(0)
+    write_delta(f"rsi_divergence_{combo}", [r["Ticker"] for r in results], week_number)
+
+    # ✅ Output tabella finale
+    print("\n📊 Riepilogo divergenze recenti:")
+    if results:
+        df_res = categorize(pd.DataFrame(results), ("Ticker", "Timeframe", "Mode"))
+        print(df_res.to_string(index=False))
+        os.makedirs("data/output", exist_ok=True)
+        output_file = os.path.join(
+            "data/output",
+            f"rsi_divergences_week_{week_number}.xlsx"
+        )
+        with metrics.stage("excel"):
+            write_excel(output_file, df_res, "Divergenze RSI")
+        print(f"\n✅ File salvato: {output_file}")
+    else:
+        print("🚫 Nessuna divergenza recente trovata.")
+
+    checkpoint.clear()
+    shard.cleanup()
+
+    metrics.write(week_number)
+
+
+if __name__ == "__main__":
+    main()
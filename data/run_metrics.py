@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from snapshot import run_week
+
+try:
+    import resource
+except ImportError:  # Windows: niente getrusage
+    resource = None
+
+# =========================
+# PATH OUTPUT
+# =========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
+# Bucket istogrammi di latenza (secondi, limite superiore incluso)
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+def peak_rss_mb(children=False):
+    """
+    Picco di memoria residente (MB) del processo, o dei figli già terminati.
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    # Linux riporta KB, macOS byte
+    if sys.platform == "darwin":
+        return round(maxrss / (1024 * 1024), 1)
+    return round(maxrss / 1024, 1)
+
+
+def report_path(name, week_number):
+    return os.path.join(OUTPUT_DIR, f"run_report_{name}_week_{week_number}.json")
+
+
+def _histogram(values):
+    if not values:
+        return {"count": 0}
+
+    ordered = sorted(values)
+    n = len(ordered)
+    labels = [f"<={edge}s" for edge in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+    counts = [0] * len(labels)
+    for v in ordered:
+        counts[bisect_left(LATENCY_BUCKETS, v)] += 1
+    buckets = dict(zip(labels, counts))
+
+    return {
+        "count": n,
+        "total_s": round(sum(ordered), 3),
+        "mean_s": round(sum(ordered) / n, 4),
+        "p50_s": round(ordered[int(0.50 * (n - 1))], 4),
+        "p95_s": round(ordered[int(0.95 * (n - 1))], 4),
+        "max_s": round(ordered[-1], 4),
+        "buckets": buckets,
+    }
+
+
+class RunMetrics:
+    """
+    Raccoglie tempi per fase, latenze per ticker, errori per motivo e picco RSS
+    di uno script, e li salva come report JSON in data/output. timed() e
+    fail() si possono chiamare dai worker (SupertrendPipeline).
+    """
+
+    def __init__(self, name, **params):
+        self.name = name
+        self.params = params
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self.stages = {}
+        self.latencies = {}
+        self.failures = Counter()
+        self.tickers_total = 0
+        self.tickers_done = 0
+        self.tickers_reused = 0   # righe riusate da incremental.ResultCache
+        self._open_stages = {}
+        self.children = {}
+        self.rss_samples = []
+        self.rss_limit_mb = None
+        self._lock = threading.Lock()
+
+    def start(self, name):
+        self._open_stages[name] = time.perf_counter()
+
+    def stop(self, name):
+        t0 = self._open_stages.pop(name, None)
+        if t0 is not None:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t0
+
+    @contextmanager
+    def stage(self, name):
+        # Tempo wall di una fase (universo, scan, excel...), cumulato se ripetuta
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    @contextmanager
+    def timed(self, kind):
+        # Latenza di una singola operazione per ticker ("download", "compute")
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.latencies.setdefault(kind, []).append(elapsed)
+
+    def fail(self, reason):
+        with self._lock:
+            self.failures[reason] += 1
+
+    def fail_exc(self, exc):
+        self.fail(f"exception:{type(exc).__name__}")
+
+    def sample_rss(self, mb):
+        # RSS misurato a fine blocco di ticker (memory_guard)
+        if mb is not None:
+            self.rss_samples.append(mb)
+
+    def ticker_done(self):
+        self.tickers_done += 1
+
+    def attach_child(self, label, path):
+        # Incorpora il report JSON di un sottoprocesso (usato da master.py)
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.children[label] = json.load(f)
+        except (OSError, ValueError):
+            self.fail("child_report_missing")
+
+    def report(self):
+        wall = time.perf_counter() - self._t0
+        scan_s = self.stages.get("scan", wall)
+        report = {
+            "script": self.name,
+            "params": self.params,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_s": round(wall, 3),
+            "stages_s": {k: round(v, 3) for k, v in self.stages.items()},
+            "tickers_total": self.tickers_total,
+            "tickers_done": self.tickers_done,
+            "tickers_reused": self.tickers_reused,
+            "tickers_per_s": round(self.tickers_done / scan_s, 3) if scan_s > 0 else None,
+            "latency": {k: _histogram(v) for k, v in self.latencies.items()},
+            "failures": dict(self.failures),
+            "failures_total": sum(self.failures.values()),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(children=True),
+        }
+        if self.rss_samples:
+            report["rss_chunks_mb"] = {
+                "samples": len(self.rss_samples),
+                "max": max(self.rss_samples),
+                "last": self.rss_samples[-1],
+                "limit": self.rss_limit_mb,
+            }
+        if self.children:
+            report["children"] = self.children
+        return report
+
+    def write(self, week_number=None):
+        if week_number is None:
+            week_number = run_week()
+
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        file_path = report_path(self.name, week_number)
+
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+
+        print(f"⏱️ Report metriche salvato: {file_path}")
+        return file_path
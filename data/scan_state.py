@@ -0,0 +1,293 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from memory_guard import CHUNK_SIZE, MAX_RSS_MB
+from security_master import canonical_symbol
+import snapshot
+from snapshot import add_snapshot_args, snapshot_cli_args
+from sharding import add_shard_args, shard_cli_args
+
+# =========================
+# PATH CACHE
+# =========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, "checkpoints")
+NEGATIVE_CACHE_FILE = os.path.join(CACHE_DIR, "negative_cache.json")
+
+# =========================
+# PARAMETRI RETRY (sovrascrivibili da CLI con configure)
+# =========================
+RETRIES = 3          # tentativi extra dopo il primo
+BASE_DELAY = 1.0     # secondi, raddoppia a ogni tentativo
+MAX_DELAY = 30.0     # tetto del backoff
+
+
+def add_scan_args(parser):
+    """
+    Opzioni comuni per retry, negative cache e checkpoint.
+    """
+    parser.add_argument("--retries", type=int, default=RETRIES,
+                        help="Tentativi extra per download falliti o vuoti")
+    parser.add_argument("--neg_cache_days", type=float, default=7,
+                        help="Giorni in cui un ticker che fallisce sempre viene saltato")
+    parser.add_argument("--neg_cache_failures", type=int, default=3,
+                        help="Fallimenti consecutivi prima di mettere un ticker in negative cache")
+    parser.add_argument("--no_resume", action="store_true",
+                        help="Ignora il checkpoint esistente e riparte da zero")
+    parser.add_argument("--no_incremental", action="store_true",
+                        help="Ricalcola tutti i ticker anche se le barre di input non sono cambiate")
+    parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE,
+                        help="Ticker per blocco: a fine blocco si libera la memoria e si misura l'RSS")
+    parser.add_argument("--max_rss_mb", type=float, default=MAX_RSS_MB,
+                        help="Tetto RSS in MB: oltre, il run si ferma (checkpoint salvato) (0 = nessun limite)")
+    add_snapshot_args(parser)
+    add_shard_args(parser)
+    return parser
+
+
+def scan_cli_args(args, shard=True):
+    # Argomenti da inoltrare ai sottoprocessi (master.py); shard=False per
+    # gli stadi che lavorano sull'output già unito
+    cli = ["--retries", str(args.retries),
+           "--neg_cache_days", str(args.neg_cache_days),
+           "--neg_cache_failures", str(args.neg_cache_failures),
+           "--chunk_size", str(args.chunk_size),
+           "--max_rss_mb", str(args.max_rss_mb)]
+    if args.no_resume:
+        cli.append("--no_resume")
+    if args.no_incremental:
+        cli.append("--no_incremental")
+    cli += snapshot_cli_args(args)
+    if shard:
+        cli += shard_cli_args(args)
+    return cli
+
+
+def configure(args):
+    global RETRIES
+    RETRIES = args.retries
+    snapshot.configure(args)
+
+
+# =========================
+# RETRY CON BACKOFF ESPONENZIALE + JITTER
+# =========================
+def _is_empty(result):
+    if result is None:
+        return True
+    if isinstance(result, (dict, list)):
+        return not result
+    return isinstance(result, (pd.DataFrame, pd.Series)) and result.empty
+
+
+def retry_call(fn, *args, label="", retries=None, metrics=None, **kwargs):
+    """
+    Chiama fn finché restituisce un risultato non vuoto, con backoff
+    esponenziale "full jitter". Dopo l'ultimo tentativo rilancia l'eccezione
+    oppure restituisce il risultato vuoto.
+    """
+    retries = RETRIES if retries is None else retries
+
+    for attempt in range(retries + 1):
+        error = None
+        try:
+            result = fn(*args, **kwargs)
+            if not _is_empty(result):
+                return result
+        except Exception as e:
+            error = e
+            result = None
+
+        if attempt == retries:
+            if error is not None:
+                raise error
+            return result
+
+        delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+        reason = f"{type(error).__name__}" if error is not None else "vuoto"
+        print(f"🔁 Retry {label} ({attempt + 1}/{retries}, {reason}) tra {delay:.1f}s")
+        if metrics is not None:
+            metrics.fail("retry")
+        time.sleep(delay)
+
+
+# yf.download non è thread-safe (raccoglie i risultati in dizionari globali
+# di yfinance.shared): i worker di SupertrendPipeline e del servizio
+# scaricano uno alla volta, il calcolo resta in parallelo
+_download_lock = threading.Lock()
+
+
+def _yf_download(*args, **kwargs):
+    with _download_lock:
+        return yf.download(*args, **kwargs)
+
+
+def download(ticker, metrics=None, **kwargs):
+    """
+    yf.download con retry; in caso di fallimento definitivo restituisce un
+    DataFrame vuoto (come fa yfinance per i ticker non trovati). Un ticker
+    singolo viene scaricato sempre con il simbolo canonico.
+    """
+    if isinstance(ticker, str):
+        ticker = canonical_symbol(ticker)
+    kwargs.setdefault("progress", False)
+
+    def fetch():
+        try:
+            return retry_call(_yf_download, ticker, label=ticker, metrics=metrics, **kwargs)
+        except Exception as e:
+            print(f"❌ Download fallito {ticker}: {e}")
+            return pd.DataFrame()
+
+    df = snapshot.recorded("download", {"ticker": ticker, **kwargs}, fetch)
+    return df if df is not None else pd.DataFrame()
+
+
+# =========================
+# JSON con date / numpy
+# =========================
+def _json_default(obj):
+    if isinstance(obj, (datetime, pd.Timestamp)):
+        return {"__datetime__": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"__date__": obj.isoformat()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Tipo non serializzabile: {type(obj).__name__}")
+
+
+def _json_hook(obj):
+    if "__datetime__" in obj:
+        return pd.Timestamp(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def _atomic_write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, default=_json_default)
+    os.replace(tmp, path)
+
+
+# =========================
+# CHECKPOINT PER TICKER
+# =========================
+class Checkpoint:
+    """
+    Log JSONL dei ticker già elaborati in un run: ogni riga è
+    {"ticker": ..., "rows": [...]} e viene scritta appena il ticker termina,
+    così un run interrotto riparte da dove si era fermato.
+    """
+
+    def __init__(self, name, resume=True):
+        self.path = os.path.join(CHECKPOINT_DIR, f"{snapshot.scoped(name)}.jsonl")
+        self.done = {}
+
+        if resume and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line, object_hook=_json_hook)
+                    except ValueError:
+                        break  # riga troncata da un kill: il ticker verrà rifatto
+                    self.done[entry["ticker"]] = entry["rows"]
+            print(f"♻️ Checkpoint {name}: {len(self.done)} ticker già elaborati")
+
+        # Riscrive il file con le sole righe valide, poi prosegue in append
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        self._f = open(self.path, "w", encoding="utf-8")
+        for ticker, rows in self.done.items():
+            self._write(ticker, rows)
+
+    def _write(self, ticker, rows):
+        self._f.write(json.dumps({"ticker": ticker, "rows": rows}, default=_json_default) + "\n")
+        self._f.flush()
+
+    def __contains__(self, ticker):
+        return ticker in self.done
+
+    def save(self, ticker, rows=()):
+        rows = list(rows)
+        self.done[ticker] = rows
+        self._write(ticker, rows)
+
+    def rows(self):
+        return [r for rows in self.done.values() for r in rows]
+
+    def clear(self):
+        # Run completato: il checkpoint non serve più
+        self._f.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# =========================
+# NEGATIVE CACHE (ticker morti / delisted)
+# =========================
+class NegativeCache:
+    """
+    Ricorda i ticker i cui download falliscono run dopo run: dopo
+    max_failures fallimenti consecutivi il ticker viene saltato per ttl_days.
+    Si conta al massimo un fallimento per data del run: le config dello
+    stesso master non sommano lo stesso disservizio del provider.
+    In replay è spenta: gli esiti dipendono solo dal bundle.
+    """
+
+    def __init__(self, ttl_days=7, max_failures=3, path=NEGATIVE_CACHE_FILE):
+        self.path = path
+        self.ttl = timedelta(days=ttl_days)
+        self.max_failures = max_failures
+        self.entries = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                print(f"⚠️ Negative cache illeggibile, la ricreo: {path}")
+
+    @classmethod
+    def from_args(cls, args, path=NEGATIVE_CACHE_FILE):
+        return cls(ttl_days=args.neg_cache_days, max_failures=args.neg_cache_failures, path=path)
+
+    def should_skip(self, ticker):
+        if snapshot.replaying():
+            return False
+        entry = self.entries.get(ticker)
+        if not entry or not entry.get("skip_until"):
+            return False
+        return datetime.now() < datetime.fromisoformat(entry["skip_until"])
+
+    def record_failure(self, ticker, reason=""):
+        if snapshot.replaying():
+            return
+        entry = self.entries.setdefault(ticker, {"failures": 0})
+        day = snapshot.run_date().isoformat()
+        if entry.get("run_date") == day:
+            return
+        entry["failures"] += 1
+        entry["run_date"] = day
+        entry["last_failure"] = datetime.now().isoformat(timespec="seconds")
+        entry["reason"] = reason
+        if entry["failures"] >= self.max_failures:
+            entry["skip_until"] = (datetime.now() + self.ttl).isoformat(timespec="seconds")
+            print(f"🚫 {ticker} in negative cache fino al {entry['skip_until']}")
+        _atomic_write_json(self.path, self.entries)
+
+    def record_success(self, ticker):
+        if snapshot.replaying():
+            return
+        if self.entries.pop(ticker, None) is not None:
+            _atomic_write_json(self.path, self.entries)
@@ -0,0 +1,490 @@
+# =========================
+# SCANNER SERVICE (HTTP locale)
+# =========================
+# Tiene in memoria gli indicatori di tutto l'universo (le barre restano nel
+# bar store su disco), li aggiorna a intervalli regolari solo per i ticker
+# con barre nuove e risponde alle query di screening senza rifare il run
+# completo.
+#
+#   python data/scanner_service.py --port 8765
+#   curl "http://127.0.0.1:8765/screen?poc_dist_2y__abs_le=3&st_d_delta__gt=0"
+#   curl -G "http://127.0.0.1:8765/screen" --data-urlencode "expr=abs(poc_dist_2y) <= 3 and st_d_delta > 0"
+#
+# I filtri campo__op=valore sono una scorciatoia: vengono tradotti in
+# un'espressione di screener.py e valutati con screener.Screen sulla tabella
+# del servizio, quindi valgono le stesse regole sui valori mancanti (un
+# confronto con un NaN non fa mai passare il ticker, nemmeno con ne).
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlparse
+
+import numpy as np
+import pandas as pd
+
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from indicators import supertrend
+from volume_profile import poc_price
+from bar_store import get_bars, resample_bars, slice_period, MAX_AGE_HOURS
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import NegativeCache, add_scan_args, configure
+from memory_guard import MemoryGuard, MemoryLimitExceeded, categorize
+from screener import Screen
+from security_master import canonical_symbol
+from incremental import fingerprint
+from key_reversal import key_reversal_panel
+import rsi_divergence
+
+metrics = RunMetrics("scanner_service")
+
+# =========================
+# PARAMETRI (come gli script batch)
+# =========================
+POC_PERIODS = [2, 5, 20]             # anni, come i CONFIGS di master.py
+ATR_PERIOD = 10
+MULTIPLIER = 3.0
+ST_TIMEFRAMES = {                    # (interval, lookback) di merge_poc_supertrend.py
+    "d": ("1d", "1y"),
+    "w": ("1wk", "5y"),
+    "m": ("1mo", "10y"),
+}
+FILTER_START_DATE = pd.Timestamp("2000-01-01")
+
+# Operatori ammessi nei filtri campo__op=valore → espressione di screener.py
+OPS = {
+    "lt": "{f} < {v}",
+    "le": "{f} <= {v}",
+    "gt": "{f} > {v}",
+    "ge": "{f} >= {v}",
+    "eq": "{f} == {v}",
+    "ne": "{f} != {v}",
+    "abs_lt": "abs({f}) < {v}",
+    "abs_le": "abs({f}) <= {v}",
+    "abs_gt": "abs({f}) > {v}",
+    "abs_ge": "abs({f}) >= {v}",
+    "in": "{f} in {v}",
+    "contains": "contains({f}, {v})",
+}
+
+
+# =========================
+# INDICATORI PER TICKER
+# =========================
+def st_delta(df):
+    # Delta % close vs SuperTrend TV (stessa logica di compute_st_and_delta)
+    df = df.dropna(subset=["High", "Low", "Close"])
+    if len(df) < ATR_PERIOD * 3:
+        return np.nan
+    st = supertrend(df["High"].values, df["Low"].values, df["Close"].values, ATR_PERIOD, MULTIPLIER)
+    st_last = float(st[-1])
+    if np.isnan(st_last) or st_last <= 0:
+        return np.nan
+    return round((float(df["Close"].iloc[-1]) - st_last) / st_last * 100, 2)
+
+
+def drawdowns(close):
+    close = close[close.index >= FILTER_START_DATE].dropna()
+    if close.empty:
+        return np.nan, np.nan, np.nan, np.nan
+    cummax = close.cummax()
+    dd = (cummax - close) / cummax * 100
+    return float(close.max()), float(dd.max()), float(dd.mean()), float(dd.iloc[-1])
+
+
+def compute_row(ticker, bars, index_name="", poc_periods=POC_PERIODS):
+    """
+    Una riga della tabella in memoria: prezzo, POC e distanza per ogni
+    periodo, delta SuperTrend, drawdown, ultima divergenza RSI e key reversal.
+    """
+    price = float(bars["Close"].iloc[-1])
+    row = {
+        "ticker": ticker,
+        "index": index_name,
+        "last_bar": bars.index[-1].date().isoformat(),
+        "price": round(price, 4),
+    }
+
+    for p in poc_periods:
+        window = slice_period(bars, f"{p}y")
+        poc = poc_price(window["High"].values, window["Low"].values, window["Volume"].values)
+        row[f"poc_{p}y"] = round(poc, 4) if poc else np.nan
+        row[f"poc_dist_{p}y"] = round((price - poc) / poc * 100, 2) if poc else np.nan
+
+    for key, (interval, lookback) in ST_TIMEFRAMES.items():
+        row[f"st_{key}_delta"] = st_delta(resample_bars(slice_period(bars, lookback), interval))
+
+    close_adj = bars["Adj Close"] if "Adj Close" in bars.columns else bars["Close"]
+    ath, max_dd, avg_dd, cur_dd = drawdowns(close_adj)
+    row.update({
+        "ath": round(ath, 4),
+        "max_dd": round(max_dd, 2),
+        "avg_dd": round(avg_dd, 2),
+        "cur_dd": round(cur_dd, 2),
+    })
+
+    divs = rsi_divergence.scan_divergences(ticker, bars, ("weekly",), (2,))
+    last_div = max(divs, key=lambda d: d["Date2"]) if divs else None
+    row["div_weekly"] = last_div["Mode"] if last_div else None
+    row["div_date"] = last_div["Date2"].isoformat() if last_div else None
+
+    weekly = resample_bars(slice_period(bars, "2y"), "1wk")
+    kr = key_reversal_panel(weekly[["High"]].set_axis([ticker], axis=1),
+                            weekly[["Low"]].set_axis([ticker], axis=1),
+                            weekly[["Close"]].set_axis([ticker], axis=1))
+    row["kr_signal"] = kr["Signal"].iloc[-1] if not kr.empty else None
+    row["kr_date"] = kr["Date"].iloc[-1] if not kr.empty else None
+    return row
+
+
+# =========================
+# STATO IN MEMORIA
+# =========================
+class ScannerState:
+    """
+    Tabella indicatori dell'universo. Il refresh rilegge solo le barre
+    scadute e ricalcola solo i ticker la cui ultima barra è cambiata; la
+    tabella viene sostituita in blocco, quindi le query non vedono mai uno
+    stato a metà. Delle barre resta in memoria solo l'impronta (numero di
+    barre, ultima data e close): i frame stanno nel bar store su disco.
+    """
+
+    def __init__(self, tickers, ticker_to_index, max_age_hours=MAX_AGE_HOURS,
+                 poc_periods=POC_PERIODS, neg_cache=None, guard=None):
+        self.tickers = tickers
+        self.ticker_to_index = ticker_to_index
+        self.max_age = timedelta(hours=max_age_hours)
+        self.poc_periods = poc_periods
+        self.neg_cache = neg_cache
+        self.guard = guard
+        self.bar_keys = {}
+        self.loaded_at = {}
+        self.rows = {}
+        self.table = pd.DataFrame()
+        self.refreshed_at = None
+        self.last_refresh = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        # Un solo refresh alla volta; le query continuano sulla tabella corrente
+        if not self._lock.acquire(blocking=False):
+            return {"status": "already_running"}
+
+        try:
+            t0 = time.perf_counter()
+            fetched = recomputed = failed = 0
+            now = datetime.now()
+
+            with metrics.stage("refresh"):
+                for ticker in self.tickers:
+                    if self.neg_cache is not None and self.neg_cache.should_skip(ticker):
+                        metrics.fail("negative_cache_skip")
+                        continue
+                    if ticker in self.bar_keys and now - self.loaded_at[ticker] < self.max_age:
+                        continue
+                    if self.guard is not None:
+                        self.guard.tick()
+
+                    try:
+                        with metrics.timed("download"):
+                            df = get_bars(ticker, "1d", "max", max_age_hours=self.max_age.total_seconds() / 3600,
+                                          metrics=metrics)
+                    except Exception as e:
+                        print(f"❌ Errore barre {ticker}: {e}")
+                        metrics.fail_exc(e)
+                        failed += 1
+                        continue
+
+                    if df.empty or not {"High", "Low", "Close", "Volume"} <= set(df.columns):
+                        metrics.fail("no_data")
+                        if self.neg_cache is not None:
+                            self.neg_cache.record_failure(ticker, "no_data")
+                        failed += 1
+                        continue
+                    if self.neg_cache is not None:
+                        self.neg_cache.record_success(ticker)
+
+                    fetched += 1
+                    key = fingerprint(df)
+                    self.loaded_at[ticker] = now
+                    if ticker in self.rows and self.bar_keys.get(ticker) == key:
+                        continue  # nessuna barra nuova: riga invariata
+                    self.bar_keys[ticker] = key
+
+                    try:
+                        with metrics.timed("compute"):
+                            self.rows[ticker] = compute_row(
+                                ticker, df, self.ticker_to_index.get(ticker, ""), self.poc_periods
+                            )
+                        recomputed += 1
+                        metrics.ticker_done()
+                    except Exception as e:
+                        print(f"⚠️ Errore indicatori {ticker}: {e}")
+                        metrics.fail_exc(e)
+                        failed += 1
+
+                table = pd.DataFrame(list(self.rows.values()))
+                if not table.empty:
+                    table = categorize(table, ("index", "div_weekly", "kr_signal"))
+                    table = table.set_index("ticker", drop=False)
+                self.table = table
+
+            if self.guard is not None:
+                self.guard.check()
+
+            self.refreshed_at = datetime.now()
+            self.last_refresh = {
+                "status": "ok",
+                "finished_at": self.refreshed_at.isoformat(timespec="seconds"),
+                "seconds": round(time.perf_counter() - t0, 2),
+                "loaded": fetched,
+                "recomputed": recomputed,
+                "failed": failed,
+                "tickers": len(self.table),
+            }
+            print(f"🔄 Refresh: {self.last_refresh}")
+            return self.last_refresh
+        except MemoryLimitExceeded as e:
+            # Il limite di memoria ferma solo questo refresh: la tabella resta
+            # quella precedente, /health riporta l'errore e il thread del
+            # refresh periodico resta vivo (MemoryLimitExceeded non è Exception)
+            self.last_refresh = {
+                "status": "error",
+                "error": str(e),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "seconds": round(time.perf_counter() - t0, 2),
+            }
+            print(f"🔄 Refresh interrotto: {self.last_refresh}")
+            return self.last_refresh
+        finally:
+            self._lock.release()
+
+    def schedule(self, minutes):
+        # Refresh periodico in un thread daemon
+        def loop():
+            while True:
+                time.sleep(minutes * 60)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"❌ Refresh fallito: {e}")
+                    metrics.fail_exc(e)
+
+        threading.Thread(target=loop, name="scanner-refresh", daemon=True).start()
+
+
+# =========================
+# QUERY
+# =========================
+def _parse_value(v):
+    try:
+        return float(v)
+    except ValueError:
+        return v
+
+
+def query_expression(params):
+    """
+    Parametri della query → un'unica espressione di screener.py: expr così
+    com'è, ogni campo__op=valore tradotto con OPS, tutto in AND.
+    """
+    parts = [f"({params['expr']})"] if params.get("expr") else []
+    for key, value in params.items():
+        if key in ("expr", "fields", "sort", "desc", "limit"):
+            continue
+        field, _, op = key.partition("__")
+        op = op or "eq"
+        if not field.isidentifier():
+            raise ValueError(f"Campo sconosciuto: {field}")
+        if op not in OPS:
+            raise ValueError(f"Operatore sconosciuto: {op}")
+        if op == "in":
+            value = [_parse_value(v) for v in value.split(",")]
+        elif op != "contains":
+            value = _parse_value(value)
+        parts.append(f"({OPS[op].format(f=field, v=repr(value))})")
+    return " and ".join(parts)
+
+
+def screen(table, params):
+    """
+    Filtra la tabella con expr=<espressione screener> e/o parametri
+    campo__op=valore (AND tra tutti). Parametri speciali: fields, sort,
+    desc, limit. Gli errori di sintassi e i campi sconosciuti sono
+    ScreenError (ValueError → 400).
+    """
+    expression = query_expression(params)
+    if table.empty:
+        return table
+
+    out = table
+    if expression:
+        query = Screen("query", expression, fields=table.columns)
+        try:
+            out = table[query.mask(table).to_numpy()]
+        except TypeError as e:
+            raise ValueError(f"Confronto non valido in '{expression}': {e}")
+
+    if params.get("sort"):
+        if params["sort"] not in out.columns:
+            raise ValueError(f"Campo sconosciuto: {params['sort']}")
+        out = out.sort_values(params["sort"], ascending=params.get("desc", "0") in ("0", "false"))
+    if params.get("fields"):
+        fields = [f for f in params["fields"].split(",") if f]
+        missing = [f for f in fields if f not in out.columns]
+        if missing:
+            raise ValueError(f"Campi sconosciuti: {', '.join(missing)}")
+        out = out[fields]
+    if params.get("limit"):
+        out = out.head(int(params["limit"]))
+    return out
+
+
+def _records(df):
+    # NaN → null nel JSON
+    return json.loads(df.to_json(orient="records"))
+
+
+class Handler(BaseHTTPRequestHandler):
+    state = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass  # niente log per richiesta su stderr
+
+    def do_GET(self):
+        t0 = time.perf_counter()
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+        table = self.state.table
+
+        try:
+            if url.path == "/health":
+                payload = {
+                    "tickers": len(table),
+                    "refreshed_at": self.state.refreshed_at.isoformat(timespec="seconds")
+                    if self.state.refreshed_at else None,
+                    "last_refresh": self.state.last_refresh,
+                }
+            elif url.path == "/fields":
+                payload = {"fields": list(table.columns), "ops": list(OPS)}
+            elif url.path == "/screen":
+                out = screen(table, params)
+                payload = {"count": len(out), "rows": _records(out)}
+            elif url.path.startswith("/ticker/"):
+                ticker = canonical_symbol(unquote(url.path[len("/ticker/"):]))
+                if table.empty or ticker not in table.index:
+                    self._send(404, {"error": f"Ticker non in memoria: {ticker}"})
+                    return
+                payload = _records(table.loc[[ticker]])[0]
+            elif url.path == "/metrics":
+                payload = metrics.report()
+            else:
+                self._send(404, {"error": f"Endpoint sconosciuto: {url.path}"})
+                return
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+
+        payload = {"took_ms": round((time.perf_counter() - t0) * 1000, 2), **payload} \
+            if isinstance(payload, dict) else payload
+        self._send(200, payload)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/refresh":
+            self._send(404, {"error": f"Endpoint sconosciuto: {self.path}"})
+            return
+        # Refresh in background: la risposta non aspetta i download
+        threading.Thread(target=self.state.refresh, daemon=True).start()
+        self._send(202, {"status": "started"})
+
+
+# =========================
+# ESECUZIONE PRINCIPALE
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Scanner service locale (HTTP)")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--refresh_minutes", type=float, default=60,
+                        help="Intervallo tra due refresh incrementali (0 = nessun refresh automatico)")
+    parser.add_argument("--max_age_hours", type=float, default=MAX_AGE_HOURS,
+                        help="Età massima delle barre in memoria/cache prima di riscaricarle")
+    parser.add_argument("--poc_periods", type=str, default=",".join(map(str, POC_PERIODS)),
+                        help="Periodi POC in anni separati da virgola (es. 2,5)")
+    parser.add_argument("--query", type=str, default=None,
+                        help="Esegue una sola query (es. 'poc_dist_2y__abs_le=3&st_d_delta__gt=0' "
+                             "o 'expr=st_d_delta > 0 and st_w_delta > 0') ed esce")
+    add_profile_args(parser)
+    add_scan_args(parser)
+    args = parser.parse_args()
+    configure(args)
+    start_from_args(args, "scanner_service")
+
+    with metrics.stage("universe"):
+        ticker_dict = get_all_tickers(flat=False)
+    ticker_to_index = {}
+    for idx_name, tickers in ticker_dict.items():
+        for t in tickers:
+            if t in ticker_to_index:
+                ticker_to_index[t] += f", {idx_name}"
+            else:
+                ticker_to_index[t] = idx_name
+
+    all_tickers = limit_tickers(list(ticker_to_index.keys()), args)
+    metrics.tickers_total = len(all_tickers)
+    print(f"Trovati {len(all_tickers)} ticker tra tutti gli indici")
+
+    state = ScannerState(
+        all_tickers,
+        ticker_to_index,
+        max_age_hours=args.max_age_hours,
+        poc_periods=[int(p) for p in args.poc_periods.split(",") if p.strip()],
+        neg_cache=NegativeCache.from_args(args),
+        guard=MemoryGuard.from_args(args, metrics),
+    )
+    print("⏳ Caricamento iniziale dell'universo in memoria...")
+    state.refresh()
+
+    if args.query is not None:
+        out = screen(state.table, dict(parse_qsl(args.query)))
+        print(out.to_string(index=False) if not out.empty else "🚫 Nessun ticker soddisfa la query.")
+        metrics.write()
+        return
+
+    if args.refresh_minutes > 0:
+        state.schedule(args.refresh_minutes)
+
+    Handler.state = state
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"✅ Scanner in ascolto su http://{args.host}:{args.port} (endpoint: /screen, /ticker/<T>, /fields, /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Scanner fermato")
+    finally:
+        server.server_close()
+        metrics.write()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+# =========================
+# SCREENER DICHIARATIVO
+# =========================
+# Un'unica tabella di metriche per ticker (POC + SuperTrend, drawdown,
+# ultima divergenza RSI, ultimo key reversal, settore/indice/market cap)
+# e filtri scritti come espressioni, compilati una volta in operazioni di
+# colonna pandas: un nuovo screen gira sui dati già calcolati in pochi
+# millisecondi, senza un nuovo script.
+#
+#   python data/screener.py --screen "abs(poc_dist) <= 3 and st_d > 0 and div_type == 'UP'"
+#   python data/screener.py --screen "rimbalzo=kr_type == 'UP' and days(kr_date) <= 10"
+#
+# Sintassi (sottoinsieme di Python, validato sull'AST: niente attributi,
+# indici, lambda o chiamate fuori da FUNCTIONS):
+#   campi        nomi di FIELDS (poc_dist, st_d, dd_cur, div_type, sector...)
+#   confronti    == != < <= > >= (anche a catena: 0 < st_d < 5), in / not in [...]
+#   logica       and, or, not
+#   aritmetica   + - * /
+#   funzioni     abs, min, max (elemento per elemento), isna, notna,
+#                contains(campo, "testo"), days(campo data), between(x, lo, hi)
+# Un confronto con un valore mancante è indeterminato (logica a tre valori,
+# come in SQL): resta tale con not e !=, and/or lo risolvono solo se l'altro
+# lato basta (NA and False = False, NA or True = True). Un risultato
+# indeterminato a fine screen vale falso: il ticker non passa. min/max con
+# un valore mancante danno NaN; per cercare i mancanti si usano isna/notna.
+
+import argparse
+import ast
+import operator
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
+# Campo dello screen → colonna di origine (file POC_ST, tickers_info)
+POC_FIELDS = {
+    "ticker": "Ticker",
+    "index": "Indice",
+    "poc": "POC",
+    "val": "VAL",
+    "vah": "VAH",
+    "hvn": "HVN vicino",
+    "lvn": "LVN vicino",
+    "price": "Prezzo Attuale",
+    "poc_dist": "Distanza POC %",
+    "ath": "All Time High",
+    "dd_max": "Max Drawdown %",
+    "dd_avg": "Avg Drawdown %",
+    "dd_cur": "Current Drawdown %",
+    "st_4h": "ST_4H_Delta%",
+    "st_d": "ST_Daily_Delta%",
+    "st_w": "ST_Weekly_Delta%",
+    "st_m": "ST_Monthly_Delta%",
+}
+INFO_FIELDS = {
+    "name": "name",
+    "sector": "sector",
+    "exchange": "exchange",
+    "currency": "currency",
+    "market_cap": "market_cap_B",
+    "poc_h_240": "poc_h_240",
+    # Co-movimento (comovement.py): cluster di correlazione e forza relativa di settore
+    "cluster": "cluster",
+    "corr_sector": "corr_sector",
+    "rs_1m": "rs_sector_1m",
+    "rs_3m": "rs_sector_3m",
+    "rs_6m": "rs_sector_6m",
+    "rs_12m": "rs_sector_12m",
+}
+SIGNAL_FIELDS = ["kr_date", "kr_type", "div_date", "div_type", "div_tf", "div_rsi1", "div_rsi2"]
+FIELDS = list(POC_FIELDS) + SIGNAL_FIELDS + list(INFO_FIELDS)
+
+# Screen predefiniti: i filtri oggi sparsi tra script e notebook
+SCREENS = {
+    # Foglio "Segnali" del report (notebook FINALE): almeno un KR o una divergenza
+    "segnali": "notna(kr_type) or notna(div_type)",
+    "st_rialzista": "st_d > 0 and st_w > 0 and st_m > 0",
+    "rimbalzo_poc": "abs(poc_dist) <= 3 and (kr_type == 'UP' or div_type == 'UP')",
+    "ipervenduto": "div_type == 'UP' and min(div_rsi1, div_rsi2) < 30 and dd_cur > 20",
+}
+
+
+class ScreenError(ValueError):
+    pass
+
+
+# =========================
+# TABELLA METRICHE
+# =========================
+def latest_signals(df_kr, df_div):
+    """
+    Ultimo key reversal e ultima divergenza per ticker (come il notebook
+    FINALE), tipi normalizzati a UP/DOWN. Restituisce due frame indicizzati
+    per Ticker (vuoti se il file manca).
+    """
+    kr = pd.DataFrame(columns=["kr_date", "kr_type"])
+    if df_kr is not None and not df_kr.empty:
+        kr = df_kr.assign(Date=pd.to_datetime(df_kr["Date"]))
+        kr = kr.sort_values(["Ticker", "Date"], ascending=[True, False]).drop_duplicates("Ticker")
+        kr = kr.set_index("Ticker")[["Date", "Signal"]].rename(columns={"Date": "kr_date", "Signal": "kr_type"})
+        kr["kr_type"] = kr["kr_type"].astype(object).replace({"Rialzista": "UP", "Ribassista": "DOWN"})
+
+    div = pd.DataFrame(columns=["div_date", "div_type", "div_tf", "div_rsi1", "div_rsi2"])
+    if df_div is not None and not df_div.empty:
+        div = df_div.assign(Date2=pd.to_datetime(df_div["Date2"]))
+        div = div.sort_values(["Ticker", "Date2"], ascending=[True, False]).drop_duplicates("Ticker")
+        div = div.set_index("Ticker")[["Date2", "Mode", "Timeframe", "RSI1", "RSI2"]]
+        div.columns = ["div_date", "div_type", "div_tf", "div_rsi1", "div_rsi2"]
+        div["div_type"] = div["div_type"].astype(object).replace({"bullish": "UP", "bearish": "DOWN"})
+    return kr, div
+
+
+def metrics_table(df_poc, df_kr=None, df_div=None, df_info=None):
+    """
+    Una riga per ticker della tabella POC (+ SuperTrend), colonne = FIELDS.
+    I ticker senza segnali o senza info restano con NaN nei campi relativi.
+    """
+    table = pd.DataFrame({field: df_poc[col] if col in df_poc.columns else np.nan
+                          for field, col in POC_FIELDS.items()})
+    table["ticker"] = table["ticker"].astype(str)
+
+    kr, div = latest_signals(df_kr, df_div)
+    table = table.join(kr, on="ticker").join(div, on="ticker")
+    for col in ("kr_date", "div_date"):
+        table[col] = pd.to_datetime(table[col])
+
+    if df_info is not None and not df_info.empty:
+        info = df_info.drop_duplicates("ticker").set_index("ticker")
+        info = pd.DataFrame({field: info[col] if col in info.columns else np.nan
+                             for field, col in INFO_FIELDS.items()}, index=info.index)
+        table = table.join(info, on="ticker")
+        if "index" in df_info.columns:
+            table["index"] = table["index"].fillna(table["ticker"].map(df_info.set_index("ticker")["index"]))
+    else:
+        for field in INFO_FIELDS:
+            table[field] = np.nan
+    return table[FIELDS].reset_index(drop=True)
+
+
+# =========================
+# COMPILAZIONE ESPRESSIONI
+# =========================
+_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne,
+    ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+_BINARY = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
+
+def _series(value, df):
+    return value if isinstance(value, pd.Series) else pd.Series(value, index=df.index)
+
+
+def _truth(value, df):
+    # Series "boolean" nullable: NA resta NA (and/or/not di pandas sono di Kleene)
+    s = _series(value, df)
+    if pd.api.types.is_bool_dtype(s):
+        return s.astype("boolean")
+    return s.map(bool, na_action="ignore").astype("boolean")
+
+
+def _unknown_if_missing(result, df, *operands):
+    # Esito di un confronto: NA dove un operando manca (NaN, NaT, None)
+    out = _truth(result, df)
+    for x in operands:
+        if isinstance(x, pd.Series):
+            out = out.mask(x.isna().to_numpy())
+    return out
+
+
+def _mask(value, df):
+    # Solo a fine screen: indeterminato → False
+    return _truth(value, df).fillna(False).astype(bool)
+
+
+def _between(df, as_of, x, lo, hi):
+    x = _series(x, df)
+    return _unknown_if_missing((x >= lo) & (x <= hi), df, x, lo, hi)
+
+
+def _elementwise(fn):
+    def call(df, as_of, *args):
+        values = [_series(a, df).astype("float64") for a in args]
+        out = values[0]
+        for v in values[1:]:
+            out = pd.Series(fn(out, v), index=df.index)
+        return out
+    return call
+
+
+def _days(df, as_of, dates):
+    return (pd.Timestamp(as_of) - pd.to_datetime(_series(dates, df))).dt.days
+
+
+def _contains(df, as_of, values, text):
+    return _series(values, df).astype("string").str.contains(str(text), case=False, regex=False)
+
+
+FUNCTIONS = {
+    "abs": lambda df, as_of, x: _series(x, df).abs(),
+    "min": _elementwise(np.minimum),
+    "max": _elementwise(np.maximum),
+    "isna": lambda df, as_of, x: _series(x, df).isna(),
+    "notna": lambda df, as_of, x: _series(x, df).notna(),
+    "contains": _contains,
+    "days": _days,
+    "between": _between,
+}
+
+
+def _compile(node, fields, allowed=FIELDS):
+    """
+    Nodo AST → funzione (df, as_of) → Series o scalare. Solleva ScreenError
+    per qualunque costrutto fuori dalla grammatica o campo fuori da allowed.
+    """
+    if isinstance(node, ast.Expression):
+        return _compile(node.body, fields, allowed)
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+        value = node.value
+        return lambda df, as_of: value
+
+    if isinstance(node, ast.Name):
+        if node.id not in allowed:
+            raise ScreenError(f"Campo sconosciuto '{node.id}' (campi: {', '.join(allowed)})")
+        fields.add(node.id)
+        name = node.id
+        return lambda df, as_of: df[name]
+
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(v, fields, allowed) for v in node.values]
+        combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+
+        def boolop(df, as_of):
+            out = _truth(parts[0](df, as_of), df)
+            for part in parts[1:]:
+                out = combine(out, _truth(part(df, as_of), df))
+            return out
+        return boolop
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile(node.operand, fields, allowed)
+        if isinstance(node.op, ast.Not):
+            return lambda df, as_of: ~_truth(operand(df, as_of), df)
+        if isinstance(node.op, ast.USub):
+            return lambda df, as_of: -operand(df, as_of)
+        if isinstance(node.op, ast.UAdd):
+            return operand
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        op = _BINARY[type(node.op)]
+        left, right = _compile(node.left, fields, allowed), _compile(node.right, fields, allowed)
+        return lambda df, as_of: op(left(df, as_of), right(df, as_of))
+
+    if isinstance(node, ast.Compare):
+        terms = [_compile(node.left, fields, allowed)]
+        tests = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                try:
+                    values = list(ast.literal_eval(comparator))
+                except (ValueError, TypeError, SyntaxError):
+                    raise ScreenError("'in' vuole una lista di valori: campo in ['A', 'B']")
+                negate = isinstance(op, ast.NotIn)
+                tests.append((negate, values))
+                terms.append(None)
+            elif type(op) in _COMPARE:
+                tests.append((_COMPARE[type(op)], None))
+                terms.append(_compile(comparator, fields, allowed))
+            else:
+                raise ScreenError(f"Operatore di confronto non ammesso: {type(op).__name__}")
+
+        def compare(df, as_of):
+            out = None
+            left = terms[0](df, as_of)
+            for (op, values), term in zip(tests, terms[1:]):
+                left = _series(left, df)
+                if values is not None:
+                    result = left.isin(values)
+                    result = _unknown_if_missing(~result if op else result, df, left)
+                else:
+                    right = term(df, as_of)
+                    result = _unknown_if_missing(op(left, right), df, left, right)
+                    left = right
+                out = result if out is None else out & result
+            return out
+        return compare
+
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            name = ast.unparse(node.func)
+            raise ScreenError(f"Funzione non ammessa: {name} (ammesse: {', '.join(FUNCTIONS)})")
+        fn = FUNCTIONS[node.func.id]
+        args = [_compile(a, fields, allowed) for a in node.args]
+        return lambda df, as_of: fn(df, as_of, *(a(df, as_of) for a in args))
+
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        raise ScreenError("Le liste sono ammesse solo dopo 'in' / 'not in'")
+    raise ScreenError(f"Costrutto non ammesso: {type(node).__name__}")
+
+
+class Screen:
+    """
+    Espressione compilata: mask(table) restituisce la Series booleana,
+    apply(table) le righe che passano. as_of è la data usata da days().
+    fields sono i nomi ammessi (default FIELDS, la tabella settimanale;
+    lo scanner service passa le colonne della sua tabella).
+    """
+
+    def __init__(self, name, expression, fields=None):
+        self.name = name
+        self.expression = expression
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ScreenError(f"Screen '{name}': sintassi non valida ({e.msg})")
+        self.fields = set()
+        self._fn = _compile(tree, self.fields, list(fields) if fields is not None else FIELDS)
+
+    def mask(self, table, as_of=None):
+        as_of = as_of or pd.Timestamp.now().normalize()
+        return _mask(self._fn(table, as_of), table)
+
+    def apply(self, table, as_of=None):
+        return table[self.mask(table, as_of)]
+
+
+def parse_screens(specs):
+    """
+    "nome=espressione" o solo espressione (nome screen_N) o nome di uno
+    screen predefinito. Restituisce {nome: Screen}.
+    """
+    screens = {}
+    for i, spec in enumerate(specs, 1):
+        if spec in SCREENS:
+            name, expression = spec, SCREENS[spec]
+        else:
+            match = re.match(r"^\s*([A-Za-z_]\w*)\s*=(?!=)(.*)$", spec)
+            name, expression = (match.group(1), match.group(2)) if match else (f"screen_{i}", spec)
+        screens[name] = Screen(name, expression)
+    return screens
+
+
+# =========================
+# ESECUZIONE SUI FILE DELLA SETTIMANA
+# =========================
+def _read(path):
+    if not os.path.exists(path):
+        print(f"⚠️ File non trovato: {os.path.basename(path)}")
+        return None
+    return pd.read_excel(path)
+
+
+def poc_st_file(week_number, poc_period=None, soglia_poc=None):
+    """
+    File POC_ST della config richiesta; senza config quello con la soglia
+    più larga (a parità di soglia il periodo più lungo): il più completo.
+    """
+    if poc_period is not None and soglia_poc is not None:
+        return os.path.join(OUTPUT_DIR, f"POC_ST_p{poc_period}y_s{soglia_poc}_week_{week_number}.xlsx")
+    best = None
+    for name in os.listdir(OUTPUT_DIR) if os.path.isdir(OUTPUT_DIR) else []:
+        m = re.match(rf"POC_ST_p(\d+)y_s([\d.]+)_week_{week_number}\.xlsx$", name)
+        if m:
+            key = (float(m.group(2)), int(m.group(1)))
+            if best is None or key > best[0]:
+                best = (key, name)
+    if best is None:
+        raise FileNotFoundError(f"❌ Nessun file POC_ST per la settimana {week_number}")
+    return os.path.join(OUTPUT_DIR, best[1])
+
+
+def load_metrics_table(week_number, poc_period=None, soglia_poc=None):
+    path = poc_st_file(week_number, poc_period, soglia_poc)
+    print(f"📄 Tabella POC: {os.path.basename(path)}")
+    df_poc = pd.read_excel(path)
+    return metrics_table(
+        df_poc,
+        _read(os.path.join(OUTPUT_DIR, f"key_reversal_signals_week_{week_number}.xlsx")),
+        _read(os.path.join(OUTPUT_DIR, f"rsi_divergences_week_{week_number}.xlsx")),
+        _read(os.path.join(OUTPUT_DIR, "tickers_info.xlsx")),
+    )
+
+
+def main(argv=None):
+    from report_writer import write_report
+    from snapshot import add_snapshot_args, configure, run_datetime, run_week
+
+    parser = argparse.ArgumentParser(description="Screen dichiarativi sulla tabella metriche della settimana")
+    parser.add_argument("--week", type=int, default=None,
+                        help="Settimana ISO dei file da usare (default: quella del run)")
+    parser.add_argument("--poc_period", type=int, default=None, help="Config POC (anni); default la più ampia")
+    parser.add_argument("--soglia_poc", type=str, default=None, help="Config POC (soglia %%)")
+    parser.add_argument("--screen", action="append", default=None,
+                        help="Screen 'nome=espressione', espressione o nome predefinito (ripetibile)")
+    parser.add_argument("--list", action="store_true", help="Elenca campi e screen predefiniti")
+    add_snapshot_args(parser)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("Campi:", ", ".join(FIELDS))
+        for name, expression in SCREENS.items():
+            print(f"  {name}: {expression}")
+        return 0
+
+    try:
+        screens = parse_screens(args.screen or list(SCREENS))
+    except ScreenError as e:
+        parser.error(str(e))
+
+    configure(args)
+    args.week = args.week or run_week()
+    table = load_metrics_table(args.week, args.poc_period, args.soglia_poc)
+    as_of = pd.Timestamp(run_datetime()).normalize()
+    sheets = {}
+    for name, screen in screens.items():
+        sheets[name] = screen.apply(table, as_of)
+        print(f"🔎 {name}: {len(sheets[name])} ticker su {len(table)}  ({screen.expression.strip()})")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_file = os.path.join(OUTPUT_DIR, f"screens_week_{args.week}.xlsx")
+    write_report(output_file, sheets)
+    print(f"\n📊 File creato: {output_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import json
+import os
+from datetime import datetime
+
+# =========================
+# SECURITY MASTER
+# =========================
+# Un solo simbolo canonico (quello del provider, Yahoo Finance) per ogni
+# titolo, qualunque sia la grafia della fonte: "BRK.B", "BRK-B" e "brk.b"
+# diventano tutti "BRK-B", "MT-AS" e "MT.AS" diventano "MT.AS". Download,
+# cache, checkpoint e merge usano solo il simbolo canonico, così lo stesso
+# titolo non viene più scaricato due volte con grafie diverse.
+#
+# Il file JSON in cache/ conserva per ogni simbolo borsa, valuta, indici di
+# appartenenza e tutte le grafie (alias) viste nelle fonti.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SECURITY_MASTER_FILE = os.path.join(BASE_DIR, "cache", "security_master.json")
+
+# Suffisso Yahoo → (borsa, valuta)
+EXCHANGES = {
+    "": ("US", "USD"),
+    ".DE": ("XETRA", "EUR"),
+    ".F": ("Frankfurt", "EUR"),
+    ".PA": ("Euronext Paris", "EUR"),
+    ".AS": ("Euronext Amsterdam", "EUR"),
+    ".BR": ("Euronext Brussels", "EUR"),
+    ".LS": ("Euronext Lisbon", "EUR"),
+    ".MI": ("Borsa Italiana", "EUR"),
+    ".MC": ("Bolsa de Madrid", "EUR"),
+    ".VI": ("Wiener Börse", "EUR"),
+    ".HE": ("Nasdaq Helsinki", "EUR"),
+    ".CO": ("Nasdaq Copenhagen", "DKK"),
+    ".ST": ("Nasdaq Stockholm", "SEK"),
+    ".OL": ("Oslo Børs", "NOK"),
+    ".SW": ("SIX Swiss Exchange", "CHF"),
+    ".L": ("London Stock Exchange", "GBP"),
+    ".TO": ("Toronto Stock Exchange", "CAD"),
+    ".HK": ("Hong Kong Stock Exchange", "HKD"),
+    ".T": ("Tokyo Stock Exchange", "JPY"),
+    ".AX": ("ASX", "AUD"),
+}
+
+
+def _kind(symbol):
+    if symbol.startswith("^"):
+        return "index"
+    if symbol.endswith("=F"):
+        return "future"
+    if symbol.endswith("=X"):
+        return "fx"
+    if symbol.endswith("-USD"):
+        return "crypto"
+    return "equity"
+
+
+def split_suffix(symbol):
+    """
+    (base, suffisso di borsa) riconoscendo il suffisso sia con "." sia con
+    "-" ("MT.AS", "MT-AS"). Suffisso "" se il simbolo non ne ha uno noto.
+    """
+    for sep in (".", "-"):
+        if sep in symbol:
+            base, code = symbol.rsplit(sep, 1)
+            if base and f".{code}" in EXCHANGES:
+                return base, f".{code}"
+    return symbol, ""
+
+
+def canonical_symbol(raw, suffix=""):
+    """
+    Simbolo Yahoo di una grafia qualsiasi. suffix è la borsa di default
+    della fonte (".DE" per il DAX...), aggiunto solo se il simbolo non ha
+    già un suffisso di borsa noto. Le classi di azioni usano "-" come su
+    Yahoo: "BRK.B" → "BRK-B", "NOVO B" + ".CO" → "NOVO-B.CO".
+    """
+    symbol = str(raw).strip().upper()
+    if not symbol or symbol.startswith("^") or "=" in symbol:
+        return symbol
+
+    base, exchange = split_suffix(symbol)
+    base = base.replace(".", "-").replace("/", "-").replace(" ", "-")
+    return base + (exchange or suffix)
+
+
+def security_info(symbol):
+    # Borsa, valuta e tipo deducibili dal solo simbolo canonico
+    kind = _kind(symbol)
+    if kind == "equity":
+        exchange, currency = EXCHANGES[split_suffix(symbol)[1]]
+    elif kind == "crypto":
+        exchange, currency = "CCC", "USD"
+    elif kind == "fx":
+        exchange, currency = "CCY", symbol[3:6] if len(symbol) >= 8 else None
+    else:
+        exchange, currency = None, None
+    return {"exchange": exchange, "currency": currency, "kind": kind}
+
+
+class SecurityMaster:
+    """
+    Anagrafica persistente simbolo canonico → borsa, valuta, indici, alias.
+    register() a ogni caricamento dell'universo. Gli alias sono solo
+    memoria delle grafie viste: la stessa grafia senza suffisso ("ADS") può
+    indicare titoli diversi a seconda della fonte, quindi il simbolo
+    canonico si ricava sempre con canonical_symbol.
+    """
+
+    def __init__(self, path=SECURITY_MASTER_FILE):
+        self.path = path
+        self.securities = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.securities = json.load(f)
+            except ValueError:
+                print(f"⚠️ Security master illeggibile, lo ricreo: {path}")
+
+    def register(self, raw, source, suffix=""):
+        """
+        Registra una grafia trovata nella fonte `source` (indice o lista) e
+        restituisce il simbolo canonico.
+        """
+        symbol = canonical_symbol(raw, suffix)
+        now = datetime.now().isoformat(timespec="seconds")
+
+        entry = self.securities.get(symbol)
+        if entry is None:
+            entry = self.securities[symbol] = {**security_info(symbol), "indices": [],
+                                               "aliases": [], "first_seen": now}
+        entry["last_seen"] = now
+        if source not in entry["indices"]:
+            entry["indices"].append(source)
+
+        alias = str(raw).strip().upper()
+        if alias != symbol and alias not in entry["aliases"]:
+            entry["aliases"].append(alias)
+        return symbol
+
+    def reset_memberships(self, sources):
+        # Gli indici ricaricati ripartono da zero: chi è uscito non resta membro
+        for entry in self.securities.values():
+            entry["indices"] = [s for s in entry["indices"] if s not in sources]
+
+    def info(self, symbol):
+        return self.securities.get(canonical_symbol(symbol))
+
+    def update(self, symbol, **fields):
+        # Metadati dal provider (es. valuta da yf.Ticker.info) prevalgono su quelli dedotti
+        entry = self.securities.get(canonical_symbol(symbol))
+        if entry is not None:
+            entry.update({k: v for k, v in fields.items() if v})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.securities, f, indent=1, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp, self.path)
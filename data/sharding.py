@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import pickle
+
+import snapshot
+
+# =========================
+# ESECUZIONE A SHARD
+# =========================
+# --shard i/N: lo script elabora solo lo shard i (1..N) dell'universo e
+# salva le righe per ticker in output/shards/ invece dei file finali.
+# --merge_shards N: non scarica nulla, unisce le N parti nell'ordine
+# dell'universo e prosegue come un run normale, quindi i file finali sono
+# identici (byte per byte) a quelli di un run non shardato.
+#
+# Gli shard sono bilanciati per lunghezza dello storico (dimensione delle
+# barre giornaliere nel bar store) e il piano viene salvato alla prima
+# richiesta: tutti gli shard della stessa settimana usano la stessa
+# ripartizione anche se nel frattempo la cache cambia. Su runner diversi
+# basta copiare output/shards/ (piano + parti) prima del merge, e per il
+# co-movimento di Tickers with sectors.py anche cache/bars/. Le parti
+# sono legate alla data del run: shard e merge eseguiti in giorni diversi
+# devono ricevere lo stesso --run_date.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARDS_DIR = os.path.join(BASE_DIR, "output", "shards")
+
+
+def add_shard_args(parser):
+    parser.add_argument("--shard", type=str, default=None,
+                        help="Elabora solo lo shard i/N dell'universo (es. 2/4)")
+    parser.add_argument("--merge_shards", type=int, default=None,
+                        help="Unisce le N parti già calcolate e scrive i file finali")
+    return parser
+
+
+def shard_cli_args(args):
+    cli = []
+    if args.shard:
+        cli += ["--shard", args.shard]
+    if args.merge_shards:
+        cli += ["--merge_shards", str(args.merge_shards)]
+    return cli
+
+
+def parse_shard(text):
+    try:
+        i, n = (int(v) for v in text.split("/"))
+    except ValueError:
+        raise ValueError(f"--shard deve essere nel formato i/N: {text}")
+    if not 1 <= i <= n:
+        raise ValueError(f"--shard fuori range: {text}")
+    return i, n
+
+
+def history_weight(ticker):
+    # Dimensione del file delle barre giornaliere ≈ numero di barre
+    from bar_store import bars_path  # bar_store importa scan_state, che importa questo modulo
+    try:
+        return os.path.getsize(bars_path(ticker, "1d"))
+    except OSError:
+        return None
+
+
+def balance(tickers, n, weights):
+    """
+    Ripartizione greedy (il più pesante allo shard più leggero), stabile:
+    a parità di peso decide il ticker, a parità di carico l'indice shard.
+    Restituisce {ticker: shard} con shard 1..N.
+    """
+    known = [w for w in weights.values() if w]
+    default = sorted(known)[len(known) // 2] if known else 1
+    order = sorted(tickers, key=lambda t: (-(weights.get(t) or default), t))
+
+    load = [0] * n
+    plan = {}
+    for t in order:
+        k = min(range(n), key=lambda s: (load[s], s))
+        plan[t] = k + 1
+        load[k] += weights.get(t) or default
+    return plan
+
+
+def _universe_id(tickers):
+    return hashlib.sha1("\n".join(sorted(tickers)).encode()).hexdigest()[:12]
+
+
+def shard_plan(tickers, n, week_number):
+    """
+    Piano della settimana per N shard su questo universo: letto da
+    output/shards/ se esiste, altrimenti calcolato e salvato.
+    """
+    path = os.path.join(SHARDS_DIR, f"plan_n{n}_{_universe_id(tickers)}_week_{week_number}.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    plan = balance(tickers, n, {t: history_weight(t) for t in tickers})
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+    try:
+        # Creazione esclusiva: se un altro shard l'ha appena scritto vince il suo
+        with open(path, "x", encoding="utf-8") as f:
+            json.dump(plan, f, indent=1, sort_keys=True)
+    except FileExistsError:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return plan
+
+
+class Shard:
+    """
+    Modalità shard/merge di uno script. name identifica il risultato (con
+    configurazione e data del run), come il nome del checkpoint.
+    """
+
+    def __init__(self, name, week_number, shard=None, merge=None):
+        self.name = name
+        self.week_number = week_number
+        self.index, self.count = parse_shard(shard) if shard else (None, None)
+        self.merge = merge
+        if self.index and merge:
+            raise ValueError("--shard e --merge_shards non si usano insieme")
+
+    @classmethod
+    def from_args(cls, args, name, week_number, metrics=None):
+        shard = cls(name, week_number, args.shard, args.merge_shards)
+        if metrics is not None and shard.index:
+            metrics.name = shard.scoped(metrics.name)
+        return shard
+
+    @property
+    def partial(self):
+        return self.index is not None
+
+    def scoped(self, name):
+        # Checkpoint e report metriche separati per shard
+        return f"{name}_shard{self.index}of{self.count}" if self.partial else name
+
+    def select(self, tickers):
+        # Ticker da elaborare in questo processo
+        if self.merge:
+            return []
+        if not self.partial:
+            return tickers
+        plan = shard_plan(tickers, self.count, self.week_number)
+        selected = [t for t in tickers if plan.get(t) == self.index]
+        print(f"🧩 Shard {self.index}/{self.count}: {len(selected)} ticker su {len(tickers)}")
+        return selected
+
+    def _part_path(self, i, n):
+        return os.path.join(SHARDS_DIR, snapshot.scoped(self.name), f"part_{i}of{n}.pkl")
+
+    def finish(self, done, tickers):
+        """
+        done: {ticker: righe} di questo processo (es. checkpoint.done).
+        Shard: salva la parte e restituisce None (niente file finali).
+        Merge o run normale: righe di tutto l'universo nell'ordine di tickers.
+        """
+        if self.partial:
+            path = self._part_path(self.index, self.count)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(done, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+            print(f"🧩 Parte salvata: {path}")
+            return None
+
+        if self.merge:
+            done = {}
+            missing = []
+            for i in range(1, self.merge + 1):
+                path = self._part_path(i, self.merge)
+                if not os.path.exists(path):
+                    missing.append(f"{i}/{self.merge}")
+                    continue
+                with open(path, "rb") as f:
+                    done.update(pickle.load(f))
+            if missing:
+                raise FileNotFoundError(f"❌ Parti mancanti per {self.name}: {', '.join(missing)}")
+            print(f"🧩 Merge {self.merge} shard: {len(done)} ticker")
+
+        return [row for t in tickers for row in done.get(t, ())]
+
+    def cleanup(self):
+        # Dopo il merge le parti non servono più
+        if not self.merge:
+            return
+        for i in range(1, self.merge + 1):
+            path = self._part_path(i, self.merge)
+            if os.path.exists(path):
+                os.remove(path)
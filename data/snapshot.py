@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+from datetime import date, datetime, time
+
+# =========================
+# SNAPSHOT / REPLAY DEI DATI DI INPUT
+# =========================
+# --snapshot record: il run è normale (online) ma ogni input esterno
+# (universo, download, barre, info fondamentali) viene salvato anche nel
+# bundle cache/snapshots/<data>/, con <data> = --as_of se indicata,
+# altrimenti la data del run (--run_date, quella che master.py passa a tutti
+# i sottoprocessi), altrimenti oggi.
+# --as_of AAAA-MM-GG (o --snapshot replay): il run legge solo dal bundle di
+# quella data, senza rete; settimana ISO, checkpoint e "oggi" degli script
+# diventano quelli della data del bundle. Un input mancante nel bundle vale
+# come dato vuoto, come un download fallito.
+# --run_date AAAA-MM-GG: data del run decisa una volta da master.py e passata
+# a tutti gli stadi, così checkpoint e negative cache restano sulla stessa
+# giornata anche se il job (cron 23:55 UTC) passa la mezzanotte.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "cache", "snapshots")
+
+MODE = None      # None | "record" | "replay"
+AS_OF = None     # date del bundle
+RUN_DATE = None  # date del run fissata da --run_date (None = oggi)
+_local = threading.local()
+
+
+def add_snapshot_args(parser):
+    parser.add_argument("--snapshot", choices=["record", "replay"], default=None,
+                        help="record: salva gli input del run in un bundle datato; replay: esegue offline dal bundle")
+    parser.add_argument("--as_of", type=str, default=None,
+                        help="Data del bundle da rieseguire (AAAA-MM-GG), implica --snapshot replay")
+    parser.add_argument("--run_date", type=str, default=None,
+                        help="Data del run (AAAA-MM-GG) per checkpoint e negative cache; di solito la passa master.py")
+    return parser
+
+
+def snapshot_cli_args(args):
+    cli = []
+    if args.snapshot:
+        cli += ["--snapshot", args.snapshot]
+    if args.as_of:
+        cli += ["--as_of", args.as_of]
+    if args.run_date:
+        cli += ["--run_date", args.run_date]
+    return cli
+
+
+def latest_bundle():
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return None
+    dates = sorted(d for d in os.listdir(SNAPSHOT_DIR) if os.path.isdir(os.path.join(SNAPSHOT_DIR, d)))
+    return date.fromisoformat(dates[-1]) if dates else None
+
+
+def configure(args):
+    global MODE, AS_OF, RUN_DATE
+    RUN_DATE = date.fromisoformat(args.run_date) if args.run_date else None
+    MODE = args.snapshot or ("replay" if args.as_of else None)
+    if MODE is None:
+        return
+
+    if MODE == "record":
+        # Una sola data per tutti gli stadi: un job che passa la mezzanotte
+        # continua a scrivere nello stesso bundle
+        AS_OF = date.fromisoformat(args.as_of) if args.as_of else run_date()
+        RUN_DATE = AS_OF
+        _write_manifest()
+    else:
+        AS_OF = date.fromisoformat(args.as_of) if args.as_of else latest_bundle()
+        if AS_OF is None or not os.path.isdir(bundle_dir()):
+            raise FileNotFoundError(f"❌ Bundle snapshot non trovato: {args.as_of or SNAPSHOT_DIR}")
+
+    print(f"📼 Snapshot {MODE}: bundle {bundle_dir()}")
+
+
+def bundle_dir():
+    return os.path.join(SNAPSHOT_DIR, AS_OF.isoformat())
+
+
+def replaying():
+    return MODE == "replay"
+
+
+# =========================
+# DATA DEL RUN
+# =========================
+def run_datetime():
+    # "Adesso" del run: fine giornata della data del bundle in replay
+    if replaying():
+        return datetime.combine(AS_OF, time(23, 59, 59))
+    return datetime.now()
+
+
+def run_date():
+    # Giornata del run: data del bundle in replay, --run_date se fissata, altrimenti oggi
+    if replaying():
+        return AS_OF
+    return RUN_DATE or date.today()
+
+
+def run_tag():
+    # Chiave di checkpoint e parti shard: il job gira ogni giorno, la settimana non basta
+    return f"{run_date():%Y%m%d}"
+
+
+def run_week():
+    return run_date().isocalendar()[1]
+
+
+def scoped(name):
+    # Checkpoint e simili del replay separati da quelli dei run live
+    return f"{name}_asof_{AS_OF.isoformat()}" if replaying() else name
+
+
+# =========================
+# REGISTRAZIONE / RILETTURA
+# =========================
+def _entry_path(kind, key):
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+    return os.path.join(bundle_dir(), kind, f"{digest}.pkl")
+
+
+def _write_manifest():
+    path = os.path.join(bundle_dir(), "manifest.json")
+    manifest = {"as_of": AS_OF.isoformat(), "runs": []}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    manifest["runs"].append({
+        "script": os.path.basename(sys.argv[0]),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    os.makedirs(bundle_dir(), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def recorded(kind, key, fn):
+    """
+    Senza snapshot chiama fn(). In record salva anche il risultato nel
+    bundle, in replay restituisce quello salvato (None se manca). Le
+    chiamate annidate (un download dentro get_bars) passano dritte: nel
+    bundle finisce solo il livello più esterno.
+    """
+    if MODE is None or getattr(_local, "depth", 0):
+        return fn()
+
+    path = _entry_path(kind, key)
+    if MODE == "replay":
+        if not os.path.exists(path):
+            print(f"📼 Snapshot senza {kind}: {key}")
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)["value"]
+
+    _local.depth = 1
+    try:
+        value = fn()
+    finally:
+        _local.depth = 0
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"key": key, "value": value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return value
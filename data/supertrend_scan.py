@@ -0,0 +1,200 @@
+import os
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+from indicators import supertrend
+from scan_state import download
+from incremental import ResultCache, fingerprint, write_delta
+from report_writer import write_excel
+from memory_guard import categorize
+
+# =========================
+# STADIO SUPERTREND (POC + SuperTrend)
+# =========================
+# Calcolo per ticker e scrittura del file POC_ST, condivisi da
+# merge_poc_supertrend.py (legge il file POC a fine stadio) e dalla
+# modalità --pipeline di poc_all_tickers.py, dove SupertrendPipeline
+# riceve i ticker che passano il filtro POC mentre la scansione continua.
+
+OUTPUT_DIR = os.path.join("data", "output")   # relativo alla root, come negli script
+
+# =========================
+# PARAMETRI SUPERTREND (TV)
+# =========================
+ATR_PERIOD = 10
+MULTIPLIER = 3.0
+PIPELINE_WORKERS = 4
+
+
+def result_cache(args):
+    # SuperTrend non dipende dalla config POC: cache condivisa tra le config
+    return ResultCache.from_args(f"supertrend_atr{ATR_PERIOD}_m{MULTIPLIER:g}", args)
+
+
+# =========================
+# FUNZIONI SUPERTREND TV-ALIGNED (calcolo in indicators.supertrend)
+# =========================
+def clean_df(df):
+    if df.empty:
+        return df
+
+    # ✅ FIX MINIMO per yfinance MultiIndex (causa errore Series)
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.droplevel(1, axis=1)
+
+    # sicurezza extra (non cambia logica)
+    df = df.rename(columns=lambda x: x.strip())
+
+    for col in ["High", "Low", "Close"]:
+        if col not in df.columns:
+            return pd.DataFrame()
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    return df.dropna(subset=["High", "Low", "Close"])
+
+
+def compute_st_and_delta(df, metrics):
+    df = clean_df(df)
+    if len(df) < ATR_PERIOD * 3:
+        metrics.fail("st_insufficient_bars")
+        return np.nan, np.nan, np.nan
+
+    st = supertrend(
+        df["High"].values,
+        df["Low"].values,
+        df["Close"].values,
+        ATR_PERIOD,
+        MULTIPLIER
+    )
+
+    # ✅ FIX MINIMO: evita Series invece di float
+    st_last = float(st[-1]) if np.ndim(st) == 1 else float(st.iloc[-1])
+    close_last = float(df["Close"].iloc[-1])
+
+    if st_last <= 0 or np.isnan(st_last):
+        return np.nan, close_last, np.nan
+
+    delta = (close_last - st_last) / st_last * 100
+    return st_last, close_last, delta
+
+
+# =========================
+# CALCOLO ST MULTI-TIMEFRAME (TV)
+# =========================
+def supertrend_rows(ticker, metrics, results, ticker_col="Ticker"):
+    with metrics.timed("download"):
+        df_4h = download(ticker, metrics=metrics, period="120d", interval="4h", auto_adjust=False)
+    with metrics.timed("download"):
+        df_d  = download(ticker, metrics=metrics, period="1y",   interval="1d", auto_adjust=False)
+    with metrics.timed("download"):
+        df_w  = download(ticker, metrics=metrics, period="5y",   interval="1wk", auto_adjust=False)
+    with metrics.timed("download"):
+        df_m  = download(ticker, metrics=metrics, period="10y",  interval="1mo", auto_adjust=False)
+
+    # Nessuna barra nuova su nessun timeframe: stessi delta del run precedente
+    fp = fingerprint(df_4h, df_d, df_w, df_m)
+    rows = results.get(ticker, fp)
+    if rows is not None:
+        return rows
+
+    with metrics.timed("compute"):
+        _, _, delta_4h = compute_st_and_delta(df_4h, metrics)
+        _, _, delta_d  = compute_st_and_delta(df_d, metrics)
+        _, _, delta_w  = compute_st_and_delta(df_w, metrics)
+        _, _, delta_m  = compute_st_and_delta(df_m, metrics)
+
+    return results.put(ticker, fp, [{
+        ticker_col: ticker,
+        "ST_4H_Delta%": round(delta_4h, 2),
+        "ST_Daily_Delta%": round(delta_d, 2),
+        "ST_Weekly_Delta%": round(delta_w, 2),
+        "ST_Monthly_Delta%": round(delta_m, 2),
+    }])
+
+
+# =========================
+# MERGE + EXPORT
+# =========================
+def write_poc_st(df_poc, df_st, ticker_col, poc_period, soglia_poc, week_number, metrics):
+    """
+    Unisce le righe POC con i delta SuperTrend, aggiorna il delta dei
+    ticker sopra il SuperTrend daily e scrive POC_ST_p.._s.._week_N.xlsx.
+    """
+    # Se tutti i SuperTrend falliscono df_st non ha colonne: le righe POC
+    # restano, senza i delta
+    if ticker_col not in df_st.columns:
+        df_st = pd.DataFrame(columns=[ticker_col])
+
+    with metrics.stage("merge"):
+        df_final = categorize(df_poc.merge(df_st, on=ticker_col, how="left"), (ticker_col, "Indice"))
+
+    # Ticker sopra il SuperTrend daily entrati/usciti rispetto al run precedente
+    if "ST_Daily_Delta%" in df_final.columns:
+        st_up = df_final.loc[df_final["ST_Daily_Delta%"] > 0, ticker_col]
+    else:
+        st_up = []
+    write_delta(f"poc_st_p{poc_period}_s{soglia_poc}_st_up", st_up, week_number)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_file_path = os.path.join(
+        OUTPUT_DIR,
+        f"POC_ST_p{poc_period}_s{soglia_poc}_week_{week_number}.xlsx"
+    )
+
+    with metrics.stage("excel"):
+        write_excel(output_file_path, df_final, f"POC_ST {poc_period} {soglia_poc}%")
+
+    print(f"\n✅ File POC + SuperTrend creato con successo:\n{output_file_path}")
+    return output_file_path
+
+
+# =========================
+# PIPELINE POC → SUPERTREND
+# =========================
+class SupertrendPipeline:
+    """
+    Coda in-process tra i due stadi: submit(ticker) appena un ticker passa
+    il filtro POC, i worker calcolano il SuperTrend in parallelo alla
+    scansione. close() attende la coda e restituisce {ticker: righe}.
+    """
+
+    def __init__(self, metrics, results, workers=PIPELINE_WORKERS, ticker_col="Ticker"):
+        self.metrics = metrics
+        self.results = results
+        self.ticker_col = ticker_col
+        self.queue = queue.Queue()
+        self.rows = {}
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"supertrend-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, ticker):
+        self.queue.put(ticker)
+
+    def _work(self):
+        while True:
+            ticker = self.queue.get()
+            if ticker is None:
+                return
+            try:
+                rows = supertrend_rows(ticker, self.metrics, self.results, self.ticker_col)
+            except Exception as e:
+                print(f"⚠️ Errore SuperTrend su {ticker}: {e}")
+                self.metrics.fail_exc(e)
+                rows = []
+            with self._lock:
+                self.rows[ticker] = rows
+
+    def close(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for t in self._threads:
+            t.join()
+        return self.rows
@@ -0,0 +1,257 @@
+# =========================
+# SWEEP SUPERTREND (periodo ATR × moltiplicatore)
+# =========================
+# Per ogni ticker legge le barre dalla cache (4h 120d e giornaliere 10y,
+# da cui weekly e monthly per ricampionamento), calcola l'ATR una sola
+# volta per periodo e la ricorsione delle bande per tutti i moltiplicatori
+# insieme (indicators.supertrend_grid). Risultato: una tabella lunga
+# ticker × timeframe × (periodo, moltiplicatore) con delta %, direzione e
+# data dell'ultimo flip, per calibrare il filtro ST di merge_poc_supertrend.py.
+#
+#   python data/supertrend_sweep.py --periods 7,10,14,20 --multipliers 1.5,2,2.5,3,3.5,4
+
+import argparse
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+warnings.simplefilter('ignore', category=FutureWarning)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from my_tickers import get_all_tickers
+from run_metrics import RunMetrics
+from indicators import _atr_2d, last_flip, supertrend_grid
+from bar_store import get_bars, resample_bars, slice_period
+from profiling import add_profile_args, start_from_args, limit_tickers
+from scan_state import Checkpoint, NegativeCache, add_scan_args, configure
+from snapshot import run_tag, run_week
+from report_writer import write_report
+from sharding import Shard
+from memory_guard import MemoryGuard, categorize
+from supertrend_scan import ATR_PERIOD, MULTIPLIER
+
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
+# Timeframe → (interval, lookback) come in supertrend_scan.supertrend_rows
+TIMEFRAMES = {
+    "4H": ("4h", "120d"),
+    "Daily": ("1d", "1y"),
+    "Weekly": ("1wk", "5y"),
+    "Monthly": ("1mo", "10y"),
+}
+DAILY_LOOKBACK = "10y"   # una sola serie giornaliera per Daily/Weekly/Monthly
+
+metrics = RunMetrics("supertrend_sweep")
+
+
+def parse_list(text, cast=int):
+    return sorted({cast(v) for v in text.split(",") if v.strip()})
+
+
+# =========================
+# Barre per timeframe (dalla cache)
+# =========================
+def timeframe_bars(ticker, timeframes):
+    """
+    {timeframe: DataFrame High/Low/Close} per un ticker. Daily, Weekly e
+    Monthly vengono dalla stessa serie giornaliera in cache.
+    """
+    out = {}
+    daily = None
+    for tf in timeframes:
+        interval, lookback = TIMEFRAMES[tf]
+        if interval == "4h":
+            with metrics.timed("download"):
+                df = get_bars(ticker, "4h", lookback, auto_adjust=False, metrics=metrics)
+        else:
+            if daily is None:
+                with metrics.timed("download"):
+                    daily = get_bars(ticker, "1d", DAILY_LOOKBACK, auto_adjust=False, metrics=metrics)
+            df = resample_bars(slice_period(daily, lookback), interval) if not daily.empty else daily
+        if not df.empty and {"High", "Low", "Close"} <= set(df.columns):
+            out[tf] = df.dropna(subset=["High", "Low", "Close"])
+    return out
+
+
+# =========================
+# Tutta la griglia su una serie
+# =========================
+def sweep_bars(df, periods, multipliers):
+    """
+    Una riga per (periodo, moltiplicatore): ATR calcolato una volta per
+    periodo, bande di tutti i moltiplicatori in una sola ricorsione. I
+    periodi con meno di 3 × periodo barre vengono saltati (come
+    compute_st_and_delta).
+    """
+    high = df["High"].to_numpy(dtype=float)
+    low = df["Low"].to_numpy(dtype=float)
+    close = df["Close"].to_numpy(dtype=float)
+    close_last = float(close[-1])
+    rows = []
+    for period in periods:
+        if len(df) < period * 3:
+            metrics.fail("st_insufficient_bars")
+            continue
+        atr = _atr_2d(high, low, close, period)
+        st, direction = supertrend_grid(high, low, close, period, multipliers, atr_2d=atr)
+        flips = last_flip(direction)
+
+        st_last = st[-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = np.where(st_last > 0, (close_last - st_last) / st_last * 100, np.nan)
+        for j, mult in enumerate(multipliers):
+            flip = flips[j]
+            rows.append({
+                "ATR Period": period,
+                "Multiplier": mult,
+                "SuperTrend": float(st_last[j]),
+                "Close": close_last,
+                "Delta%": round(float(delta[j]), 2),
+                "Direzione": int(direction[-1, j]),
+                "Ultimo Flip": df.index[flip].date() if flip >= 0 else None,
+                "Barre dal Flip": int(len(df) - 1 - flip) if flip >= 0 else np.nan,
+            })
+    return rows
+
+
+def analyze_ticker(ticker, timeframes, periods, multipliers, neg_cache=None):
+    try:
+        bars = timeframe_bars(ticker, timeframes)
+    except Exception as e:
+        print(f"Errore download {ticker}: {e}")
+        metrics.fail_exc(e)
+        return []
+
+    if not bars:
+        metrics.fail("st_no_data")
+        if neg_cache is not None:
+            neg_cache.record_failure(ticker, "st_no_data")
+        return []
+    if neg_cache is not None:
+        neg_cache.record_success(ticker)
+
+    rows = []
+    with metrics.timed("compute"):
+        for tf, df in bars.items():
+            for row in sweep_bars(df, periods, multipliers):
+                rows.append({"Ticker": ticker, "Timeframe": tf, **row})
+    return rows
+
+
+def summary_table(df_long):
+    # Ticker sopra il SuperTrend per timeframe × periodo (righe) e moltiplicatore (colonne)
+    if df_long.empty:
+        return pd.DataFrame()
+    above = df_long.assign(**{"Sopra ST": df_long["Delta%"] > 0})
+    return above.pivot_table(
+        index=["Timeframe", "ATR Period"], columns="Multiplier", values="Sopra ST",
+        aggfunc="sum", observed=True
+    ).astype(int)
+
+
+# =========================
+# ESECUZIONE PRINCIPALE
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Sweep SuperTrend periodo ATR × moltiplicatore")
+    parser.add_argument("--periods", type=str, default=f"7,{ATR_PERIOD},14,20",
+                        help="Periodi ATR separati da virgola")
+    parser.add_argument("--multipliers", type=str, default=f"1.5,2,2.5,{MULTIPLIER:g},3.5,4",
+                        help="Moltiplicatori separati da virgola")
+    parser.add_argument("--timeframes", type=str, default=",".join(TIMEFRAMES),
+                        help=f"Timeframe separati da virgola ({', '.join(TIMEFRAMES)})")
+    add_profile_args(parser)
+    add_scan_args(parser)
+    args = parser.parse_args()
+
+    timeframes = [tf.strip() for tf in args.timeframes.split(",") if tf.strip()]
+    unknown = [tf for tf in timeframes if tf not in TIMEFRAMES]
+    if unknown:
+        parser.error(f"Timeframe sconosciuti: {', '.join(unknown)}")
+    configure(args)
+    week_number = run_week()
+    start_from_args(args, "supertrend_sweep", week_number)
+
+    periods = parse_list(args.periods)
+    multipliers = parse_list(args.multipliers, float)
+    metrics.params = {"periods": periods, "multipliers": multipliers, "timeframes": timeframes}
+    neg_cache = NegativeCache.from_args(args)
+
+    with metrics.stage("universe"):
+        ticker_dict = get_all_tickers(flat=False)
+    ticker_to_index = {}
+    for idx_name, tickers in ticker_dict.items():
+        for t in tickers:
+            if t in ticker_to_index:
+                ticker_to_index[t] += f", {idx_name}"
+            else:
+                ticker_to_index[t] = idx_name
+
+    all_tickers = limit_tickers(list(ticker_to_index.keys()), args)
+    metrics.tickers_total = len(all_tickers)
+    print(f"Trovati {len(all_tickers)} ticker tra tutti gli indici")
+    print(f"🔍 Sweep {timeframes}: periodi ATR {periods} × moltiplicatori {multipliers}")
+
+    name = (f"st_sweep_{'-'.join(timeframes)}_p{'-'.join(map(str, periods))}"
+            f"_m{'-'.join(f'{m:g}' for m in multipliers)}_{run_tag()}")
+    shard = Shard.from_args(args, name, week_number, metrics)
+    scan_tickers = shard.select(all_tickers)
+    if shard.partial:
+        metrics.tickers_total = len(scan_tickers)
+    checkpoint = Checkpoint(shard.scoped(name), resume=not args.no_resume)
+    guard = MemoryGuard.from_args(args, metrics)
+    metrics.start("scan")
+
+    for ticker in scan_tickers:
+        metrics.ticker_done()
+        guard.tick()
+        if ticker in checkpoint:
+            continue
+        if neg_cache.should_skip(ticker):
+            metrics.fail("negative_cache_skip")
+            continue
+        checkpoint.save(ticker, analyze_ticker(ticker, timeframes, periods, multipliers, neg_cache))
+
+    metrics.stop("scan")
+    guard.check()
+
+    rows = shard.finish(checkpoint.done, all_tickers)
+    if rows is None:
+        # Shard parziale: riepilogo ed Excel li calcola il merge
+        checkpoint.clear()
+        metrics.write(week_number)
+        sys.exit(0)
+
+    with metrics.stage("summary"):
+        df_long = pd.DataFrame(rows)
+        if not df_long.empty:
+            df_long.insert(1, "Indice", df_long["Ticker"].map(ticker_to_index))
+            df_long = categorize(df_long)
+            # Timeframe nell'ordine richiesto (4H → Monthly), non alfabetico
+            df_long["Timeframe"] = pd.Categorical(df_long["Timeframe"], categories=timeframes)
+        df_summary = summary_table(df_long)
+
+    print("\n📊 Ticker sopra il SuperTrend (righe = timeframe/periodo, colonne = moltiplicatore):")
+    print(df_summary.to_string() if not df_summary.empty else "⚠ Nessun SuperTrend calcolato.")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    file_path = os.path.join(OUTPUT_DIR, f"ST_sweep_week_{week_number}.xlsx")
+    with metrics.stage("excel"):
+        write_report(file_path, {"sweep": df_long, "riepilogo": df_summary},
+                     formats={"sweep": {"SuperTrend": "0.00", "Close": "0.00"}})
+
+    print(f"\n✅ File salvato: {file_path}")
+
+    checkpoint.clear()
+    shard.cleanup()
+
+    metrics.write(week_number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# =========================
+# TEST SCREENER FONDAMENTALI
+# =========================
+# Bilanci sintetici nel formato di fetch_statement (prima colonna =
+# etichetta, poi una colonna per periodo). Il sito mette la colonna LTM sul
+# conto economico ma di solito non sul bilancio patrimoniale: la riga TTM
+# deve comunque avere rapporti e punteggi.
+#
+#   python -m pytest -q data/tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("yfinance")   # fundamentals → scan_state
+from fundamentals import parse_statements, screen  # noqa: E402
+
+PERIODS = ["FY 2021", "FY 2022", "FY 2023"]
+
+
+def statement(rows, periods):
+    return pd.DataFrame([[label, *values] for label, values in rows.items()], columns=["Item", *periods])
+
+
+def tables(long_term_debt=(300, 280, 250)):
+    income = statement({
+        "Revenue": [1000, 1100, 1200, 1250],
+        "Gross Profit": [400, 450, 500, 520],
+        "Selling, General & Administrative": [100, 105, 110, 112],
+        "Depreciation & Amortization": [50, 52, 55, 56],
+        "Operating Income": [250, 290, 330, 350],
+        "Net Income": [150, 180, 210, 220],
+        "Weighted Average Shares Outstanding": [100, 99, 98, 97.5],
+    }, PERIODS + ["LTM"])
+    balance = statement({
+        "Receivables": [80, 85, 90],
+        "Total Current Assets": [500, 540, 600],
+        "Property, Plant & Equipment": [700, 720, 750],
+        "Total Assets": [2000, 2100, 2200],
+        "Total Current Liabilities": [300, 310, 320],
+        "Total Liabilities": [1000, 1020, 1040],
+        "Total Equity": [1000, 1080, 1160],
+        "Long-Term Debt": list(long_term_debt),
+    }, PERIODS)
+    cash_flow = statement({
+        "Cash Flow from Operations": [200, 230, 260, 270],
+        "Dividends Paid": [-30, -32, -35, -36],
+    }, PERIODS + ["LTM"])
+    return {"income-statement": income, "balance-sheet-statement": balance, "cash-flow-statement": cash_flow}
+
+
+def test_ttm_row_uses_latest_balance_sheet():
+    panel = parse_statements("AAA", tables())
+    assert panel["ttm"].iloc[-1] and panel["total_assets"].isna().iloc[-1]
+
+    row = screen(panel, pd.Series({"AAA": 5.0})).iloc[0]
+    assert row["Period"] == "LTM"
+    assert row["ROA"] == pytest.approx(220 / 2200)
+    assert row["CurrentRatio"] == pytest.approx(600 / 320)
+    assert row["DebtEquity"] == pytest.approx(1040 / 1160)
+    # Confronti: LTM + bilancio 2023 contro FY 2023 + bilancio 2022
+    assert row["F3_ROA"] == int(220 / 2200 > 210 / 2100)
+    assert row["F5_Leverage"] == 1
+    for col in ("F-Score", "M-Score", "Z-Score"):
+        assert not np.isnan(row[col])
+    assert row["F-Score interp"] != "🔴 Dati insufficienti"
+
+
+def test_leverage_needs_debt_in_both_periods():
+    panel = parse_statements("AAA", tables(long_term_debt=(300, None, 250)))
+    row = screen(panel, ttm=False).iloc[0]
+    assert pd.isna(row["F5_Leverage"])
+    assert not np.isnan(row["F-Score"])
@@ -0,0 +1,160 @@
+# =========================
+# GOLDEN TEST LIBRERIA INDICATORI
+# =========================
+# indicators.py deve riprodurre le implementazioni che sostituisce:
+# ta.momentum.RSIIndicator (key_reversal.py), compute_rsi_rma
+# (rsi_divergence.py) e calculate_atr / supertrend_tv di
+# merge_poc_supertrend.py. Le versioni storiche sono copiate qui sotto come
+# riferimento; i valori congelati proteggono anche da modifiche a entrambe.
+#
+#   python -m pytest -q data/tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indicators import atr, supertrend, supertrend_grid, wilder_rsi  # noqa: E402
+
+
+# =========================
+# Fixture OHLC (deterministica)
+# =========================
+@pytest.fixture
+def ohlc():
+    rng = np.random.default_rng(42)
+    n = 120
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, n)))
+    high = close * (1 + rng.uniform(0, 0.01, n))
+    low = close * (1 - rng.uniform(0, 0.01, n))
+    return np.round(high, 4), np.round(low, 4), np.round(close, 4)
+
+
+# =========================
+# Implementazioni storiche (riferimento)
+# =========================
+def ta_rsi(close, window):
+    # ta.momentum.RSIIndicator(close, window).rsi() con fillna=False
+    diff = close.diff(1)
+    up = diff.where(diff > 0, 0.0)
+    down = -diff.where(diff < 0, 0.0)
+    emaup = up.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+    emadn = down.ewm(alpha=1 / window, min_periods=window, adjust=False).mean()
+    rs = emaup / emadn
+    return pd.Series(np.where(emadn == 0, 100, 100 - (100 / (1 + rs))), index=close.index)
+
+
+def compute_rsi_rma(series, period=14):
+    delta = series.diff()
+    gain = delta.clip(lower=0)
+    loss = -delta.clip(upper=0)
+    avg_gain = gain.ewm(alpha=1 / period, adjust=False).mean()
+    avg_loss = loss.ewm(alpha=1 / period, adjust=False).mean()
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+
+def calculate_atr(high, low, close, period):
+    tr = np.maximum(
+        high[1:] - low[1:],
+        np.maximum(np.abs(high[1:] - close[:-1]), np.abs(low[1:] - close[:-1]))
+    )
+    out = np.full(len(close), np.nan)
+    out[period] = tr[:period].mean()
+    for i in range(period + 1, len(close)):
+        out[i] = (out[i - 1] * (period - 1) + tr[i - 1]) / period
+    return out
+
+
+def supertrend_tv(high, low, close, period, multiplier):
+    atr_ = calculate_atr(high, low, close, period)
+    hl2 = (high + low) / 2
+    upper_basic = hl2 + multiplier * atr_
+    lower_basic = hl2 - multiplier * atr_
+    upper_final = np.copy(upper_basic)
+    lower_final = np.copy(lower_basic)
+    st = np.full(len(close), np.nan)
+    direction = np.ones(len(close))
+
+    first = np.where(~np.isnan(atr_))[0][0]
+    st[first] = lower_final[first]
+    for i in range(first + 1, len(close)):
+        upper_final[i] = (min(upper_basic[i], upper_final[i - 1])
+                          if close[i - 1] <= upper_final[i - 1] else upper_basic[i])
+        lower_final[i] = (max(lower_basic[i], lower_final[i - 1])
+                          if close[i - 1] >= lower_final[i - 1] else lower_basic[i])
+        if close[i] > upper_final[i - 1]:
+            direction[i] = 1
+        elif close[i] < lower_final[i - 1]:
+            direction[i] = -1
+        else:
+            direction[i] = direction[i - 1]
+        st[i] = lower_final[i] if direction[i] == 1 else upper_final[i]
+
+    st[:first] = st[first]
+    return st
+
+
+# Valori congelati sulla fixture: barra → valore
+FROZEN = {
+    "rsi_rma_14": {10: 15.278250718969531, 30: 58.87906812361871, 60: 46.20260624635085, 119: 39.05945553297823},
+    "rsi_ta_9": {10: 35.297778562877454, 30: 77.00507005710585, 60: 42.86582430092175, 119: 43.763502645047986},
+    "atr_10": {10: 1.7090500000000006, 30: 1.5173779689193565, 60: 2.023714439001215, 119: 1.4460078558026441},
+    "st_10_3": {10: 91.28775, 30: 99.54201609324193, 60: 108.51635196159677, 119: 91.75771983630608},
+}
+
+
+def check_frozen(values, key):
+    for i, expected in FROZEN[key].items():
+        assert values[i] == pytest.approx(expected, rel=1e-9)
+
+
+# =========================
+# Test
+# =========================
+def test_rsi_rma_matches_compute_rsi_rma(ohlc):
+    close = pd.Series(ohlc[2])
+    rsi = wilder_rsi(close, 14, seed="rma")
+    pd.testing.assert_series_equal(rsi, compute_rsi_rma(close, 14), check_names=False)
+    check_frozen(rsi, "rsi_rma_14")
+
+
+def test_rsi_ta_matches_ta_indicator(ohlc):
+    close = pd.Series(ohlc[2])
+    rsi = wilder_rsi(close, 9, seed="ta")
+    pd.testing.assert_series_equal(rsi, ta_rsi(close, 9), check_names=False)
+    check_frozen(rsi, "rsi_ta_9")
+
+
+def test_atr_matches_calculate_atr(ohlc):
+    high, low, close = ohlc
+    out = atr(high, low, close, 10)
+    np.testing.assert_allclose(out, calculate_atr(high, low, close, 10), rtol=1e-12, equal_nan=True)
+    check_frozen(out, "atr_10")
+
+
+def test_supertrend_matches_supertrend_tv(ohlc):
+    high, low, close = ohlc
+    st = supertrend(high, low, close, 10, 3.0)
+    np.testing.assert_allclose(st, supertrend_tv(high, low, close, 10, 3.0), rtol=1e-12, equal_nan=True)
+    check_frozen(st, "st_10_3")
+
+
+def test_panel_columns_match_series(ohlc):
+    # Pannello 2-D: ogni colonna come la serie singola
+    high, low, close = ohlc
+    panel = [np.column_stack([a, a * 2]) for a in (high, low, close)]
+    st = supertrend(*panel, 10, 3.0)
+    np.testing.assert_allclose(st[:, 0], supertrend_tv(high, low, close, 10, 3.0), rtol=1e-12)
+    np.testing.assert_allclose(st[:, 1], supertrend_tv(high * 2, low * 2, close * 2, 10, 3.0), rtol=1e-12)
+
+
+def test_supertrend_grid_matches_single_multiplier(ohlc):
+    high, low, close = ohlc
+    st, _ = supertrend_grid(high, low, close, 10, [2.0, 3.0])
+    for j, mult in enumerate([2.0, 3.0]):
+        np.testing.assert_allclose(st[:, j], supertrend_tv(high, low, close, 10, mult), rtol=1e-12)
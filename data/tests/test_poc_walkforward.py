@@ -0,0 +1,77 @@
+# =========================
+# TEST POC WALK-FORWARD
+# =========================
+# rolling_poc deve dare lo stesso POC di volume_profile.poc_price sulla
+# finestra di ogni data (aggiornamento incrementale senza look-ahead) e il
+# backtest deve contare date e orizzonti sulle sedute di ogni ticker anche
+# con calendari diversi nello stesso pannello (azioni 5 giorni, crypto 7).
+#
+#   python -m pytest -q data/tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("yfinance")   # poc_walkforward → bar_store → scan_state
+from poc_walkforward import backtest, rolling_poc  # noqa: E402
+from volume_profile import poc_price  # noqa: E402
+
+
+def bars(index, seed=0, flat_volume=False):
+    rng = np.random.default_rng(seed)
+    n = len(index)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0002, 0.02, n)))
+    volume = np.full(n, 1e6) if flat_volume else rng.integers(100_000, 1_000_000, n).astype(float)
+    volume[40:45] = 0
+    return pd.DataFrame({
+        "High": close * (1 + rng.uniform(0, 0.02, n)),
+        "Low": close * (1 - rng.uniform(0, 0.02, n)),
+        "Close": close,
+        "Volume": volume,
+    }, index=index)
+
+
+@pytest.mark.parametrize("log_scale", [False, True])
+@pytest.mark.parametrize("flat_volume", [False, True])
+def test_rolling_poc_matches_poc_price_on_each_window(log_scale, flat_volume):
+    df = bars(pd.bdate_range("2015-01-01", periods=1300), seed=3, flat_volume=flat_volume)
+    out = rolling_poc(df, poc_period=2, log_scale=log_scale)
+
+    offset = pd.DateOffset(years=2)
+    for date in df.index:
+        window = df[(df.index >= date - offset) & (df.index <= date)]
+        if date - offset < df.index[0]:
+            assert np.isnan(out[date])
+            continue
+        expected = poc_price(window["High"].to_numpy(), window["Low"].to_numpy(),
+                             window["Volume"].to_numpy(), 200, log_scale)
+        assert out[date] == expected
+
+
+def test_backtest_counts_each_ticker_on_its_own_sessions():
+    days = pd.date_range("2024-01-01", periods=140, freq="D")
+    sessions = days[days.dayofweek < 5]
+    equity = bars(sessions, seed=1)["Close"]
+    crypto = bars(days, seed=2)["Close"]
+    close = pd.DataFrame({"EQ": equity, "BTC": crypto})
+    poc = close.copy()   # distanza 0: ogni data di selezione è un segnale
+
+    step, horizon = 5, 5
+    summary, _ = backtest(close, poc, soglia=3, horizons=[horizon], step=step)
+
+    # Per ticker: una data ogni 5 sedute sue, con rendimento a 5 sedute sue
+    own =[np.arange(0, len(s), step) for s in (equity, crypto)]
+    expected = sum(int((rows + horizon < len(s)).sum()) for rows, s in zip(own, (equity, crypto)))
+    assert summary.loc[0, "Segnali"] == expected
+    assert summary.loc[0, "Orizzonte (sedute)"] == horizon
+
+    # Rendimento dei selezionati = media dei rendimenti a 5 sedute di ogni ticker
+    fwd = np.concatenate([
+        ((s.shift(-horizon) / s - 1) * 100).iloc[::step].dropna().to_numpy() for s in (equity, crypto)
+    ])
+    assert summary.loc[0, "Rend. medio selezionati %"] == pytest.approx(fwd.mean())
@@ -0,0 +1,57 @@
+# =========================
+# TEST QUERY SCANNER SERVICE
+# =========================
+# /screen passa da screener.Screen: expr= e i filtri campo__op=valore
+# seguono le stesse regole sui valori mancanti dello screener settimanale.
+#
+#   python -m pytest -q data/tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("yfinance")   # scanner_service → bar_store → scan_state
+from scanner_service import screen  # noqa: E402
+from screener import ScreenError  # noqa: E402
+
+
+@pytest.fixture
+def table():
+    # BBB senza SuperTrend daily, CCC senza POC né key reversal
+    return pd.DataFrame({
+        "ticker": ["AAA", "BBB", "CCC"],
+        "index": ["SP500", "NASDAQ", "SP500"],
+        "poc_dist_2y": [-1.5, 2.5, np.nan],
+        "st_d_delta": [3.0, np.nan, -2.0],
+        "kr_signal": ["Rialzista", "Ribassista", None],
+    }).set_index("ticker", drop=False)
+
+
+def tickers(table, params):
+    return screen(table, params)["ticker"].tolist()
+
+
+def test_ops_skip_missing_values(table):
+    assert tickers(table, {"st_d_delta__ne": "3"}) == ["CCC"]
+    assert tickers(table, {"kr_signal__ne": "Rialzista"}) == ["BBB"]
+    assert tickers(table, {"poc_dist_2y__abs_le": "3", "index__in": "SP500,NASDAQ"}) == ["AAA", "BBB"]
+
+
+def test_expr_and_ops_are_combined(table):
+    assert tickers(table, {"expr": "not (st_d_delta > 0)"}) == ["CCC"]
+    assert tickers(table, {"expr": "st_d_delta > 0 or poc_dist_2y > 0", "index": "NASDAQ"}) == ["BBB"]
+    assert tickers(table, {"kr_signal__contains": "rial", "sort": "st_d_delta"}) == ["AAA"]
+
+
+def test_bad_query_is_a_value_error(table):
+    with pytest.raises(ScreenError):
+        screen(table, {"expr": "foo > 0"})
+    with pytest.raises(ScreenError):
+        screen(table, {"expr": "st_d_delta >"})
+    with pytest.raises(ValueError):
+        screen(table, {"st_d_delta__between": "1"})
@@ -0,0 +1,69 @@
+# =========================
+# TEST SCREENER DICHIARATIVO
+# =========================
+# Un valore mancante non deve mai far passare un ticker: né con not, né
+# con !=, né attraverso min/max. and/or seguono la logica a tre valori.
+#
+#   python -m pytest -q data/tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screener import FIELDS, Screen, ScreenError  # noqa: E402
+
+
+@pytest.fixture
+def table():
+    # AAA ha tutti i dati, BBB niente SuperTrend daily, CCC niente POC né segnali
+    df = pd.DataFrame({field: np.nan for field in FIELDS}, index=range(3))
+    df["ticker"] = ["AAA", "BBB", "CCC"]
+    df["st_d"] = [-1.5, np.nan, 2.0]
+    df["poc_dist"] = [-4.0, -4.0, np.nan]
+    df["kr_type"] = ["UP", "DOWN", np.nan]
+    df["kr_date"] = pd.to_datetime(["2026-10-10", "2026-10-01", None])
+    return df
+
+
+def passed(table, expression):
+    return table.loc[Screen("test", expression).mask(table, pd.Timestamp("2026-10-19")), "ticker"].tolist()
+
+
+def test_not_on_missing_does_not_pass(table):
+    assert passed(table, "not (st_d > 0)") == ["AAA"]
+
+
+def test_not_equal_on_missing_does_not_pass(table):
+    assert passed(table, "st_d != 2") == ["AAA"]
+    assert passed(table, "kr_type != 'UP'") == ["BBB"]
+    assert passed(table, "kr_type not in ['UP']") == ["BBB"]
+
+
+def test_min_max_propagate_missing(table):
+    assert passed(table, "min(st_d, poc_dist) < 0") == ["AAA"]
+    assert passed(table, "max(st_d, poc_dist) > -5") == ["AAA"]
+
+
+def test_not_between_on_missing_does_not_pass(table):
+    assert passed(table, "not between(poc_dist, -3, 3)") == ["AAA", "BBB"]
+
+
+def test_three_valued_and_or(table):
+    # NA or True = True, NA and False = False (poi not → True)
+    assert passed(table, "st_d > 0 or poc_dist < 0") == ["AAA", "BBB", "CCC"]
+    assert passed(table, "not (st_d > 0 and poc_dist > 0)") == ["AAA", "BBB"]
+
+
+def test_isna_selects_missing(table):
+    assert passed(table, "isna(st_d) or days(kr_date) <= 10") == ["AAA", "BBB"]
+    assert passed(table, "not isna(poc_dist)") == ["AAA", "BBB"]
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(ScreenError):
+        Screen("test", "foo > 0")
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# =========================
+# SENSITIVITY DCF / EVA (GRIGLIA VETTORIALE)
+# =========================
+# Stesse formule di dcf_from_fcf ed eva_from_financial_data in
+# "Fair value.ipynb", ma su una griglia WACC × crescita terminale × base FCF
+# (ultimo anno o media degli ultimi FCF_AVG_YEARS) e su più ticker insieme:
+# gli sconti sono potenze (1 + wacc)^-t calcolate in broadcast, senza cicli
+# sugli anni. Le celle con WACC <= crescita terminale restano NaN (valore
+# terminale non definito).
+#
+# Forme degli array: T ticker, B basi FCF, W valori di WACC, G crescite, Y anni.
+
+YEARS = 10              # anni di proiezione (come YEARS nel notebook)
+FCF_GROWTH = 0.05       # crescita del FCF storico quando non c'è una proiezione
+FCF_AVG_YEARS = 3
+STEPS = 2               # passi per lato attorno al valore centrale
+WACC_STEP = 0.005
+GROWTH_STEP = 0.005
+
+
+def axis(center, steps=STEPS, step=WACC_STEP):
+    """
+    Valori center ± steps·step. center può essere un array per ticker:
+    il risultato ha allora una riga per ticker (T, 2·steps + 1).
+    """
+    values = np.asarray(center, dtype=float)[..., None] + np.arange(-steps, steps + 1) * step
+    return values.round(6)   # etichette pulite per le heatmap
+
+
+def fcf_bases(fcf_history, avg_years=FCF_AVG_YEARS):
+    """
+    fcf_history: matrice T × anni con il più recente in colonna 0 (NaN
+    dove manca). Restituisce (T, 2): ultimo FCF e media dei primi
+    avg_years valori disponibili, come USE_FCF_AVG nel notebook.
+    """
+    hist = np.atleast_2d(np.asarray(fcf_history, dtype=float))
+    latest = hist[:, 0]
+    with np.errstate(invalid="ignore"):
+        window = hist[:, :avg_years]
+        count = np.isfinite(window).sum(axis=1)
+        average = np.where(count > 0, np.nansum(window, axis=1) / np.maximum(count, 1), np.nan)
+    return np.stack([latest, average], axis=1)
+
+
+def grow_paths(bases, years=YEARS, growth=FCF_GROWTH):
+    # Flussi base·(1 + growth)^t per t = 1..years → (..., years)
+    t = np.arange(1, years + 1)
+    return np.asarray(bases, dtype=float)[..., None] * (1 + growth) ** t
+
+
+def dcf_grid(paths, waccs, growths):
+    """
+    Valore d'impresa DCF per ogni combinazione.
+    paths: (T, B, Y) flussi proiettati; waccs: (T, W); growths: (G,).
+    Restituisce (T, B, W, G).
+    """
+    paths = np.asarray(paths, dtype=float)
+    waccs = np.atleast_2d(np.asarray(waccs, dtype=float))
+    growths = np.asarray(growths, dtype=float)
+    years = paths.shape[-1]
+
+    t = np.arange(1, years + 1)
+    discount = (1 + waccs[..., None]) ** -t                      # (T, W, Y)
+    pv = np.einsum("tby,twy->tbw", paths, discount)              # (T, B, W)
+
+    w = waccs[:, None, :, None]                                  # (T, 1, W, 1)
+    last = paths[..., -1][:, :, None, None]                      # (T, B, 1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terminal = last * (1 + growths) / (w - growths) / (1 + w) ** years
+    terminal = np.where(w > growths, terminal, np.nan)
+    return pv[..., None] + terminal
+
+
+def eva_grid(income_paths, equity, waccs, add_equity=True):
+    """
+    Valore EVA: somma scontata di (utile_t - equity·wacc), più l'equity
+    contabile se add_equity (modalità proiettata del notebook; la modalità
+    storica a periodo singolo non la somma).
+    income_paths: (T, Y); equity: (T,); waccs: (T, W). Restituisce (T, W).
+    """
+    income = np.atleast_2d(np.asarray(income_paths, dtype=float))
+    equity = np.atleast_1d(np.asarray(equity, dtype=float))
+    waccs = np.atleast_2d(np.asarray(waccs, dtype=float))
+    years = income.shape[-1]
+
+    t = np.arange(1, years + 1)
+    discount = (1 + waccs[..., None]) ** -t                      # (T, W, Y)
+    eva = income[:, None, :] - equity[:, None, None] * waccs[..., None]
+    pv = (eva * discount).sum(axis=-1)
+    return pv + equity[:, None] if add_equity else pv
+
+
+def dcf_sensitivity(tickers, fcf_history, wacc, shares, net_debt, terminal_growth,
+                    projected_fcf=None, years=YEARS, steps=STEPS,
+                    wacc_step=WACC_STEP, growth_step=GROWTH_STEP,
+                    avg_years=FCF_AVG_YEARS, growth=FCF_GROWTH):
+    """
+    Fair value per azione DCF su tutta la griglia, per tutti i ticker in
+    un solo calcolo. fcf_history T × anni (più recente prima); wacc,
+    shares, net_debt per ticker. projected_fcf (T × Y, opzionale) aggiunge
+    la base "projected" con i flussi della regressione.
+    Restituisce una tabella lunga Ticker, FCF base, WACC, Terminal growth,
+    Fair value (una riga per cella, pronta per heatmap()).
+    """
+    tickers = list(tickers)
+    paths = grow_paths(fcf_bases(fcf_history, avg_years), years, growth)   # (T, 2, Y)
+    bases = ["latest", f"avg{avg_years}"]
+    if projected_fcf is not None:
+        projected = np.atleast_2d(np.asarray(projected_fcf, dtype=float))[:, :years]
+        paths = np.concatenate([projected[:, None, :], paths], axis=1)
+        bases = ["projected"] + bases
+
+    waccs = np.atleast_2d(axis(wacc, steps, wacc_step))
+    growths = axis(terminal_growth, steps, growth_step)
+    enterprise = dcf_grid(paths, waccs, growths)                            # (T, B, W, G)
+
+    net_debt = np.asarray(net_debt, dtype=float).reshape(-1, 1, 1, 1)
+    shares = np.asarray(shares, dtype=float).reshape(-1, 1, 1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_share = np.where(shares > 0, (enterprise - net_debt) / shares, np.nan)
+
+    T, B, W, G = per_share.shape
+    return pd.DataFrame({
+        "Ticker": np.repeat(tickers, B * W * G),
+        "FCF base": np.tile(np.repeat(bases, W * G), T),
+        "WACC": np.broadcast_to(waccs[:, None, :, None], per_share.shape).ravel(),
+        "Terminal growth": np.broadcast_to(growths, per_share.shape).ravel(),
+        "Fair value": per_share.ravel(),
+    })
+
+
+def eva_sensitivity(tickers, income_paths, equity, wacc, shares, add_equity=True,
+                    steps=STEPS, wacc_step=WACC_STEP):
+    """
+    Fair value per azione EVA al variare del WACC (la crescita terminale
+    non entra nel modello EVA del notebook). Tabella Ticker, WACC, Fair value.
+    """
+    waccs = np.atleast_2d(axis(wacc, steps, wacc_step))
+    value = eva_grid(income_paths, equity, waccs, add_equity)
+    shares = np.asarray(shares, dtype=float).reshape(-1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_share = np.where(shares > 0, value / shares, np.nan)
+    return pd.DataFrame({
+        "Ticker": np.repeat(list(tickers), waccs.shape[1]),
+        "WACC": waccs.ravel(),
+        "Fair value": per_share.ravel(),
+    })
+
+
+def heatmap(table, ticker, base=None):
+    # Tabella WACC (righe) × crescita terminale (colonne) di un ticker
+    rows = table[table["Ticker"] == ticker]
+    if base is not None:
+        rows = rows[rows["FCF base"] == base]
+    if "Terminal growth" not in rows.columns:
+        return rows.set_index("WACC")[["Fair value"]]
+    return rows.pivot(index="WACC", columns="Terminal growth", values="Fair value")
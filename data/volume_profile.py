@@ -0,0 +1,176 @@
+import numpy as np
+
+# =========================
+# VOLUME PROFILE / POC
+# =========================
+# Stesse regole del ciclo storico di poc_all_tickers.py: il volume di ogni
+# barra con High > Low viene ripartito in parti uguali sui bin coperti dal
+# range Low-High; il POC è il centro del bin con più volume. Il profilo si
+# costruisce con un array di differenze, senza iterare sulle righe.
+#
+# Con log_scale=True gli estremi dei bin sono in progressione geometrica:
+# su 20 anni il prezzo può moltiplicarsi per 10 e con bin lineari la parte
+# bassa del range finirebbe in pochi bin.
+
+VALUE_AREA = 0.70     # quota di volume della value area
+NODE_SMOOTH = 5       # bin della media mobile usata per trovare HVN/LVN
+
+
+def price_grid(price_min, price_max, bins=200, log_scale=False):
+    # Estremi dei bin sul range [price_min, price_max]
+    if log_scale and price_min > 0:
+        return np.geomspace(price_min, price_max, bins)
+    return np.linspace(price_min, price_max, bins)
+
+
+def bar_bins(price_bins, high, low, volume):
+    """
+    Contributo di ogni barra utile al profilo: (rows, lo, end, share), la
+    barra rows[i] mette il volume share[i] su ognuno dei bin [lo[i], end[i]).
+    Le barre con High <= Low o senza volume non contano.
+    """
+    with np.errstate(invalid="ignore"):
+        ok = (high > low) & (volume > 0)
+    rows = np.flatnonzero(ok)
+    high, low, volume = high[ok], low[ok], volume[ok]
+
+    lo = np.searchsorted(price_bins, low, side="right") - 1
+    hi = np.searchsorted(price_bins, high, side="left")
+    lo = np.clip(lo, 0, len(price_bins) - 2)
+    hi = np.clip(hi, 0, len(price_bins) - 1)
+
+    # Range su più bin: volume diviso sui bin [lo, hi); stesso bin: tutto su lo
+    span = hi > lo
+    single = hi == lo
+    share = np.where(span, volume / np.where(span, hi - lo, 1), volume)
+    end = np.where(span, hi, lo + 1)
+    used = span | single
+    return rows[used], lo[used], end[used], share[used]
+
+
+def volume_profile(high, low, volume, bins=200, log_scale=False):
+    """
+    Restituisce (price_bins, profile) oppure None se il range è piatto.
+    price_bins ha `bins` estremi, profile ha `bins - 1` valori.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+
+    price_min = np.nanmin(low)
+    price_max = np.nanmax(high)
+    if price_min == price_max:
+        return None
+
+    price_bins = price_grid(price_min, price_max, bins, log_scale)
+    n_bins = len(price_bins) - 1
+    _, lo, end, share = bar_bins(price_bins, high, low, volume)
+
+    diff = np.zeros(n_bins + 1)
+    np.add.at(diff, lo, share)
+    np.add.at(diff, end, -share)
+    profile = np.cumsum(diff[:-1])
+
+    # Bin vuoti a zero esatto (la cumsum lascia residui di arrotondamento)
+    covered = np.zeros(n_bins + 1, dtype=int)
+    np.add.at(covered, lo, 1)
+    np.add.at(covered, end, -1)
+    profile[np.cumsum(covered[:-1]) == 0] = 0.0
+
+    return price_bins, profile
+
+
+def _poc_index(price_bins, profile):
+    return min(int(np.argmax(profile)), len(price_bins) - 2)
+
+
+def poc_price(high, low, volume, bins=200, log_scale=False):
+    """
+    Prezzo del Point of Control, o None se il profilo è vuoto.
+    """
+    result = volume_profile(high, low, volume, bins, log_scale)
+    if result is None:
+        return None
+
+    price_bins, profile = result
+    if profile.sum() == 0:
+        return None
+
+    poc_index = _poc_index(price_bins, profile)
+    return (price_bins[poc_index] + price_bins[poc_index + 1]) / 2
+
+
+def value_area(profile, poc_index, share=VALUE_AREA):
+    """
+    Indici (primo, ultimo) dei bin della value area: partendo dal POC si
+    aggiunge ogni volta il bin adiacente con più volume finché non si
+    raggiunge `share` del volume totale.
+    """
+    target = profile.sum() * share
+    lo = hi = poc_index
+    total = profile[poc_index]
+    while total < target:
+        below = profile[lo - 1] if lo > 0 else -1.0
+        above = profile[hi + 1] if hi < len(profile) - 1 else -1.0
+        if above >= below:
+            hi += 1
+            total += above
+        else:
+            lo -= 1
+            total += below
+    return lo, hi
+
+
+def volume_nodes(profile, smooth=NODE_SMOOTH):
+    """
+    (HVN, LVN) come indici di bin: massimi locali del profilo smussato sopra
+    la media dei bin con volume e minimi locali sotto metà di quella media.
+    """
+    kernel = np.ones(smooth) / smooth
+    s = np.convolve(profile, kernel, mode="same")
+    mean = s[s > 0].mean() if (s > 0).any() else 0.0
+
+    inner = s[1:-1]
+    peak = (inner > s[:-2]) & (inner >= s[2:]) & (inner > mean)
+    trough = (inner < s[:-2]) & (inner <= s[2:]) & (inner < mean / 2)
+    hvn = np.flatnonzero(peak) + 1
+    lvn = np.flatnonzero(trough) + 1
+    # HVN dal più forte, LVN dal più debole
+    return hvn[np.argsort(-s[hvn], kind="stable")], lvn[np.argsort(s[lvn], kind="stable")]
+
+
+def profile_stats(high, low, volume, bins=200, log_scale=False, share=VALUE_AREA):
+    """
+    Livelli del volume profile da un solo binning: POC, VAH/VAL della value
+    area e prezzi degli HVN/LVN (array ordinati per forza del nodo, POC
+    escluso dagli HVN).
+    None se il profilo è vuoto.
+    """
+    result = volume_profile(high, low, volume, bins, log_scale)
+    if result is None:
+        return None
+
+    price_bins, profile = result
+    if profile.sum() == 0:
+        return None
+
+    centers = (price_bins[:-1] + price_bins[1:]) / 2
+    poc_index = _poc_index(price_bins, profile)
+    va_lo, va_hi = value_area(profile, poc_index, share)
+    hvn, lvn = volume_nodes(profile)
+
+    return {
+        "poc": centers[poc_index],
+        "vah": price_bins[va_hi + 1],
+        "val": price_bins[va_lo],
+        # Il picco del POC compare anche tra gli HVN (±mezza finestra di smussatura)
+        "hvn": centers[hvn[np.abs(hvn - poc_index) > NODE_SMOOTH // 2]],
+        "lvn": centers[lvn],
+    }
+
+
+def nearest_node(nodes, price):
+    # Nodo più vicino al prezzo, o NaN se non ce ne sono
+    if len(nodes) == 0:
+        return np.nan
+    return float(nodes[np.argmin(np.abs(nodes - price))])
@@ -1,7 +1,8 @@
 import os
 import sys
+import argparse
 import subprocess
-from datetime import datetime
+from datetime import date
 
 # =========================
 # CONFIGURAZIONE BASE
@@ -16,6 +17,7 @@ BASE_DIR = os.path.join(ROOT_DIR, "data")
 # Script POC e merge Supertrend
 POC_SCRIPT = os.path.join(BASE_DIR, "poc_all_tickers.py")
 ST_SCRIPT = os.path.join(BASE_DIR, "merge_poc_supertrend.py")
+SWEEP_SCRIPT = os.path.join(BASE_DIR, "poc_sweep.py")
 
 # Output
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
@@ -26,6 +28,45 @@ if BASE_DIR not in sys.path:
     sys.path.append(BASE_DIR)
 
 from my_tickers import get_all_tickers  # noqa: E402
+from run_metrics import RunMetrics, report_path  # noqa: E402
+from profiling import add_profile_args, profile_cli_args, start_from_args  # noqa: E402
+from scan_state import Checkpoint, add_scan_args, configure, scan_cli_args  # noqa: E402
+from snapshot import run_tag, run_week  # noqa: E402
+from sharding import Shard  # noqa: E402
+
+# =========================
+# ARGOMENTI CLI
+# =========================
+parser = argparse.ArgumentParser(description="Master POC + SuperTrend")
+parser.add_argument("--debug_ticker", type=str, default=None, help="Ticker da usare per debug nello script POC")
+parser.add_argument("--poc_log_bins", action="store_true",
+                    help="Volume profile con bin in scala logaritmica negli script POC")
+parser.add_argument("--pipeline", action="store_true",
+                    help="POC e SuperTrend nello stesso processo: il SuperTrend parte appena un ticker passa il filtro")
+parser.add_argument("--sweep", action="store_true",
+                    help="Invece dei CONFIGS esegue lo sweep POC periodo × soglia (poc_sweep.py)")
+parser.add_argument("--sweep_periods", type=str, default="1,2,3,5,10,20", help="Periodi POC dello sweep (anni)")
+parser.add_argument("--sweep_soglie", type=str, default="3,5,10,15,20", help="Soglie POC dello sweep (%%)")
+add_profile_args(parser)
+add_scan_args(parser)
+args = parser.parse_args()
+if args.pipeline and (args.shard or args.merge_shards):
+    parser.error("--pipeline non si usa con --shard/--merge_shards")
+# Data del run decisa una volta sola e inoltrata a tutti gli stadi (anche
+# come data del bundle con --snapshot record)
+args.run_date = args.run_date or args.as_of or date.today().isoformat()
+configure(args)  # snapshot/replay: la settimana dei file segue --as_of
+
+# Opzioni inoltrate ai sottoprocessi
+extra_poc_args = ["--debug_ticker", args.debug_ticker] if args.debug_ticker else []
+if args.poc_log_bins:
+    extra_poc_args.append("--log_bins")
+if args.pipeline:
+    extra_poc_args.append("--pipeline")
+extra_poc_args += profile_cli_args(args) + scan_cli_args(args)
+# --shard / --merge_shards valgono solo per lo stadio POC: il SuperTrend
+# gira una volta sola sul file POC già unito
+extra_st_args = profile_cli_args(args) + scan_cli_args(args, shard=False)
 
 print("✅ Avvio master.py")
 print(f"📂 ROOT_DIR: {ROOT_DIR}")
@@ -41,15 +82,49 @@ CONFIGS = [
     {"poc_period": 2,  "soglia_poc": 3},
 ]
 
-# Numero settimana ISO
-week_number = datetime.now().isocalendar()[1]
+# Numero settimana ISO (della data --as_of in replay)
+week_number = run_week()
 
 print(f"📅 Settimana ISO: {week_number}")
 
+metrics = RunMetrics("master", configs=CONFIGS)
+start_from_args(args, "master", week_number)
+
+# --shard i/N: solo la propria parte dello stadio POC, niente SuperTrend;
+# --merge_shards N: unisce le parti POC e prosegue come un run normale
+shard = Shard.from_args(args, "master", week_number, metrics)
+if shard.partial:
+    print(f"🧩 Shard {shard.index}/{shard.count}: solo stadio POC, il merge con --merge_shards {shard.count}")
+
+# =========================
+# MODALITÀ SWEEP (un solo run per tutte le combinazioni)
+# =========================
+if args.sweep:
+    print(f"🚀 Sweep POC: periodi {args.sweep_periods} × soglie {args.sweep_soglie}")
+    with metrics.stage("poc_sweep"):
+        ret_sweep = subprocess.run(
+            ["python", SWEEP_SCRIPT, "--periods", args.sweep_periods, "--soglie", args.sweep_soglie]
+            + profile_cli_args(args) + scan_cli_args(args),
+            cwd=ROOT_DIR
+        )
+    metrics.attach_child("poc_sweep", report_path(shard.scoped("poc_sweep"), week_number))
+
+    if ret_sweep.returncode != 0:
+        print("❌ Errore nello script di sweep POC")
+        metrics.fail("sweep_script_error")
+
+    metrics.write(week_number)
+    print("\n🎯 Sweep completato." if ret_sweep.returncode == 0 else "\n❌ Sweep fallito.")
+    sys.exit(ret_sweep.returncode)
+
 # =========================
 # ESECUZIONE MASTER
 # =========================
 
+# Config completate nella giornata del run: un run interrotto riparte da
+# quelle mancanti, il run del giorno dopo le rifà tutte
+completed = Checkpoint(shard.scoped(f"master_{run_tag()}"), resume=not args.no_resume)
+
 for cfg in CONFIGS:
     poc_period = cfg["poc_period"]
     soglia_poc = cfg["soglia_poc"]
@@ -73,22 +148,37 @@ for cfg in CONFIGS:
         f"POC_ST_p{poc_period_file}_s{soglia_poc}_week_{week_number}.xlsx"
     )
 
+    # Ripresa: config già completata in un run interrotto della stessa giornata
+    config_key = f"p{poc_period_file}_s{soglia_poc}"
+    if config_key in completed and os.path.exists(st_file):
+        print(f"♻️ File finale già presente, salto: {os.path.basename(st_file)}")
+        continue
+
     # =========================
     # 1️⃣ ESECUZIONE POC
     # =========================
     print("▶️ Avvio script POC...")
 
-    ret_poc = subprocess.run(
-        ["python", POC_SCRIPT, "--poc_period", poc_period_cli, "--soglia_poc", str(soglia_poc)],
-        cwd=ROOT_DIR
-    )
+    poc_label = f"poc_p{poc_period_file}_s{soglia_poc}"
+    with metrics.stage(poc_label):
+        ret_poc = subprocess.run(
+            ["python", POC_SCRIPT, "--poc_period", poc_period_cli, "--soglia_poc", str(soglia_poc)] + extra_poc_args,
+            cwd=ROOT_DIR
+        )
+    metrics.attach_child(poc_label, report_path(shard.scoped(poc_label), week_number))
 
     if ret_poc.returncode != 0:
         print(f"❌ Errore nello script POC (period={poc_period_cli}, soglia={soglia_poc})")
+        metrics.fail("poc_script_error")
+        continue
+
+    if shard.partial:
+        # Parte salvata in output/shards: file POC e SuperTrend al merge
         continue
 
     if not os.path.exists(poc_file):
         print(f"⚠️ File POC non trovato: {poc_file}")
+        metrics.fail("poc_file_missing")
         continue
 
     print(f"✅ POC calcolato: {os.path.basename(poc_file)}")
@@ -96,22 +186,30 @@ for cfg in CONFIGS:
     # =========================
     # 2️⃣ MERGE + SUPERTREND
     # =========================
-    print("▶️ Avvio merge POC + SuperTrend...")
-
-    ret_st = subprocess.run(
-        ["python", ST_SCRIPT, "--poc_period", poc_period_file, "--soglia_poc", str(soglia_poc)],
-        cwd=ROOT_DIR
-    )
-
-    if ret_st.returncode != 0:
-        print(f"❌ Errore nello script SuperTrend (period={poc_period_file}, soglia={soglia_poc})")
-        continue
+    # In --pipeline il file finale l'ha già scritto lo script POC
+    if not args.pipeline:
+        print("▶️ Avvio merge POC + SuperTrend...")
+
+        st_label = f"poc_st_p{poc_period_file}_s{soglia_poc}"
+        with metrics.stage(st_label):
+            ret_st = subprocess.run(
+                ["python", ST_SCRIPT, "--poc_period", poc_period_file, "--soglia_poc", str(soglia_poc)] + extra_st_args,
+                cwd=ROOT_DIR
+            )
+        metrics.attach_child(st_label, report_path(st_label, week_number))
+
+        if ret_st.returncode != 0:
+            print(f"❌ Errore nello script SuperTrend (period={poc_period_file}, soglia={soglia_poc})")
+            metrics.fail("st_script_error")
+            continue
 
     if not os.path.exists(st_file):
         print(f"⚠️ File finale non trovato: {st_file}")
+        metrics.fail("st_file_missing")
         continue
 
     print(f"✅ File finale creato: {os.path.basename(st_file)}")
+    completed.save(config_key)
 
     # =========================
     # 🧹 CANCELLA FILE POC INTERMEDIO
@@ -123,4 +221,9 @@ for cfg in CONFIGS:
     except Exception as e:
         print(f"⚠️ Impossibile cancellare {poc_file}: {e}")
 
+# Con config fallite il checkpoint resta: il rilancio rifà solo quelle
+if shard.partial or len(completed.done) == len(CONFIGS):
+    completed.clear()
+metrics.write(week_number)
+
 print("\n🎯 Master completato con successo.")